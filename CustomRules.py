@@ -1,8 +1,12 @@
 """
 Кастомные правила для работы бота.
 """
+from typing import Union
+
 from vkbottle.bot import Message
 from vkbottle.dispatch.rules import ABCRule
+
+import cheaters
 from vkbot import VKBot
 
 
@@ -16,11 +20,35 @@ class AdminUserRule(ABCRule[Message]):
 
     async def check(self, event: Message) -> bool:
         """
-        Метод сравнивает текущего пользователя с админами группы.
+        Метод сравнивает текущего пользователя с админами группы (кеш бота, см. VKBot.get_group_admins).
         Если совпадет - возвращает True.
 
         :param event: Сообщение от пользователя.
         :return: bool
         """
-        result = event.from_id in self.bot.group_admins
+        result = await self.bot.is_admin(event.from_id)
         return result
+
+
+class CheaterSearchRule(ABCRule[Message]):
+    """
+    Класс описывает правило "сообщение похоже на ссылку vk, карту или телефон".
+    Найденное совпадение передается в хендлер аргументом cheater_match, чтобы не разбирать текст второй раз.
+    """
+    def __init__(self, *regexp_args: str):
+        """
+        :param regexp_args: Ключевые слова или группы регулярок (см. cheaters.get_regexp). По умолчанию - search.
+        """
+        self.regexp_args = regexp_args or ('search',)
+
+    async def check(self, event: Message) -> Union[bool, dict]:
+        """
+        Метод проверяет начало нормализованного текста сообщения регуляркой.
+
+        :param event: Сообщение от пользователя.
+        :return: {'cheater_match': cheaters.CheaterMatch} или False.
+        """
+        match = cheaters.match_regexp(cheaters.normalize_search_text(event.text), *self.regexp_args)
+        if match:
+            return {'cheater_match': match}
+        return False
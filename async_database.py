@@ -0,0 +1,78 @@
+"""
+Асинхронная обертка над DBCheaters.
+Все запросы к sqlite выполняются в одном отдельном потоке, цикл событий бота их только ждет.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+from typing import Any, Callable
+
+import database
+
+
+def _call_without_db(func: Callable[..., Any], db: database.DBCheaters, *args, **kwargs) -> Any:
+    """
+    Вызов статического метода через AsyncDBCheaters.run: DBCheaters отбрасывается.
+    """
+    return func(*args, **kwargs)
+
+
+class AsyncDBCheaters:
+    """
+    Асинхронный фасад DBCheaters.
+    Методы DBCheaters вызываются так же, но через await: await db.get_cheaters_by_ids([...]).
+    Все вызовы идут по очереди в одном потоке: соединение sqlite3 привязано к потоку, а писатель у БД один.
+    Не-методы (pragmas, index, db_filename) читаются напрямую.
+    """
+
+    def __init__(self, db_filename: str, pragmas: dict = None):
+        """
+        :param db_filename: Файл БД.
+        :param pragmas: Настройки соединения (см. database.DEFAULT_PRAGMAS).
+        """
+        self._closed = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+        # DBCheaters создается в потоке исполнителя, чтобы соединение принадлежало этому потоку.
+        self._db = self._executor.submit(database.DBCheaters, db_filename, pragmas).result()
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Метод выполняет func(db, *args, **kwargs) в потоке БД.
+        Нужен, когда несколько вызовов DBCheaters надо сделать подряд без переключений (или работать с генератором).
+
+        :param func: Функция, первым аргументом получает DBCheaters.
+        :return: Результат func.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, self._db, *args, **kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        """
+        Методы DBCheaters возвращаются корутинами, которые выполняются в потоке БД, остальное - как есть.
+        """
+        if name in ('_db', '_executor', '_closed'):
+            # __init__ не дошел до конца - не уходим в рекурсию.
+            raise AttributeError(name)
+        if callable(getattr(database.DBCheaters, name, None)):
+            method = getattr(database.DBCheaters, name)
+            if isinstance(inspect.getattr_static(database.DBCheaters, name), staticmethod):
+                # Статическим методам DBCheaters не нужен, но выполняем их там же, в потоке БД.
+                method = functools.partial(_call_without_db, method)
+
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                return await self.run(method, *args, **kwargs)
+            return wrapper
+        return getattr(self._db, name)
+
+    def close(self):
+        """
+        Метод закрывает соединение с БД в ее потоке и останавливает поток.
+        Запросы, которые уже в очереди, успевают выполниться. Повторный вызов ничего не делает.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.submit(self._db.close).result()
+        self._executor.shutdown()
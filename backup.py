@@ -0,0 +1,187 @@
+"""
+Резервные копии БД.
+Копия снимается через sqlite3 backup API со своего соединения только для чтения: страницы переносятся пачками,
+между пачками БД свободна для записи, а в WAL читатель и писатель друг друга не ждут.
+Копия пишется во временный файл и переименовывается в конце, поэтому недописанных копий под итоговым именем не бывает.
+"""
+import asyncio
+import datetime
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from typing import Callable, Dict, IO, List, NamedTuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько страниц БД копируется за один шаг backup API и сколько секунд пауза между шагами.
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+# Размер куска при сжатии копии.
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+class BackupSettings(NamedTuple):
+    """
+    Настройки резервного копирования (параметр backup в конфиге).
+      interval: float
+        раз во сколько секунд делать копию (0 - не делать по расписанию)
+      keep: int
+        сколько последних копий хранить (0 - хранить все)
+      compression: str
+        сжатие: '' - без сжатия, 'gz' или 'zst' (нужен пакет zstandard)
+      directory: str
+        папка для копий по расписанию ('' - рядом с БД)
+    """
+    interval: float = 0
+    keep: int = 7
+    compression: str = 'gz'
+    directory: str = ''
+
+
+def _open_zstd(filename: str, mode: str) -> IO[bytes]:
+    """
+    Открывает файл со сжатием zstd.
+    """
+    return zstandard.open(filename, mode)
+
+
+# Способы сжатия: {расширение: функция открытия файла на запись}.
+COMPRESSIONS: Dict[str, Callable[[str, str], IO[bytes]]] = {
+    'gz': gzip.open,
+}
+if zstandard is not None:
+    COMPRESSIONS['zst'] = _open_zstd
+
+
+def backup_name(db_filename: str, directory: str = '', compression: str = '') -> str:
+    """
+    Функция возвращает имя копии с текущей датой: cheaters_2022-06-01T12-00.db(.gz).
+
+    :param db_filename: Файл БД.
+    :param directory: Папка для копии ('' - рядом с БД).
+    :param compression: Расширение сжатия из COMPRESSIONS или ''.
+    :return: Имя файла копии.
+    """
+    nowtime = datetime.datetime.now().isoformat(timespec='minutes').replace(':', '-')
+    name = os.path.splitext(db_filename)[0] + '_' + nowtime + '.db'
+    if directory:
+        name = os.path.join(directory, os.path.basename(name))
+    if compression:
+        name += '.' + compression
+    return name
+
+
+def _compress_file(filename: str, target_filename: str, compression: str):
+    """
+    Сжимает файл кусками, не читая его в память целиком.
+    """
+    with open(filename, 'rb') as source, COMPRESSIONS[compression](target_filename, 'wb') as target:
+        shutil.copyfileobj(source, target, COMPRESS_CHUNK_SIZE)
+
+
+def backup_database(db_filename: str, target_filename: str, compression: str = '',
+                    pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP) -> str:
+    """
+    Функция делает согласованную копию БД через sqlite3 backup API.
+    Блокирующая: из цикла событий звать через backup_database_async.
+
+    :param db_filename: Файл БД.
+    :param target_filename: Файл копии.
+    :param compression: Расширение сжатия из COMPRESSIONS или ''.
+    :param pages: Сколько страниц копировать за шаг.
+    :param sleep: Пауза между шагами, секунд.
+    :return: Имя файла копии.
+    """
+    if compression and compression not in COMPRESSIONS:
+        raise ValueError('Unknown backup compression: ' + compression)
+    directory = os.path.dirname(os.path.abspath(target_filename))
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temp_filename = tempfile.mkstemp(suffix='.db', prefix='backup_', dir=directory)
+    os.close(file_descriptor)
+    try:
+        source = sqlite3.connect('file:' + db_filename + '?mode=ro', uri=True)
+        try:
+            target = sqlite3.connect(temp_filename)
+            try:
+                source.backup(target, pages=pages, sleep=sleep)
+                # Копия - один самостоятельный файл, без -wal.
+                target.execute('pragma journal_mode=delete')
+            finally:
+                target.close()
+        finally:
+            source.close()
+        if compression:
+            _compress_file(temp_filename, temp_filename + '.' + compression, compression)
+            os.remove(temp_filename)
+            temp_filename += '.' + compression
+        os.replace(temp_filename, target_filename)
+    except BaseException:
+        for filename in (temp_filename, temp_filename + '.' + compression if compression else ''):
+            if filename and os.path.isfile(filename):
+                os.remove(filename)
+        raise
+    logger.info('Backup ' + db_filename + ' -> ' + target_filename)
+    return target_filename
+
+
+async def backup_database_async(db_filename: str, target_filename: str, compression: str = '',
+                                pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP) -> str:
+    """
+    То же, что backup_database, но в отдельном потоке: цикл событий и поток БД (async_database) не ждут копию.
+    """
+    return await asyncio.to_thread(backup_database, db_filename, target_filename, compression, pages, sleep)
+
+
+def rotate_backups(db_filename: str, directory: str = '', keep: int = 7) -> List[str]:
+    """
+    Функция удаляет старые копии по расписанию, оставляя keep последних.
+    Копии ищутся по шаблону имени из backup_name для точного имени этой БД,
+    копии других БД и с другими именами (например, cheaters_public_bak.db) не трогаются.
+
+    :param db_filename: Файл БД.
+    :param directory: Папка копий ('' - рядом с БД).
+    :param keep: Сколько копий оставить (0 - не удалять).
+    :return: Удаленные файлы.
+    """
+    if not directory:
+        directory = os.path.dirname(db_filename)
+    if keep <= 0 or not os.path.isdir(directory or '.'):
+        return []
+    stem = os.path.splitext(os.path.basename(db_filename))[0]
+    # Только копии этой БД: cheaters_2022-06-01T12-00.db(.gz), но не cheatersdb_2022-06-01T12-00.db.
+    # По дате в имени (YYYY-MM-DDTHH-MM) копии сортируются по времени.
+    pattern = re.compile(re.escape(stem) + r'_\d{4}-\d\d-\d\dT\d\d-\d\d\.db(\.(' + '|'.join(COMPRESSIONS) + '))?')
+    backups = sorted(os.path.join(directory, filename) for filename in os.listdir(directory or '.')
+                     if pattern.fullmatch(filename))
+    removed = backups[:-keep]
+    for filename in removed:
+        os.remove(filename)
+        logger.info('Removed old backup ' + filename)
+    return removed
+
+
+async def backup_periodically(db_filename: str, settings: BackupSettings):
+    """
+    Фоновая задача: делает копию раз в settings.interval и удаляет старые.
+
+    :param db_filename: Файл БД.
+    :param settings: Настройки резервного копирования.
+    """
+    while True:
+        await asyncio.sleep(settings.interval)
+        try:
+            await backup_database_async(db_filename,
+                                        backup_name(db_filename, settings.directory, settings.compression),
+                                        settings.compression)
+            await asyncio.to_thread(rotate_backups, db_filename, settings.directory, settings.keep)
+        except Exception:
+            logger.exception('Не удалось сделать резервную копию БД')
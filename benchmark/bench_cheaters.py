@@ -0,0 +1,105 @@
+"""
+Замер памяти и скорости представлений кидалы.
+Запуск из корня проекта: python -m benchmark.bench_cheaters [количество кидал]
+
+Сравниваются:
+  - DictCheater: кидала как обычный dataclass (с __dict__), как было раньше;
+  - Cheater: dataclass со __slots__;
+  - CheaterRecord: неизменяемый кидала на кортежах (как в memory_index).
+"""
+import dataclasses
+import sys
+import timeit
+import tracemalloc
+from typing import Any, Callable, List
+
+from cheaters import Cheater, CheaterRecord
+
+# Сколько кидал создавать для замера памяти.
+CHEATERS_COUNT = 100_000
+# Сколько раз вызывать __bool__ и get при замере скорости.
+CALLS_COUNT = 200_000
+
+# Кидала как обычный dataclass: те же поля, но без __slots__ и с dataclasses.fields() в каждом вызове.
+DictCheater = dataclasses.make_dataclass(
+    'DictCheater',
+    [(f.name, f.type, f) for f in dataclasses.fields(Cheater)],
+    namespace={
+        '__bool__': lambda self: any(getattr(self, f.name) for f in dataclasses.fields(self)),
+        'get': lambda self, value: next((getattr(self, f.name) for f in dataclasses.fields(self)
+                                         if f.name == value), None),
+    },
+)
+
+
+def _make_cheater(cls: Callable[..., Any], number: int) -> Any:
+    """
+    Кидала с типичным набором данных: id, screen_name, телефон, карта и две ссылки.
+    """
+    sequence = tuple if cls is CheaterRecord else list
+    return cls('id' + str(number), False, 'name' + str(number),
+               sequence(['7999' + str(number).zfill(7)]),
+               sequence(['4276' + str(number).zfill(12)]),
+               sequence(['wall-1_' + str(number), 'wall-2_' + str(number)]))
+
+
+def measure_memory(cls: Callable[..., Any], count: int = CHEATERS_COUNT) -> float:
+    """
+    Сколько байт в среднем занимает один кидала (вместе со строками и списками).
+
+    :param cls: Класс кидалы.
+    :param count: Сколько кидал создать.
+    :return: Байт на кидалу.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cheaters_list: List[Any] = [_make_cheater(cls, number) for number in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cheaters_list
+    return (after - before) / count
+
+
+def measure_calls(cls: Callable[..., Any], calls: int = CALLS_COUNT) -> dict:
+    """
+    Время одного вызова __bool__ и get('card'), наносекунд.
+
+    :param cls: Класс кидалы.
+    :param calls: Сколько раз вызывать.
+    :return: {'bool': нс, 'get': нс}
+    """
+    cheater = _make_cheater(cls, 1)
+    empty = cls()
+    return {
+        'bool': timeit.timeit(lambda: bool(empty), number=calls) / calls * 1e9,
+        'get': timeit.timeit(lambda: cheater.get('card'), number=calls) / calls * 1e9,
+    }
+
+
+def run(count: int = CHEATERS_COUNT, calls: int = CALLS_COUNT) -> dict:
+    """
+    Все замеры по всем классам.
+
+    :param count: Сколько кидал создавать для замера памяти.
+    :param calls: Сколько раз вызывать методы.
+    :return: {класс: {'bytes_per_cheater': ..., 'bool_ns': ..., 'get_ns': ...}}
+    """
+    result = {}
+    for cls in (DictCheater, Cheater, CheaterRecord):
+        speed = measure_calls(cls, calls)
+        result[cls.__name__] = {
+            'bytes_per_cheater': round(measure_memory(cls, count)),
+            'bool_ns': round(speed['bool']),
+            'get_ns': round(speed['get']),
+        }
+    return result
+
+
+if __name__ == '__main__':
+    cheaters_count = int(sys.argv[1]) if len(sys.argv) > 1 else CHEATERS_COUNT
+    print('Кидал:', cheaters_count)
+    for name, row in run(cheaters_count).items():
+        print(name.ljust(14),
+              'памяти:', round(row['bytes_per_cheater'] * cheaters_count / 2 ** 20, 1), 'МиБ,',
+              'bool:', row['bool_ns'], 'нс,',
+              'get:', row['get_ns'], 'нс')
@@ -0,0 +1,244 @@
+"""
+Замер БД кидал на синтетических данных.
+Запуск из корня проекта: python -m benchmark.bench_db [количество кидал]
+(отчет по всем размерам в JSON - python -m benchmark.report).
+
+Замеряются:
+  - bulk_insert: импорт кидал (DBCheaters.import_cheaters) пачками по IMPORT_CHUNK_SIZE;
+  - search_*: поиск кидалы как в боте (VKBot.get_cheater_from_db2) через БД и через индекс в памяти;
+  - full_list: весь список кидал (DBCheaters.get_cheaters_full_list);
+  - export_*: выгрузка в файл в каждом формате из export.EXPORT_FORMATS;
+  - dedup: поиск и удаление дубликатов (DBCheaters.delete_duplicates).
+"""
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+import database
+import export
+import vkbot
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Сколько кидал в БД по умолчанию.
+CHEATERS_COUNT = 100_000
+# По сколько кидал импортировать за раз (одна пачка - один замер bulk_insert).
+IMPORT_CHUNK_SIZE = 10_000
+# Сколько поисков делать по каждому параметру.
+LOOKUPS_COUNT = 2000
+# Сколько раз повторять тяжелые замеры (весь список, выгрузка, дубликаты).
+REPEATS = 3
+# Доля поисков того, чего нет в БД.
+MISS_RATIO = 0.1
+
+
+def synthetic_cheater(number: int) -> dict:
+    """
+    Кидала номер number. Данные вычисляются из номера, поэтому для поиска их не надо хранить:
+    у 70% есть screen_name, у половины - телефон, у 40% - карта, у всех - ссылка на стену,
+    каждый 20-й - группа, каждый 10-й - "полтинник". Каждые 2 из 100 делят один screen_name (для dedup).
+
+    :param number: Номер кидалы, от 0.
+    :return: Кидала в виде словаря, как после cheaters.parse_cheaters_file.
+    """
+    if number % 100 >= 98:
+        screen_name = 'dup' + str(number // 100)
+    elif number % 10 < 7:
+        screen_name = 'user' + str(number)
+    else:
+        screen_name = ''
+    return {
+        'vk_id': ('club' if number % 20 == 0 else 'id') + str(number + 1),
+        'fifty': number % 10 == 3,
+        'screen_name': screen_name,
+        'telephone': ['79' + str(number).zfill(9)] if number % 2 == 0 else [],
+        'card': ['4' + str(number).zfill(15)] if number % 5 < 2 else [],
+        'proof_link': ['wall-' + str(number % 1000 + 1) + '_' + str(number)],
+    }
+
+
+def iter_synthetic_chunks(count: int, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[List[dict]]:
+    """
+    Генератор синтетических кидал пачками: в памяти не больше одной пачки.
+    """
+    for start in range(0, count, chunk_size):
+        yield [synthetic_cheater(number) for number in range(start, min(start + chunk_size, count))]
+
+
+def lookup_values(param: str, count: int, lookups: int, seed: int = 0) -> List[str]:
+    """
+    Значения для поиска по param: MISS_RATIO из них в БД нет.
+
+    :param param: vk_id, screen_name, telephone или card.
+    :param count: Сколько кидал в БД.
+    :param lookups: Сколько значений.
+    :param seed: Зерно random.
+    :return: Значения в том виде, как их передает get_cheater_from_db2.
+    """
+    rng = random.Random(seed)
+    result = []
+    while len(result) < lookups:
+        if rng.random() < MISS_RATIO:
+            number = count + rng.randrange(count)
+        else:
+            number = rng.randrange(count)
+        cheater = synthetic_cheater(number)
+        match param:
+            case 'vk_id':
+                if not cheater['vk_id'].startswith('id'):
+                    continue
+                value = cheater['vk_id'][len('id'):]
+            case 'screen_name':
+                value = cheater['screen_name']
+            case _:
+                value = cheater[param][0] if cheater[param] else ''
+        if value:
+            result.append(value)
+    return result
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Пиковый размер процесса в памяти (RSS) с его начала, МиБ. На Windows - None.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты.
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга.
+
+    :param samples: Отсортированные замеры.
+    :param fraction: Доля, например 0.99.
+    :return: Значение.
+    """
+    return samples[min(len(samples) - 1, max(0, math.ceil(fraction * len(samples)) - 1))]
+
+
+def summarize(latencies: List[float], operations: int = None) -> Dict[str, Any]:
+    """
+    Сводка замеров: операций в секунду, p50/p99 задержки и пиковый RSS.
+
+    :param latencies: Время каждого замера, секунд.
+    :param operations: Сколько операций во всех замерах (по умолчанию - по одной на замер).
+    :return: {ops, ops_per_sec, p50_ms, p99_ms, peak_rss_mb}
+    """
+    operations = len(latencies) if operations is None else operations
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        'ops': operations,
+        'ops_per_sec': round(operations / total, 1) if total else None,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure(func: Callable[[], Any], repeats: int) -> Dict[str, Any]:
+    """
+    Замер синхронной функции repeats раз.
+    """
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def bench_bulk_insert(db: database.DBCheaters, count: int) -> Dict[str, Any]:
+    """
+    Импорт count синтетических кидал в пустую БД.
+    """
+    latencies = []
+    for chunk in iter_synthetic_chunks(count):
+        started = time.perf_counter()
+        db.import_cheaters(chunk)
+        latencies.append(time.perf_counter() - started)
+    # Операция - один кидала, задержка - одна пачка.
+    return {**summarize(latencies, count), 'chunk_size': IMPORT_CHUNK_SIZE}
+
+
+async def bench_search(db_filename: str, count: int, lookups: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Поиск через VKBot.get_cheater_from_db2 по каждому параметру: сначала через БД, потом через индекс в памяти.
+    """
+    bot = vkbot.VKBot('benchmark', db_filename, '')
+    result = {}
+    try:
+        for mode in ('db', 'memory_index'):
+            if mode == 'memory_index':
+                started = time.perf_counter()
+                await bot.db.load_index()
+                result['load_memory_index'] = summarize([time.perf_counter() - started])
+            for param in ('vk_id', 'screen_name', 'telephone', 'card'):
+                latencies = []
+                for value in lookup_values(param, count, lookups):
+                    started = time.perf_counter()
+                    await bot.get_cheater_from_db2(param, value)
+                    latencies.append(time.perf_counter() - started)
+                result['search_' + param + ('' if mode == 'db' else '_index')] = summarize(latencies)
+    finally:
+        bot.db.close()
+    return result
+
+
+def bench_export(db: database.DBCheaters, repeats: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Выгрузка всех кидал в файл в каждом формате.
+    """
+    def export_once(export_format: str):
+        os.remove(export.export_to_file(db.iter_cheaters(), export_format))
+
+    return {'export_' + export_format: measure(lambda: export_once(export_format), repeats)
+            for export_format in export.EXPORT_FORMATS}
+
+
+def run(count: int = CHEATERS_COUNT, lookups: int = LOOKUPS_COUNT, repeats: int = REPEATS,
+        directory: str = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Все замеры на БД из count синтетических кидал.
+
+    :param count: Сколько кидал.
+    :param lookups: Сколько поисков по каждому параметру.
+    :param repeats: Сколько раз повторять тяжелые замеры.
+    :param directory: Где создать БД (по умолчанию - временная папка, удаляется после замеров).
+    :return: {замер: {ops, ops_per_sec, p50_ms, p99_ms, peak_rss_mb}}
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as temp_dir:
+        db_filename = os.path.join(temp_dir, 'bench-' + str(count) + '.db')
+        db = database.DBCheaters(db_filename)
+        try:
+            result = {'bulk_insert': bench_bulk_insert(db, count)}
+            result.update(asyncio.run(bench_search(db_filename, count, lookups)))
+            result['full_list'] = measure(db.get_cheaters_full_list, repeats)
+            result.update(bench_export(db, repeats))
+            # Первый проход удаляет, следующие - только ищут (данные уже без дубликатов).
+            result['dedup'] = measure(db.delete_duplicates, repeats)
+        finally:
+            db.close()
+    return result
+
+
+if __name__ == '__main__':
+    cheaters_count = int(sys.argv[1]) if len(sys.argv) > 1 else CHEATERS_COUNT
+    print('Кидал:', cheaters_count)
+    for name, row in run(cheaters_count).items():
+        print(name.ljust(26),
+              str(row['ops_per_sec']).rjust(12), 'оп/с,',
+              'p50:', row['p50_ms'], 'мс,',
+              'p99:', row['p99_ms'], 'мс,',
+              'RSS:', row['peak_rss_mb'], 'МиБ')
@@ -0,0 +1,76 @@
+"""
+Отчет по всем замерам в JSON - чтобы сравнивать версии перед выкладкой.
+Запуск из корня проекта: python -m benchmark.report [--sizes 1000 100000 1000000] [--output report.json]
+
+Для каждого размера БД создается своя синтетическая БД (см. benchmark.bench_db),
+плюс замер представлений кидалы (benchmark.bench_cheaters).
+Пиковый RSS - с начала процесса, поэтому размеры идут по возрастанию.
+"""
+import argparse
+import datetime
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+from benchmark import bench_cheaters, bench_db
+
+# Размеры БД по умолчанию: 1 тыс., 100 тыс. и 1 млн кидал.
+DEFAULT_SIZES = [1000, 100_000, 1_000_000]
+
+
+def git_commit() -> str | None:
+    """
+    Текущий коммит, если бенчмарк запущен из git-репозитория.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(sizes: List[int], lookups: int = bench_db.LOOKUPS_COUNT, repeats: int = bench_db.REPEATS,
+                 directory: str = None) -> Dict[str, Any]:
+    """
+    Все замеры по всем размерам БД.
+
+    :param sizes: Сколько кидал в БД.
+    :param lookups: Сколько поисков по каждому параметру.
+    :param repeats: Сколько раз повторять тяжелые замеры.
+    :param directory: Где создавать БД.
+    :return: Отчет.
+    """
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'sizes': {},
+    }
+    for size in sorted(sizes):
+        print('Кидал:', size, file=sys.stderr)
+        report['sizes'][str(size)] = bench_db.run(size, lookups, repeats, directory)
+    report['cheater_objects'] = bench_cheaters.run(min(max(sizes), bench_cheaters.CHEATERS_COUNT))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Замеры БД кидал на синтетических данных, отчет в JSON.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='сколько кидал в БД')
+    parser.add_argument('--lookups', type=int, default=bench_db.LOOKUPS_COUNT,
+                        help='сколько поисков по каждому параметру')
+    parser.add_argument('--repeats', type=int, default=bench_db.REPEATS, help='повторы тяжелых замеров')
+    parser.add_argument('--dir', default=None, help='где создавать БД (по умолчанию - временная папка)')
+    parser.add_argument('--output', '-o', default=None, help='файл отчета (по умолчанию - stdout)')
+    args = parser.parse_args()
+
+    text = json.dumps(build_report(args.sizes, args.lookups, args.repeats, args.dir), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
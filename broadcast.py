@@ -0,0 +1,285 @@
+"""
+Рассылка сообщения всем членам группы.
+Члены группы читаются постранично (страницы - параллельно), сообщения уходят пачками по peer_ids через очередь
+исходящих сообщений (outbox), а ход рассылки сохраняется в БД после каждой пачки:
+после падения или рестарта рассылка продолжается с того же места, уже получившим сообщение не шлется повторно.
+"""
+import asyncio
+import datetime
+import logging
+import time
+from typing import Any, Awaitable, Callable, Coroutine, List, NamedTuple, Optional
+
+from vkbottle import API
+from vkbottle.exception_factory import VKAPIError
+
+import async_database
+import dialogs
+import outbox
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+# Сколько членов группы на странице groups.getMembers (максимум API).
+MEMBERS_PAGE_SIZE = 1000
+# Сколько страниц членов группы запрашивать одновременно и с какой частотой (запросов в секунду).
+MEMBERS_CONCURRENCY = 3
+MEMBERS_API_RATE = 3
+# Раз во сколько секунд отправлять админу отчет о ходе рассылки.
+BROADCAST_REPORT_INTERVAL = 30
+# Сколько раз повторять пачку, которая не ушла из-за сети или flood control, и пауза между повторами (секунд).
+# Если пачка так и не ушла - рассылка прерывается и продолжится с нее же после рестарта.
+BROADCAST_BATCH_RETRIES = 3
+BROADCAST_RETRY_DELAY = 60
+
+
+class BroadcastState(NamedTuple):
+    """
+    Ход рассылки (как в таблице broadcasts).
+      pk: int
+        номер рассылки в БД
+      message: str
+        текст
+      admin_peer_id: int
+        кто запустил (ему идут отчеты)
+      total: int
+        сколько получателей
+      sent: int
+        скольким отправлено
+      failed: int
+        скольким не доставлено (например, не разрешили сообщения от группы)
+      last_peer_id: int
+        до какого id (по возрастанию) уже отправлено
+    """
+    pk: int
+    message: str
+    admin_peer_id: int
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    last_peer_id: int = 0
+
+
+def format_progress(state: BroadcastState, rate: float) -> str:
+    """
+    Функция готовит отчет о ходе рассылки: сколько отправлено, скорость и сколько осталось ждать.
+
+    :param state: Ход рассылки.
+    :param rate: Скорость, сообщений в секунду.
+    :return: Текст отчета.
+    """
+    done = state.sent + state.failed
+    if rate > 0:
+        eta = str(datetime.timedelta(seconds=round(max(state.total - done, 0) / rate)))
+    else:
+        eta = '?'
+    return dialogs.spam_progress.format(done, state.total, rate, eta)
+
+
+def count_failed(result: Any) -> int:
+    """
+    Функция считает, скольким получателям messages.send не доставил сообщение.
+    При отправке на peer_ids ответ - список, у недоставленных заполнено error.
+
+    :param result: Ответ messages.send.
+    :return: Сколько не доставлено.
+    """
+    if isinstance(result, list):
+        return sum(1 for item in result if getattr(item, 'error', None))
+    return 0
+
+
+def is_delivery_error(error: Exception) -> bool:
+    """
+    Функция говорит, что VK отверг пачку окончательно (например, нет прав на отправку),
+    а не что запрос не дошел (сеть, flood control после всех повторов outbox) - такую пачку стоит повторить.
+
+    :param error: Ошибка messages.send.
+    :return: True - пачку считать недоставленной, False - повторить.
+    """
+    return isinstance(error, VKAPIError) and error.code not in outbox.SEND_RETRY_ERRORS
+
+
+class Broadcaster:
+    """
+    Рассылка всем членам группы. Одновременно идет одна рассылка.
+    """
+
+    def __init__(self, api: API, db: async_database.AsyncDBCheaters, sender: outbox.MessageSender,
+                 report: Callable[[int, str], Awaitable[Any]] = None,
+                 report_interval: float = BROADCAST_REPORT_INTERVAL,
+                 batch_retries: int = BROADCAST_BATCH_RETRIES, retry_delay: float = BROADCAST_RETRY_DELAY):
+        """
+        :param api: API бота.
+        :param db: БД (там хранится ход рассылок).
+        :param sender: Очередь исходящих сообщений.
+        :param report: Как отправлять админу отчеты: report(peer_id, text). По умолчанию - через sender.
+        :param report_interval: Раз во сколько секунд отправлять отчет.
+        :param batch_retries: Сколько раз повторять пачку, которая не ушла (сеть, flood control).
+        :param retry_delay: Пауза между повторами пачки, секунд.
+        """
+        self.api = api
+        self.db = db
+        self.sender = sender
+        self.report = report or sender.send
+        self.report_interval = report_interval
+        self.batch_retries = batch_retries
+        self.retry_delay = retry_delay
+        # Сколько раз пачка не ушла из-за сети или flood control (такие пачки повторяются, в failed не входят).
+        self.transient_errors = 0
+        self.members_rate_limiter = ratelimit.TokenBucket(MEMBERS_API_RATE)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def busy(self) -> bool:
+        """
+        Идет ли сейчас рассылка.
+        """
+        return self._task is not None and not self._task.done()
+
+    async def _get_members_page(self, group_id: int, offset: int) -> Any:
+        """
+        Страница членов группы (по возрастанию id).
+        """
+        await self.members_rate_limiter.acquire()
+        return await self.api.groups.get_members(group_id=group_id, offset=offset, count=MEMBERS_PAGE_SIZE,
+                                                 sort='id_asc')
+
+    async def get_members(self, group_id: int) -> List[int]:
+        """
+        Метод возвращает всех членов группы, отсортированных по id.
+        Первая страница говорит, сколько всего членов, остальные запрашиваются параллельно.
+
+        :param group_id: id группы.
+        :return: id членов группы.
+        """
+        first_page = await self._get_members_page(group_id, 0)
+        semaphore = asyncio.Semaphore(MEMBERS_CONCURRENCY)
+
+        async def get_page(offset: int):
+            async with semaphore:
+                return await self._get_members_page(group_id, offset)
+
+        pages = await asyncio.gather(*(get_page(offset)
+                                       for offset in range(MEMBERS_PAGE_SIZE, first_page.count, MEMBERS_PAGE_SIZE)))
+        members = set(first_page.items)
+        for page in pages:
+            members.update(page.items)
+        return sorted(members)
+
+    def start(self, group_id: int, message: str, admin_peer_id: int) -> bool:
+        """
+        Метод запускает рассылку в фоне.
+
+        :param group_id: id группы.
+        :param message: Текст.
+        :param admin_peer_id: Кто запустил (ему идут отчеты).
+        :return: False, если уже идет другая рассылка.
+        """
+        return self._spawn(self._start(group_id, message, admin_peer_id))
+
+    async def _start(self, group_id: int, message: str, admin_peer_id: int):
+        """
+        Фоновая задача новой рассылки.
+        """
+        pk = await self.db.add_broadcast(message, admin_peer_id)
+        await self.run(group_id, BroadcastState(pk, message, admin_peer_id))
+
+    def resume(self, group_id: int) -> bool:
+        """
+        Метод продолжает в фоне рассылку, прерванную рестартом (если такая есть).
+
+        :param group_id: id группы.
+        :return: False, если уже идет другая рассылка.
+        """
+        return self._spawn(self._resume(group_id))
+
+    def _spawn(self, coro: Coroutine) -> bool:
+        """
+        Метод запускает задачу рассылки, если другой рассылки сейчас нет.
+        """
+        if self.busy:
+            coro.close()
+            return False
+        self._task = asyncio.get_running_loop().create_task(coro)
+        # Ошибку рассылки run уже записал в лог и сообщил админу: asyncio не должен ругаться на нее еще раз.
+        self._task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return True
+
+    async def _resume(self, group_id: int):
+        """
+        Фоновая задача: продолжает незаконченные рассылки по очереди.
+        """
+        try:
+            rows = await self.db.get_unfinished_broadcasts()
+        except Exception:
+            logger.exception('Не удалось прочитать незаконченные рассылки')
+            return
+        for row in rows:
+            state = BroadcastState(*row)
+            logger.info('Продолжаю рассылку №' + str(state.pk) + ' с id ' + str(state.last_peer_id))
+            try:
+                await self.report(state.admin_peer_id, dialogs.spam_resumed)
+                await self.run(group_id, state)
+            except Exception:
+                # Одна сломанная рассылка не должна мешать продолжить остальные.
+                logger.exception('Рассылка №' + str(state.pk) + ' не продолжена, перехожу к следующей')
+
+    async def _send_batch(self, state: BroadcastState, batch: List[int]) -> int:
+        """
+        Метод отправляет пачку. Если запрос не дошел (сеть, flood control) - повторяет его,
+        а если так и не дошел - выбрасывает ошибку: пачка не считается ни отправленной, ни недоставленной,
+        checkpoint за нее не сдвигается.
+
+        :param state: Ход рассылки.
+        :param batch: Получатели.
+        :return: Скольким не доставлено.
+        """
+        for attempt in range(self.batch_retries + 1):
+            try:
+                return count_failed(await self.sender.send(batch, state.message))
+            except Exception as error:
+                if is_delivery_error(error):
+                    logger.error('Рассылка №' + str(state.pk) + ': VK отверг пачку: ' + str(error))
+                    return len(batch)
+                self.transient_errors += 1
+                if attempt == self.batch_retries:
+                    raise
+                logger.warning('Рассылка №' + str(state.pk) + ': пачка не ушла (' + str(error) + '), повтор через '
+                               + str(self.retry_delay) + ' с')
+                await asyncio.sleep(self.retry_delay)
+
+    async def run(self, group_id: int, state: BroadcastState) -> BroadcastState:
+        """
+        Метод рассылает сообщение всем членам группы с id больше state.last_peer_id.
+        После каждой пачки ход сохраняется в БД, админу раз в report_interval уходит отчет.
+
+        :param group_id: id группы.
+        :param state: С какого места продолжать.
+        :return: Итог рассылки.
+        """
+        try:
+            members = await self.get_members(group_id)
+            peer_ids = [peer_id for peer_id in members if peer_id > state.last_peer_id]
+            state = state._replace(total=state.sent + state.failed + len(peer_ids))
+            started = time.monotonic()
+            done_at_start = state.sent + state.failed
+            next_report = started + self.report_interval
+            for start in range(0, len(peer_ids), self.sender.max_peers):
+                batch = peer_ids[start:start + self.sender.max_peers]
+                failed = await self._send_batch(state, batch)
+                state = state._replace(sent=state.sent + len(batch) - failed, failed=state.failed + failed,
+                                       last_peer_id=batch[-1])
+                await self.db.update_broadcast(state.pk, state.total, state.sent, state.failed, state.last_peer_id)
+                now = time.monotonic()
+                if now >= next_report:
+                    rate = (state.sent + state.failed - done_at_start) / (now - started)
+                    await self.report(state.admin_peer_id, format_progress(state, rate))
+                    next_report = now + self.report_interval
+            await self.db.finish_broadcast(state.pk)
+        except Exception:
+            logger.exception('Рассылка №' + str(state.pk) + ' прервана')
+            await self.report(state.admin_peer_id, dialogs.spam_error)
+            raise
+        await self.report(state.admin_peer_id, dialogs.spam_done.format(state.sent, state.total, state.failed))
+        return state
@@ -0,0 +1,122 @@
+"""
+Кеш в памяти для ответов VK API.
+Размер кеша ограничен (вытесняются давно не использованные записи), записи живут не дольше ttl,
+а одновременные запросы одного ключа ждут один общий запрос к API (single-flight).
+"""
+import asyncio
+import collections
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# Значение "в кеше нет": None тоже можно закешировать.
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кеш с временем жизни записей.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        :param maxsize: Сколько записей хранить.
+        :param ttl: Сколько секунд живет запись.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: collections.OrderedDict[Hashable, Tuple[float, Any]] = collections.OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Метод возвращает значение из кеша.
+
+        :param key: Ключ.
+        :param default: Что вернуть, если значения нет или оно устарело.
+        :return: Значение.
+        """
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        """
+        Метод кладет значение в кеш, вытесняя самое давно использованное, если кеш полон.
+
+        :param key: Ключ.
+        :param value: Значение.
+        :param ttl: Время жизни записи, секунд. По умолчанию - self.ttl.
+        """
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable = MISSING):
+        """
+        Метод убирает запись из кеша (без ключа - все записи).
+
+        :param key: Ключ.
+        """
+        if key is MISSING:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Метод возвращает значение из кеша, а если его нет - загружает через loader и кладет в кеш.
+        Пока значение загружается, остальные запросы того же ключа ждут эту загрузку, а не делают свою.
+        Ошибка загрузки не кешируется и достается всем ждущим.
+
+        :param key: Ключ.
+        :param loader: Корутина без параметров, которая загружает значение.
+        :return: Значение.
+        """
+        while True:
+            value = self.get(key)
+            if value is not MISSING:
+                self.hits += 1
+                return value
+            loading = self._loading.get(key)
+            if loading is None:
+                break
+            try:
+                value = await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                if loading.cancelled():
+                    # Отменили того, кто загружал, а не нас: пробуем снова.
+                    continue
+                raise
+            self.hits += 1
+            return value
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Если ошибку никто, кроме загрузившего, не ждет - asyncio не должен ругаться на нее.
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._loading[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+        finally:
+            del self._loading[key]
+        return value
@@ -0,0 +1,139 @@
+"""
+Callback API (webhook): VK сам присылает события POST-запросами на наш HTTP-сервер вместо long polling.
+События разбираются теми же обработчиками bot.labeler, что и при long polling, каждое - отдельной задачей,
+поэтому медленный ответ одному пользователю не задерживает остальных.
+"""
+import asyncio
+import collections
+import json
+import logging
+from typing import NamedTuple, Optional
+
+from aiohttp import web
+
+import vkbot
+
+logger = logging.getLogger(__name__)
+
+# Сколько событий обрабатывается одновременно, остальные ждут своей очереди.
+CALLBACK_MAX_CONCURRENT_EVENTS = 64
+# Сколько последних event_id помнить: VK повторяет событие, если не получил "ok" вовремя.
+CALLBACK_SEEN_EVENTS = 1000
+
+
+class CallbackSettings(NamedTuple):
+    """
+    Настройки Callback API (параметр callback в конфиге).
+      port: int
+        порт HTTP-сервера (0 - Callback API выключен, работаем через long polling)
+      host: str
+        адрес, на котором слушать
+      path: str
+        путь, который указан в настройках сервера в группе
+      secret_key: str
+        секретный ключ из настроек сервера в группе ('' - не проверять)
+      confirmation_code: str
+        строка подтверждения ('' - запросить через API при старте)
+    """
+    port: int = 0
+    host: str = '0.0.0.0'
+    path: str = '/'
+    secret_key: str = ''
+    confirmation_code: str = ''
+
+
+class CallbackServer:
+    """
+    HTTP-сервер для Callback API.
+    Отвечает VK сразу ("ok"), а событие отдает роутеру бота фоновой задачей (см. VKBot.run_in_background).
+    """
+
+    def __init__(self, bot: vkbot.VKBot, settings: CallbackSettings,
+                 max_concurrent_events: int = CALLBACK_MAX_CONCURRENT_EVENTS):
+        """
+        :param bot: Бот с зарегистрированными обработчиками.
+        :param settings: Настройки Callback API.
+        :param max_concurrent_events: Сколько событий обрабатывать одновременно.
+        """
+        self.bot = bot
+        self.settings = settings
+        self.confirmation_code = settings.confirmation_code
+        self._semaphore = asyncio.Semaphore(max_concurrent_events)
+        self._seen_events = collections.OrderedDict()
+        self._router = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        """
+        Приложение aiohttp с обработчиком событий на settings.path.
+
+        :return: web.Application.
+        """
+        app = web.Application()
+        app.router.add_post(self.settings.path, self.handle)
+        return app
+
+    def _is_repeat(self, event_id: Optional[str]) -> bool:
+        """
+        Метод запоминает event_id и говорит, приходило ли событие раньше.
+        """
+        if not event_id:
+            return False
+        if event_id in self._seen_events:
+            return True
+        self._seen_events[event_id] = None
+        if len(self._seen_events) > CALLBACK_SEEN_EVENTS:
+            self._seen_events.popitem(last=False)
+        return False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """
+        Обработчик POST-запроса от VK.
+        """
+        try:
+            event = await request.json()
+        except json.JSONDecodeError:
+            return web.Response(status=400, text='bad request')
+        if not isinstance(event, dict) or 'type' not in event:
+            return web.Response(status=400, text='bad request')
+        if self.settings.secret_key and event.get('secret') != self.settings.secret_key:
+            logger.warning('Callback API: событие с неверным секретным ключом')
+            return web.Response(status=403, text='forbidden')
+        if self.bot.group_id and event.get('group_id') != self.bot.group_id:
+            return web.Response(status=403, text='forbidden')
+        if event['type'] == 'confirmation':
+            return web.Response(text=self.confirmation_code)
+        if not self._is_repeat(event.get('event_id')):
+            self.bot.run_in_background(self._process_event(event))
+        return web.Response(text='ok')
+
+    async def _process_event(self, event: dict):
+        """
+        Фоновая задача: отдает событие роутеру бота (обработчикам bot.labeler).
+        """
+        if self._router is None:
+            # Роутер собирается из обработчиков один раз, а не на каждое событие.
+            self._router = self.bot.router
+        async with self._semaphore:
+            await self._router.route(event, self.bot.api)
+
+    async def start(self):
+        """
+        Метод запускает HTTP-сервер. Если строки подтверждения нет в настройках - берет ее через API.
+        group_id бота к этому моменту должен быть известен (см. VKBot.get_async_params).
+        """
+        if not self.confirmation_code:
+            response = await self.bot.api.groups.get_callback_confirmation_code(group_id=self.bot.group_id)
+            self.confirmation_code = response.code
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.settings.host, self.settings.port).start()
+        logger.info('Callback API: слушаю ' + self.settings.host + ':' + str(self.settings.port) + self.settings.path)
+
+    async def stop(self):
+        """
+        Метод останавливает HTTP-сервер.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
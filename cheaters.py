@@ -2,10 +2,15 @@
 Тут находится бекэнд проекта.
 Все методы, что не пользуют vk_api и db.
 """
+import functools
+import re
 from dataclasses import dataclass, field, fields
 from typing import (
     Any,
     List,
+    NamedTuple,
+    Optional,
+    Tuple,
 )
 
 REGEXP_CHEATER = {
@@ -26,6 +31,9 @@ PREFIX = {
     'group_id': 'club',
 }
 
+# Строка в файле импорта, после которой идут "полтинники".
+FIFTY_MARKER = 'fifty'
+
 
 def merge_list(l1: list, l2: list):
     """
@@ -43,6 +51,28 @@ def merge_list(l1: list, l2: list):
     return result
 
 
+def _get_regexp_groups(*args: str) -> Tuple[str, ...]:
+    """
+    Функция переводит аргументы get_regexp в кортеж групп регулярок в порядке REGEXP_CHEATER.
+
+    :param args: Ключевые слова или группы регулярок (см. get_regexp).
+    :return: Кортеж групп.
+    """
+    # Запрошенные группы регулярок.
+    request_group_list: tuple
+    if not args or args[0] == 'all':
+        request_group_list = tuple(REGEXP_CHEATER.keys())
+    elif args[0] in ('main', 'search'):
+        request_group_list = tuple(['vk_id', 'group_id', 'proof_link', 'screen_name', 'card', 'telephone'])
+    elif args[0] == 'add':
+        request_group_list = tuple(['vk_id', 'group_id', 'proof_link', 'screen_name', 'card', 'telephone', 'fifty'])
+    elif args[0] == 'del':
+        request_group_list = tuple(['vk_id', 'group_id', 'proof_link', 'screen_name', 'card', 'telephone'])
+    else:
+        request_group_list = args
+    return tuple(group for group in REGEXP_CHEATER if group in request_group_list)
+
+
 def get_regexp(*args: 'str') -> str:
     """
     Возвращает регулярку с нужными строками для парсинга. В качестве аргументов принимает значения регулярок,
@@ -60,37 +90,122 @@ def get_regexp(*args: 'str') -> str:
     :param args: Указываем параметры, которые хотим парсить регуляркой.
     :return: Регулярка.
     """
-    # Группы регулярок.
-    regexp_group_list = tuple(REGEXP_CHEATER.keys())
-    # Запрошенные группы регулярок.
-    request_group_list: tuple
-    if args[0] == 'all':
-        request_group_list = tuple(REGEXP_CHEATER.keys())
-    elif args[0] in ('main', 'search'):
-        request_group_list = tuple(['vk_id', 'group_id', 'proof_link', 'screen_name', 'card', 'telephone'])
-    elif args[0] == 'add':
-        request_group_list = tuple(['vk_id', 'group_id', 'proof_link', 'screen_name', 'card', 'telephone', 'fifty'])
-    elif args[0] == 'del':
-        request_group_list = tuple(['vk_id', 'group_id', 'proof_link', 'screen_name', 'card', 'telephone'])
-    elif args:
-        request_group_list = args
-    else:
-        request_group_list = tuple(REGEXP_CHEATER.keys())
-    # Собираем регулярку
-    result = ''
-    for group in regexp_group_list:
-        if group in request_group_list:
-            if result:
-                # Если регулярка уже есть, добавляем или |
-                result += r'|'
-            result += REGEXP_CHEATER[group]
-    return result
+    return r'|'.join(REGEXP_CHEATER[group] for group in _get_regexp_groups(*args))
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_regexp(groups: Tuple[str, ...]) -> re.Pattern:
+    """
+    Реестр скомпилированных регулярок: каждый набор групп компилируется один раз.
+    """
+    return re.compile(r'|'.join(REGEXP_CHEATER[group] for group in groups))
+
+
+def get_compiled_regexp(*args: str) -> re.Pattern:
+    """
+    Возвращает скомпилированную регулярку get_regexp(*args) из реестра.
+    Одинаковые наборы групп (например, main и search) дают один и тот же объект.
+
+    :param args: Ключевые слова или группы регулярок (см. get_regexp).
+    :return: Скомпилированная регулярка.
+    """
+    return _compile_regexp(_get_regexp_groups(*args))
+
+
+class CheaterMatch(NamedTuple):
+    """
+    Результат разбора строки регуляркой.
+      group: str
+        сработавшая группа регулярки (vk_id, group_id, screen_name, card, telephone, proof_link, fifty)
+      value: str
+        найденное значение
+    """
+    group: str
+    value: str
+
+
+def normalize_search_text(text: str) -> str:
+    """
+    Функция готовит текст сообщения к поиску кидалы: нижний регистр, без пробелов и + в начале.
+
+    :param text: Текст сообщения.
+    :return: Текст для регулярки.
+    """
+    return text.lower().lstrip('+').replace(' ', '')
+
+
+def match_regexp(text: str, *args: str) -> Optional[CheaterMatch]:
+    """
+    Функция проверяет регуляркой get_compiled_regexp(*args) начало строки.
 
+    :param text: Строка.
+    :param args: Ключевые слова или группы регулярок (см. get_regexp).
+    :return: CheaterMatch или None, если не совпало.
+    """
+    match = get_compiled_regexp(*args).match(text)
+    if match:
+        return CheaterMatch(match.lastgroup, match[match.lastgroup])
+    return None
+
+
+def search_regexp(text: str, *args: str) -> Optional[CheaterMatch]:
+    """
+    Функция ищет регуляркой get_compiled_regexp(*args) первое совпадение в любом месте строки.
+
+    :param text: Строка.
+    :param args: Ключевые слова или группы регулярок (см. get_regexp).
+    :return: CheaterMatch или None, если не нашлось.
+    """
+    match = get_compiled_regexp(*args).search(text)
+    if match:
+        return CheaterMatch(match.lastgroup, match[match.lastgroup])
+    return None
 
-@dataclass
+
+def parse_cheaters_file(content: str) -> List[dict]:
+    """
+    Функция разбирает текст файла с кидалами без обращений к VK API.
+    Каждая страница (id, группа или screen_name) начинает нового кидалу,
+    телефоны, карты и пруфлинки после нее относятся к нему. Все, что до первой страницы, пропускается.
+    Для id и групп vk_id заполняется с префиксом (id123, club123), для screen_name vk_id пустой -
+    его находит VKBot по API.
+
+    :param content: Текст файла.
+    :return: Список кидал словарями (как для DBCheaters.import_cheaters) в порядке файла.
+    """
+    fifty = False  # Идентификатор "Полтинников" - кто иногда кидает
+    cheater = None
+    cheaters_list = []
+    for line in content.split('\n'):
+        # Ссылки берем как есть, в остальных строках убираем разделители, чтобы получились цифры.
+        if re.search(r'vk\.com', line):
+            subline = line.strip()
+        else:
+            subline = re.sub(r'[- +\r]', '', line)
+        match = search_regexp(subline, 'del')
+        if match:
+            group = match.group
+            value = match.value.strip()
+            if group in ('vk_id', 'group_id', 'screen_name'):
+                cheater = {'vk_id': '', 'fifty': fifty, 'screen_name': '',
+                           'telephone': [], 'card': [], 'proof_link': []}
+                cheaters_list.append(cheater)
+                if group == 'screen_name':
+                    cheater['screen_name'] = value
+                else:
+                    cheater['vk_id'] = PREFIX[group] + value
+            elif cheater is not None and value not in cheater[group]:
+                cheater[group].append(value)
+        elif subline == FIFTY_MARKER:
+            fifty = True
+    return cheaters_list
+
+
+@dataclass(slots=True)
 class Cheater:
     """
     Тип данных - кидала.
+    Класс со __slots__: у экземпляров нет __dict__, поэтому кидалы всей БД в памяти (экспорт, индекс) занимают меньше.
       vk_id: str = None
         id
       fifty: bool = False
@@ -118,8 +233,8 @@ class Cheater:
         :return: Значения словарем.
         """
         result = ''
-        for f in fields(self):
-            result += str(f.name) + ': ' + str(self.__getattribute__(f.name)) + '\n'
+        for name in CHEATER_FIELDS:
+            result += name + ': ' + str(getattr(self, name)) + '\n'
         return result
 
     def __bool__(self):
@@ -129,10 +244,7 @@ class Cheater:
 
         :return: bool
         """
-        result = False
-        for f in fields(self):
-            result |= bool(self.__getattribute__(f.name))
-        return result
+        return bool(self.vk_id or self.fifty or self.screen_name or self.telephone or self.card or self.proof_link)
 
     def get(self, value: str) -> Any:
         """
@@ -142,9 +254,8 @@ class Cheater:
         :param value: Атрибут, который хочешь получить.
         :return: Значение или None.
         """
-        for f in fields(self):
-            if f.name == value:
-                return self.__getattribute__(f.name)
+        if value in CHEATER_FIELDS:
+            return getattr(self, value)
         return None
 
     def str_csv(self, sep: str = ';') -> str:
@@ -153,9 +264,9 @@ class Cheater:
         :return: параметры через разделитель (по-умолчанию - запятая)
         """
         result = ''
-        for f in fields(self):
-            if f.name != 'fifty':
-                result += str(self.__getattribute__(f.name)) + sep
+        for name in CHEATER_FIELDS:
+            if name != 'fifty':
+                result += str(getattr(self, name)) + sep
         result += '\n'
         return result
 
@@ -251,3 +362,56 @@ class Cheater:
                             merge_list(self.__getattribute__(param_to_update), value)
                     else:
                         pass
+
+
+# Имена полей кидалы по порядку. Считаются один раз, а не через dataclasses.fields() на каждый вызов.
+CHEATER_FIELDS: Tuple[str, ...] = tuple(f.name for f in fields(Cheater))
+
+
+@dataclass(frozen=True, slots=True)
+class CheaterRecord:
+    """
+    Неизменяемый кидала для чтения: списки заменены кортежами, поэтому запись можно отдавать без копирования
+    и хранить долго (см. memory_index). Для правки - to_cheater().
+    Поля те же, что у Cheater.
+    """
+    vk_id: str = None
+    fifty: bool = False
+    screen_name: str = None
+    telephone: Tuple[str, ...] = ()
+    card: Tuple[str, ...] = ()
+    proof_link: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_cheater(cls, cheater: Cheater) -> 'CheaterRecord':
+        """
+        Неизменяемая копия кидалы.
+
+        :param cheater: Кидала.
+        :return: CheaterRecord.
+        """
+        return cls(cheater.vk_id, cheater.fifty, cheater.screen_name,
+                   tuple(cheater.telephone), tuple(cheater.card), tuple(cheater.proof_link))
+
+    def to_cheater(self) -> Cheater:
+        """
+        Изменяемая копия со своими списками.
+
+        :return: Cheater.
+        """
+        return Cheater(self.vk_id, self.fifty, self.screen_name,
+                       list(self.telephone), list(self.card), list(self.proof_link))
+
+    def __bool__(self):
+        """
+        Если все значения пустые - вернет False (как Cheater).
+        """
+        return bool(self.vk_id or self.fifty or self.screen_name or self.telephone or self.card or self.proof_link)
+
+    def get(self, value: str) -> Any:
+        """
+        Значение поля или None (как Cheater.get).
+        """
+        if value in CHEATER_FIELDS:
+            return getattr(self, value)
+        return None
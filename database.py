@@ -2,18 +2,45 @@
 Class for work with database.
 Now work with sqlite3.
 """
+import contextlib
+import functools
 import logging
 import shutil
 import os
 import sqlite3
 import datetime
-from typing import List, Optional, Any, Literal
+import time
+from typing import List, Optional, Literal, Tuple, Dict, Iterable, Iterator
 
+import backup
 import cheaters
+import memory_index
 import sql_requests
 
 logger = logging.getLogger(__name__)
 
+# Имя параметра в таблице parameters, где хранится номер версии схемы БД.
+SCHEMA_VERSION_PARAM = 'schema_version'
+
+# Размер кеша скомпилированных выражений sqlite3 (на соединение).
+# Запросы строятся с параметрами "?", поэтому текст запроса одной формы всегда одинаковый и берется из кеша.
+STATEMENT_CACHE_SIZE = 256
+
+# Профиль соединения с БД по умолчанию: {pragma: значение}. Переопределяется параметром db_pragmas в конфиге.
+# WAL - читатели (экспорт, бекап) не ждут писателя и наоборот, synchronous=normal в WAL не теряет целостность,
+# cache_size < 0 - размер кеша в КиБ, mmap_size - в байтах, busy_timeout - в мс.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -16000,
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'memory',
+    'busy_timeout': 5000,
+}
+
+# Максимальное количество параметров в одном "in (...)". Лимит старых версий sqlite - 999 параметров.
+IN_CHUNK_SIZE = 512
+
 DB_TEMPLATE = {
     'vk_ids': {
         'pk': 'integer',
@@ -49,7 +76,11 @@ class DBCheaters:
     Class to work with db.
     """
 
-    def __init__(self, db_filename: str):
+    def __init__(self, db_filename: str, pragmas: dict = None):
+        """
+        :param db_filename: Файл БД.
+        :param pragmas: Настройки соединения, дополняют и переопределяют DEFAULT_PRAGMAS.
+        """
         self.db_filename = db_filename
         file_exist = self.check_db_file_exist(self.db_filename)
         integrity_check = False
@@ -64,34 +95,89 @@ class DBCheaters:
         if not file_exist or not integrity_check:
             self.create_new_database(self.db_filename)
 
-        self._connection = sqlite3.connect(self.db_filename)
+        self._connection = sqlite3.connect(self.db_filename, cached_statements=STATEMENT_CACHE_SIZE)
         self._cursor = self._connection.cursor()
+        # Курсор для выборок строками sqlite3.Row (доступ к полям и по номеру, и по имени).
+        self._row_cursor = self._connection.cursor()
+        self._row_cursor.row_factory = sqlite3.Row
+        self._transaction_depth = 0
+        # Каталог схемы: {таблица: имена колонок}. Читается один раз, см. load_schema.
+        self.schema: Dict[str, Tuple[str, ...]] = {}
+        # Настройки соединения, как их вернула БД после установки.
+        self.pragmas = self._apply_pragmas({**DEFAULT_PRAGMAS, **(pragmas or {})})
+        # Индекс кидал в памяти (см. load_index). None - поиск идет через БД.
+        self.index: Optional[memory_index.CheatersIndex] = None
+        # Сначала приводим типы: после миграций на screen_names висит уникальный индекс по changed = 0.
         self._rename_bool_to_int()
+        self._migrate()
+        self.load_schema()
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        Метод закрывает соединение с БД. Повторный вызов ничего не делает.
+        """
+        if getattr(self, '_connection', None) is None:
+            return
+        self._row_cursor.close()
         self._cursor.close()
         self._connection.close()
+        self._connection = None
 
-    @staticmethod
-    def _type_conversion_sql(value: Any) -> str:
+    def _commit(self):
+        """
+        Метод фиксирует изменения, если не открыта транзакция (см. transaction).
+        Внутри транзакции изменения фиксируются один раз при выходе из нее.
+        """
+        if not self._transaction_depth:
+            self._connection.commit()
+
+    def _apply_pragmas(self, pragmas: dict) -> dict:
         """
-        Метод преобразует переменные в строки, пригодные для SQL выражений.
-        str -> "str"
-        None -> NULL
-        0 | 1 -> False | True
-        Прочее - преобразует в строку.
+        Метод устанавливает настройки соединения и возвращает их значения, прочитанные из БД.
+        Принимаются только pragma из DEFAULT_PRAGMAS и значения - числа или слова, иначе ValueError.
 
-        :param value: Что преобразовать.
-        :return: Результат.
+        :param pragmas: {pragma: значение}.
+        :return: {pragma: значение после установки}.
         """
-        if isinstance(value, str):
-            result = '"' + value + '"'
-        elif value is None:
-            result = 'NULL'
-        else:
-            result = str(value)
+        result = {}
+        for pragma, value in pragmas.items():
+            if pragma not in DEFAULT_PRAGMAS:
+                raise ValueError('Неизвестная настройка БД: ' + str(pragma))
+            if isinstance(value, bool) or not isinstance(value, (int, str)) or \
+                    (isinstance(value, str) and not value.isalpha()):
+                raise ValueError('Неправильное значение настройки БД ' + pragma + ': ' + str(value))
+            self._cursor.execute('pragma ' + pragma + ' = ' + str(value))
+            result[pragma] = self._cursor.execute('pragma ' + pragma).fetchone()[0]
+        logger.info('Настройки БД: ' + str(result))
         return result
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Контекстный менеджер для пакетной записи: все изменения внутри фиксируются одним commit (и одним fsync).
+        Если внутри вылетело исключение - изменения откатываются. Вложенные транзакции входят во внешнюю.
+
+        with db.transaction():
+            db.add_vk_id(...)
+            db.add_cards(...)
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self._connection.rollback()
+                # Индекс уже видел откаченные изменения - перечитываем.
+                if self.index is not None:
+                    self.load_index()
+            raise
+        self._transaction_depth -= 1
+        self._commit()
+
     @staticmethod
     def _tuple_list_to_list(tl: List[tuple] | List[list]) -> list:
         """
@@ -107,125 +193,154 @@ class DBCheaters:
         return result
 
     @staticmethod
-    def _construct_insert(table: str, values_dict: dict) -> str:
+    def _chunks_for_in(values: list) -> List[Tuple[str, list]]:
         """
-        Construct INSERT queue.
-        INSERT into {table} ({values.keys}) values ({values.values})
+        Метод режет список значений на части для условия "in (...)".
+        Количество плейсхолдеров в части округляется вверх до степени двойки (часть добивается последним значением),
+        чтобы разных текстов запросов было немного и они брались из кеша выражений.
 
-        :param table:
-        :param values_dict: {column: value}
-        :return: INSERT str
-        """
-        columns = ''
-        values = ''
-        result = 'INSERT into ' + table + ' '
-        for count, value in enumerate(values_dict):
-            if count:
-                columns += ', '
-                values += ', '
-            columns += value
-            values += DBCheaters._type_conversion_sql(values_dict[value])
-        result += '(' + columns + ') values (' + values + ')'
+        :param values: Значения.
+        :return: Список (плейсхолдеры "?, ?, ...", значения).
+        """
+        result = []
+        for start in range(0, len(values), IN_CHUNK_SIZE):
+            chunk = values[start:start + IN_CHUNK_SIZE]
+            size = 1
+            while size < len(chunk):
+                size *= 2
+            chunk += [chunk[-1]] * (size - len(chunk))
+            result.append((', '.join('?' * size), chunk))
         return result
 
     @staticmethod
-    def _construct_select(table: str,
-                          what_select: str | List[str],
-                          where_select: dict = None,
-                          operator: str = 'and'
-                          ) -> str:
+    @functools.lru_cache(maxsize=None)
+    def _where_query(columns: Tuple[str, ...], operator: str = 'and') -> str:
+        """
+        Создаёт условие WHERE с параметрами.
+        where {column}=? and/or {column}=?
+        Если имя колонки начинается на "!", то ставится !=
+
+        :param columns: Колонки условия.
+        :param operator: and или or.
+        :return: Условие или пустая строка, если колонок нет.
+        """
+        if not columns:
+            return ''
+        conditions = []
+        for column in columns:
+            if column.startswith('!'):
+                conditions.append(column.lstrip('!') + '!=?')
+            else:
+                conditions.append(column + '=?')
+        return ' where ' + (' ' + operator + ' ').join(conditions)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _select_query(table: str, columns: Tuple[str, ...], where_columns: Tuple[str, ...], operator: str) -> str:
+        """
+        Текст SELECT запроса с параметрами. Для одной формы запроса текст всегда одинаковый.
+        """
+        return 'SELECT ' + ', '.join(columns) + ' from ' + table + DBCheaters._where_query(where_columns, operator)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _insert_query(table: str, columns: Tuple[str, ...]) -> str:
+        """
+        Текст INSERT запроса с параметрами.
+        """
+        return ('INSERT into ' + table + ' (' + ', '.join(columns) + ') values (' + ', '.join('?' * len(columns)) + ')'
+                + ' on conflict do nothing')
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _update_query(table: str,
+                      set_columns: Tuple[str, ...],
+                      where_columns: Tuple[str, ...],
+                      operator: str) -> str:
+        """
+        Текст UPDATE запроса с параметрами.
+        Если после обновления строка совпадет с другой по уникальному индексу, будет sqlite3.IntegrityError:
+        сливать дубликаты должен вызывающий (см. update_fifty, publics_to_clubs).
+        """
+        return ('UPDATE ' + table + ' set ' + ', '.join(column + '=?' for column in set_columns)
+                + DBCheaters._where_query(where_columns, operator))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _delete_query(table: str, where_columns: Tuple[str, ...], operator: str) -> str:
+        """
+        Текст DELETE запроса с параметрами.
+        """
+        return 'DELETE from ' + table + DBCheaters._where_query(where_columns, operator)
+
+    @staticmethod
+    def _build_select(table: str,
+                      what_select: str | List[str],
+                      where_select: dict = None,
+                      operator: str = 'and'
+                      ) -> Tuple[str, tuple]:
         """
-        Создаёт SELECT запрос.
-        select {what_select} from {table} where {where_select} and/or {where_select}
+        Создаёт SELECT запрос с параметрами.
+        select {what_select} from {table} where {where_param}=? and/or {where_param}=?
 
         :param table: str
         :param what_select: * or [list of rows]
         :param where_select: dict of where
         :param operator: and/or
-        :return: SELECT str
+        :return: (SELECT str, параметры)
         """
-        result = 'SELECT '
         if isinstance(what_select, str):
-            select_tables = [what_select]
+            columns = (what_select,)
         else:
-            select_tables = what_select
+            columns = tuple(what_select)
+        where_select = where_select or {}
+        return (DBCheaters._select_query(table, columns, tuple(where_select), operator),
+                tuple(where_select.values()))
 
-        if select_tables == '*':
-            result += what_select
-        else:
-            for count, value in enumerate(select_tables):
-                if count:
-                    result += ', '
-                result += value
-        result += ' from ' + table
-        if where_select:
-            result += ' where '
-            for count, value in enumerate(where_select):
-                if count:
-                    result += ' ' + operator + ' '
-                result += value + '='
-                result += DBCheaters._type_conversion_sql(where_select[value])
-        return result
+    @staticmethod
+    def _build_insert(table: str, values_dict: dict) -> Tuple[str, tuple]:
+        """
+        Создаёт INSERT запрос с параметрами.
+        INSERT into {table} ({values.keys}) values (?, ?) on conflict do nothing
+        Строки, которые нарушили бы уникальный индекс (дубликаты), молча пропускаются.
+
+        :param table:
+        :param values_dict: {column: value}
+        :return: (INSERT str, параметры)
+        """
+        return DBCheaters._insert_query(table, tuple(values_dict)), tuple(values_dict.values())
 
     @staticmethod
-    def _construct_update(table: str, set_params: dict, where_update: dict = None, operator: str = 'and') -> str:
+    def _build_update(table: str,
+                      set_params: dict,
+                      where_update: dict = None,
+                      operator: str = 'and') -> Tuple[str, tuple]:
         """
-        Construct update query.
-        UPDATE {table} set {set_param} = "{set_value}" where {where_param} = "{where_value}"
+        Создаёт UPDATE запрос с параметрами.
+        UPDATE {table} set {set_param}=? where {where_param}=?
 
         :param table: Таблица для апдейта;
         :param set_params: Словарь параметров. set (param=value, param2=value2);
         :param where_update: Условие апдейта. where (param=value, param2=value2);
         :param operator: and или or;
-        :return: SQL UPDATE.
-        """
-        result = 'UPDATE {table} set '.format(table=table)
-
-        for count, param in enumerate(set_params):
-            if count:
-                result += ', '
-            s_param = param
-            if type(set_params[param]) == bool:
-                s_value = str(set_params[param])
-            elif type(set_params[param]) == str:
-                s_value = '"' + set_params[param] + '"'
-            else:
-                s_value = str(set_params[param])
-            result += s_param + '=' + s_value
-
-        if where_update:
-            result += ' where '
-            for count, value in enumerate(where_update):
-                if count:
-                    result += ' ' + operator + ' '
-                result += value + '='
-                result += DBCheaters._type_conversion_sql(where_update[value])
-        return result
+        :return: (UPDATE str, параметры)
+        """
+        where_update = where_update or {}
+        return (DBCheaters._update_query(table, tuple(set_params), tuple(where_update), operator),
+                tuple(set_params.values()) + tuple(where_update.values()))
 
     @staticmethod
-    def _construct_delete(table: str, where_delete: dict, operator: str = 'and') -> str:
+    def _build_delete(table: str, where_delete: dict, operator: str = 'and') -> Tuple[str, tuple]:
         """
-        Construct delete query.
-        DELETE from {table} where {where_param} = "{where_value}"
+        Создаёт DELETE запрос с параметрами.
+        DELETE from {table} where {where_param}=?
 
         :param table: Таблица для удаления;
         :param where_delete: словарь с условиями. Если ключ начинается на "!", то ставится !=
         :param operator: and или or;
-        :return: SQL DELETE.
+        :return: (DELETE str, параметры)
         """
-        result = 'DELETE from {table}'.format(table=table)
-
-        result += ' where '
-        for count, value in enumerate(where_delete):
-            if count:
-                result += ' ' + operator + ' '
-            if value.startswith('!'):
-                not_value = value.lstrip('!')
-                result += not_value + '!='
-            else:
-                result += value + '='
-            result += DBCheaters._type_conversion_sql(where_delete[value])
-        return result
+        return DBCheaters._delete_query(table, tuple(where_delete), operator), tuple(where_delete.values())
 
     @staticmethod
     def _construct_create_table(table_name: str) -> Optional[str]:
@@ -316,12 +431,56 @@ class DBCheaters:
         :param where: Словарь для условий where (param1=value1, param2=value2).
         """
         if isinstance(where, dict):
-            sql_query = self._construct_update(table=table,
-                                               set_params=set_params,
-                                               where_update=where,
-                                               operator=operate)
-            self._cursor.execute(sql_query)
-            self._connection.commit()
+            sql_query, sql_params = self._build_update(table=table,
+                                                       set_params=set_params,
+                                                       where_update=where,
+                                                       operator=operate)
+            self._cursor.execute(sql_query, sql_params)
+            self._commit()
+
+    def load_schema(self):
+        """
+        Метод (пере)читывает каталог схемы: имена колонок всех таблиц.
+        Вызывается при открытии БД после миграций. Если схема менялась в обход миграций - вызвать заново.
+        """
+        schema = {}
+        for table in self._tuple_list_to_list(self._cursor.execute(sql_requests.select_table_names).fetchall()):
+            fields = self._cursor.execute(sql_requests.select_row_names.format(table)).fetchall()
+            schema[table] = tuple(self._tuple_list_to_list(fields))
+        self.schema = schema
+
+    def _fields(self, table: str, what_select: str | List[str]) -> Tuple[str, ...]:
+        """
+        Метод возвращает имена колонок, которые вернет выборка: для '*' - из каталога схемы, без запроса к БД.
+
+        :param table: Имя таблицы.
+        :param what_select: Имена атрибутов (столбцов).
+        :return: Имена колонок по порядку.
+        """
+        if what_select == '*':
+            if table not in self.schema:
+                self.load_schema()
+            return self.schema[table]
+        if isinstance(what_select, str):
+            return what_select,
+        return tuple(what_select)
+
+    def _select_rows_from_table(self,
+                                table: str,
+                                what_select: str | List[str] = '*',
+                                where_select: dict = None,
+                                operate: Literal['and', 'or'] = 'and') -> List[sqlite3.Row]:
+        """
+        Выбор из таблицы строками sqlite3.Row: row['vk_id'] и row[0] работают одинаково, dict(row) - словарь.
+
+        :param table: Имя таблицы.
+        :param what_select: Имена атрибутов (столбцов). По умолчанию - все.
+        :param where_select: Условия.
+        :param operate: оператор между условиями (по умолчанию "и")
+        :return: Список строк из таблицы
+        """
+        sql_query, sql_params = self._build_select(table, what_select, where_select, operate)
+        return self._row_cursor.execute(sql_query, sql_params).fetchall()
 
     def _select_dict_from_table(self,
                                 table: str,
@@ -337,22 +496,10 @@ class DBCheaters:
         :param operate: оператор между условиями (по умолчанию "и")
         :return: Список словарей из таблицы
         """
-        result = []
-        sql_query = self._construct_select(table, what_select, where_select, operate)
-        sql_result = self._cursor.execute(sql_query).fetchall()
-        if what_select == '*':
-            fields_tuple = self._cursor.execute(sql_requests.select_row_names.format(table)).fetchall()
-            fields = self._tuple_list_to_list(fields_tuple)
-        elif isinstance(what_select, str):
-            fields = [what_select]
-        else:
-            fields = what_select
-        for count_row, row in enumerate(sql_result):
-            one_row = {}
-            for count, field in enumerate(fields):
-                one_row[field] = sql_result[count_row][count]
-            result.append(one_row)
-        return result
+        sql_query, sql_params = self._build_select(table, what_select, where_select, operate)
+        sql_result = self._cursor.execute(sql_query, sql_params).fetchall()
+        fields = self._fields(table, what_select)
+        return [dict(zip(fields, row)) for row in sql_result]
 
     def _select_list_from_table(self,
                                 table: str,
@@ -370,22 +517,8 @@ class DBCheaters:
         :param operate: оператор между условиями (по умолчанию "и")
         :return: Список списков из таблицы (без атрибутов таблицы)
         """
-        result = []
-        sql_query = self._construct_select(table, what_select, where_select, operate)
-        sql_result = self._cursor.execute(sql_query).fetchall()
-        if what_select == '*':
-            fields_tuple = self._cursor.execute(sql_requests.select_row_names.format(table)).fetchall()
-            fields = self._tuple_list_to_list(fields_tuple)
-        elif isinstance(what_select, str):
-            fields = [what_select]
-        else:
-            fields = what_select
-        for count_row, row in enumerate(sql_result):
-            one_row = []
-            for count, value in enumerate(fields):
-                one_row.append(sql_result[count_row][count])
-            result.append(one_row)
-        return result
+        sql_query, sql_params = self._build_select(table, what_select, where_select, operate)
+        return [list(row) for row in self._cursor.execute(sql_query, sql_params).fetchall()]
 
     def _insert_into_table(self, table: str, values: dict):
         """
@@ -394,9 +527,9 @@ class DBCheaters:
         :param table: Куда добавлять.
         :param values: Что добавлять.
         """
-        sql_query = self._construct_insert(table, values)
-        self._cursor.execute(sql_query)
-        self._connection.commit()
+        sql_query, sql_params = self._build_insert(table, values)
+        self._cursor.execute(sql_query, sql_params)
+        self._commit()
 
     def _delete_from_table(self, table: str, where_delete: dict):
         """
@@ -408,9 +541,71 @@ class DBCheaters:
         :return:
         """
         if isinstance(where_delete, dict):
-            sql_query = self._construct_delete(table, where_delete)
-            self._cursor.execute(sql_query)
-            self._connection.commit()
+            sql_query, sql_params = self._build_delete(table, where_delete)
+            self._cursor.execute(sql_query, sql_params)
+            self._commit()
+
+    def load_index(self):
+        """
+        Метод загружает всех кидал из БД в индекс в памяти (memory_index.CheatersIndex).
+        После этого поиск кидал идет по индексу, а методы записи обновляют его вместе с БД.
+        """
+        vk_ids = self._tuple_list_to_list(self._cursor.execute(sql_requests.select_all_cheater_vk_ids).fetchall())
+        index = memory_index.CheatersIndex()
+        index.load(self._get_cheaters_dict(vk_ids))
+        self.index = index
+        logger.info('Индекс кидал в памяти загружен, кидал: ' + str(len(index)))
+
+    def drop_index(self):
+        """
+        Метод выключает индекс в памяти: поиск снова идет через БД.
+        """
+        self.index = None
+
+    def _reindex(self, vk_ids: Iterable[str]):
+        """
+        Метод перечитывает из БД кидал с данными vk_id и обновляет их в индексе.
+        Если индекс выключен - ничего не делает.
+
+        :param vk_ids: Кого перечитать.
+        """
+        if self.index is None:
+            return
+        vk_ids = [vk_id for vk_id in dict.fromkeys(vk_ids) if vk_id]
+        found = self._get_cheaters_dict(vk_ids)
+        for vk_id in vk_ids:
+            if vk_id in found:
+                self.index.put(vk_id, found[vk_id])
+            else:
+                self.index.remove(vk_id)
+
+    def get_schema_version(self) -> int:
+        """
+        Метод возвращает номер версии схемы БД.
+        У БД, созданных до появления миграций, версия 0.
+
+        :return: Номер версии.
+        """
+        version = self.get_param(SCHEMA_VERSION_PARAM)
+        if version is None:
+            return 0
+        return int(version)
+
+    def _migrate(self):
+        """
+        Метод доводит схему БД до последней версии из sql_requests.migrations.
+        Применяются только миграции с номером больше текущей версии, после каждой версия сохраняется в parameters.
+        """
+        version = self.get_schema_version()
+        for number in sorted(sql_requests.migrations):
+            if number <= version:
+                continue
+            logger.info('Применяю миграцию схемы БД №' + str(number))
+            self._cursor.executescript(sql_requests.migrations[number])
+            self.del_param(SCHEMA_VERSION_PARAM)
+            self.add_param({SCHEMA_VERSION_PARAM: number})
+            version = number
+        logger.info('Версия схемы БД: ' + str(version))
 
     def _rename_bool_to_int(self):
         """
@@ -424,89 +619,50 @@ class DBCheaters:
     def delete_duplicates(self) -> dict:
         """
         Метод автоматически удаляет дубликаты из БД.
+        Полные дубликаты (см. sql_requests.duplicate_columns) удаляются одним DELETE на таблицу в одной транзакции,
+        из каждой группы остается первая запись. Новые полные дубликаты не появятся - на колонках уникальные индексы.
+        Время работы не зависит от числа групп дубликатов: по одному проходу по индексу на таблицу.
         Таблица vk_ids:
-          - не должно быть двух одинаковых vk_id, fifty.
           - если есть одинаковые vk_id и разные fifty - отдавать в словарь return
         Таблица screen_names:
-          - не должно быть одинаковых screen_name, changed=0, vk_id.
           - если есть одинаковые screen_name для разных vk_id - отдавать в словарь return
-        Таблица cards, telephones, proof_links:
-          - просто убить дубликаты.
         Возвращает словарь с vk_id, которые сам не смог обработать.
 
         :return {vk_id: [], screen_name: []}:
         """
-        # vk_ids
-        # Убиваем полные дубликаты
-        sql_result = self._cursor.execute(sql_requests.select_duplicate_vk_id).fetchall()
-        for row in sql_result:
-            # pk | vk_id | fifty | count
-            first_pk = row[0]
-            duplicate_id = row[1]
-            fifty = row[2]
-            sql_query = self._construct_delete('vk_ids', {'vk_id': duplicate_id,
-                                                          '!pk': first_pk,
-                                                          'fifty': fifty})
-            self._cursor.execute(sql_query)
-
-        # screen_names
-        sql_result = self._cursor.execute(sql_requests.select_duplicate_screen_names).fetchall()
-        for row in sql_result:
-            # pk | screen_name | vk_id | changed | count
-            first_pk = row[0]
-            duplicate_name = row[1]
-            vk_id = row[2]
-            changed = row[3]
-            self._delete_from_table('screen_names', {'screen_name': duplicate_name,
-                                                     '!pk': first_pk,
-                                                     'vk_id': vk_id,
-                                                     'changed': changed})
-
-        for attr in ('card', 'telephone', 'proof_link'):
-            sql_result = self._cursor.execute(sql_requests.select_duplicate_attr.format(attr=attr)).fetchall()
-            for row in sql_result:
-                # pk | attr | vk_id | count
-                first_pk = row[0]
-                duplicate_name = row[1]
-                sql_query = self._construct_delete(attr+'s', {attr: duplicate_name,
-                                                              '!pk': first_pk})
-                self._cursor.execute(sql_query)
-        self._connection.commit()
-
-        result = {}
-        sql_result = self._cursor.execute(sql_requests.select_duplicate_vk_id2).fetchall()
-        result['vk_id'] = []
-        for row in sql_result:
-            result['vk_id'].append(row[1])
-        sql_result = self._cursor.execute(sql_requests.select_duplicate_screen_names2).fetchall()
-        result['screen_name'] = []
-        for row in sql_result:
-            result['screen_name'].append(row[2])
-        sql_result = self._cursor.execute(sql_requests.select_duplicate_screen_names3).fetchall()
-        for row in sql_result:
-            result['screen_name'].append(row[2])
+        with self.transaction():
+            for table, columns in sql_requests.duplicate_columns.items():
+                self._cursor.execute(sql_requests.delete_duplicate_rows.format(table=table, columns=columns))
+        if self.index is not None:
+            self.load_index()
+
+        result = {'vk_id': [], 'screen_name': []}
+        for attr, vk_id, _ in self._cursor.execute(sql_requests.select_unresolved_duplicates).fetchall():
+            result[attr].append(vk_id)
+        for vk_ids in result.values():
+            vk_ids.sort()
         return result
 
-    def backup_db_file(self, backup_name: str = None):
+    def backup_db_file(self, backup_name: str = None, compression: str = '') -> str:
         """
-        Делает копию файла БД с добавлением текущей даты.
+        Делает копию БД (см. backup.backup_database) с добавлением текущей даты.
         Если передано имя - делает с этим именем.
 
         :param backup_name: Имя резервной БД.
+        :param compression: Сжатие копии (см. backup.COMPRESSIONS).
+        :return: Имя файла копии.
         """
-        if backup_name:
-            new_name = backup_name
-        else:
-            nowtime = datetime.datetime.now().isoformat(timespec='minutes')
-            new_name = (self.db_filename.rstrip('.db') + '_' + nowtime + '.db').replace(':', '-')
-        shutil.copyfile(self.db_filename, new_name)
+        if not backup_name:
+            backup_name = backup.backup_name(self.db_filename, compression=compression)
+        self._commit()
+        return backup.backup_database(self.db_filename, backup_name, compression)
 
     def get_param(self, param: str) -> Optional[str]:
         """
         Return parameter from table 'parameters'.
         """
-        sql_query = self._construct_select('parameters', ['value'], {'parameter': param})
-        self._cursor.execute(sql_query)
+        sql_query, sql_params = self._build_select('parameters', ['value'], {'parameter': param})
+        self._cursor.execute(sql_query, sql_params)
         result = self._cursor.fetchone()
         if not result:
             return None
@@ -519,9 +675,9 @@ class DBCheaters:
         Set parameter to table 'parameters'
         """
         for param in dict_params:
-            sql_query = self._construct_insert('parameters', {'parameter': param, 'value': dict_params[param]})
-            self._cursor.execute(sql_query)
-        self._connection.commit()
+            sql_query, sql_params = self._build_insert('parameters', {'parameter': param, 'value': dict_params[param]})
+            self._cursor.execute(sql_query, sql_params)
+        self._commit()
         return None
 
     def del_param(self, param: str):
@@ -530,9 +686,9 @@ class DBCheaters:
 
         :param param: параметр для удаления.
         """
-        sql_query = self._construct_delete('parameters', {'parameter': param})
-        self._cursor.execute(sql_query)
-        self._connection.commit()
+        sql_query, sql_params = self._build_delete('parameters', {'parameter': param})
+        self._cursor.execute(sql_query, sql_params)
+        self._commit()
 
     def check_the_existence(self, table: str, parameter_list: dict) -> bool:
         """
@@ -542,8 +698,10 @@ class DBCheaters:
         :param parameter_list: Словарь со значениями.
         :return: True or False
         """
-        sql_query = self._construct_select(table=table, what_select=list(parameter_list), where_select=parameter_list)
-        self._cursor.execute(sql_query)
+        sql_query, sql_params = self._build_select(table=table,
+                                                   what_select=list(parameter_list),
+                                                   where_select=parameter_list)
+        self._cursor.execute(sql_query, sql_params)
         result = bool(self._cursor.fetchall())
         return result
 
@@ -556,6 +714,7 @@ class DBCheaters:
                                     'vk_id': vk_id,
                                     'fifty': fifty
                                 })
+        self._reindex([vk_id])
 
     def add_screen_name(self, screen_name: str, vk_id='', changed: bool = False):
         """
@@ -567,6 +726,7 @@ class DBCheaters:
                                     'vk_id': vk_id,
                                     'changed': changed,
                                 })
+        self._reindex([vk_id])
 
     def add_telephones(self, telephones: str | List[str], vk_id: str = ''):
         """
@@ -580,6 +740,7 @@ class DBCheaters:
                                         'telephone': tel,
                                         'vk_id': vk_id,
                                     })
+        self._reindex([vk_id])
 
     def add_cards(self, cards: str | List[str], vk_id: str = ''):
         """
@@ -593,6 +754,7 @@ class DBCheaters:
                                         'card': card,
                                         'vk_id': vk_id,
                                     })
+        self._reindex([vk_id])
 
     def add_proof_links(self, proof_links:str | List[str], vk_id: str) -> None:
         """
@@ -609,6 +771,7 @@ class DBCheaters:
                                         'proof_link': link,
                                         'vk_id': vk_id,
                                     })
+        self._reindex([vk_id])
 
     def add_cheater(self, cheater: dict) -> None:
         """
@@ -624,18 +787,77 @@ class DBCheaters:
 
         :param cheater: Dict
         """
-        if cheater.get('vk_id'):
-            if cheater.get('fifty') is None:
-                cheater['fifty'] = False
-            self.add_vk_id(cheater['vk_id'], cheater['fifty'])
-        if cheater.get('screen_name'):
-            self.add_screen_name(cheater['screen_name'], cheater['vk_id'])
-        if cheater.get('telephone'):
-            self.add_telephones(cheater['telephone'], cheater['vk_id'])
-        if cheater.get('card'):
-            self.add_cards(cheater['card'], cheater['vk_id'])
-        if cheater.get('proof_link'):
-            self.add_proof_links(cheater['proof_link'], cheater['vk_id'])
+        # Все таблицы кидалы записываются одним commit.
+        with self.transaction():
+            if cheater.get('vk_id'):
+                if cheater.get('fifty') is None:
+                    cheater['fifty'] = False
+                self.add_vk_id(cheater['vk_id'], cheater['fifty'])
+            if cheater.get('screen_name'):
+                self.add_screen_name(cheater['screen_name'], cheater['vk_id'])
+            if cheater.get('telephone'):
+                self.add_telephones(cheater['telephone'], cheater['vk_id'])
+            if cheater.get('card'):
+                self.add_cards(cheater['card'], cheater['vk_id'])
+            if cheater.get('proof_link'):
+                self.add_proof_links(cheater['proof_link'], cheater['vk_id'])
+
+    def import_cheaters(self, cheaters_list: List[dict]) -> dict:
+        """
+        Метод добавляет в БД список кидал (как после разбора файла) одной транзакцией.
+        Кидала должен быть словарем:
+        cheater = {
+            'vk_id': str,
+            'fifty': bool,
+            'screen_name': str,
+            'telephone': [str],
+            'card': [str],
+            'proof_link': [str], (необязательно)
+        }
+        Уже существующие записи пропускаются (уникальные индексы + on conflict do nothing),
+        у существующих vk_id обновляется fifty (несколько строк одного vk_id сливаются в одну).
+
+        :param cheaters_list: Список кидал.
+        :return: {'inserted': добавлено строк, 'updated': обновлено fifty, 'skipped': уже было в БД}
+        """
+        vk_ids = []
+        rows = {
+            'screen_names': [],
+            'telephones': [],
+            'cards': [],
+            'proof_links': [],
+        }
+        for cheater in cheaters_list:
+            vk_id = cheater.get('vk_id')
+            if vk_id:
+                vk_ids.append((vk_id, bool(cheater.get('fifty'))))
+            if cheater.get('screen_name'):
+                rows['screen_names'].append((cheater['screen_name'], vk_id, False))
+            for attr in ('telephone', 'card', 'proof_link'):
+                for value in cheater.get(attr) or []:
+                    rows[attr + 's'].append((value, vk_id))
+
+        result = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        with self.transaction():
+            # У vk_id может быть строка с каждым значением fifty (add_vk_id такое допускает):
+            # лишние сливаются в первую, как в update_fifty, иначе обновление fifty упрется в уникальный индекс.
+            self._cursor.executemany(sql_requests.delete_vk_id_extra_rows, [(vk_id, vk_id) for vk_id, _ in vk_ids])
+            changes = self._connection.total_changes
+            self._cursor.executemany(sql_requests.update_fifty_if_changed,
+                                     [(fifty, vk_id, fifty) for vk_id, fifty in vk_ids])
+            result['updated'] = self._connection.total_changes - changes
+
+            changes = self._connection.total_changes
+            self._cursor.executemany(sql_requests.insert_vk_id_if_not_exists,
+                                     [(vk_id, fifty, vk_id) for vk_id, fifty in vk_ids])
+            for table, table_rows in rows.items():
+                columns = [column for column in DB_TEMPLATE[table] if column != 'pk']
+                self._cursor.executemany(self._insert_query(table, tuple(columns)), table_rows)
+            result['inserted'] = self._connection.total_changes - changes
+            self._reindex(cheater.get('vk_id') for cheater in cheaters_list)
+
+        result['skipped'] = len(vk_ids) + sum(len(table_rows) for table_rows in rows.values()) - result['inserted']
+        return result
 
     def get_cheater_id_list_by_param(self,
                                      fifty: bool = None,
@@ -699,39 +921,90 @@ class DBCheaters:
 
     def get_cheaters_full_list(self) -> List[cheaters.Cheater]:
         """
-        Метод возвращает список с объектами кидал.
+        Метод возвращает список с объектами кидал: сначала обычные, потом "полтинники", внутри - по vk_id.
+        Каждая таблица читается одним запросом, строки сливаются по vk_id, повторы в списках убираются.
 
         :return: Список кидал.
         """
-        vk_ids = self._cursor.execute(sql_requests.select_all_cheaters_full_info)
-        result_tuple = vk_ids.fetchall()
-        db_dict = {
-            '0': 'vk_id',
-            '1': 'screen_name',
-            '2': 'fifty',
-            '3': 'card',
-            '4': 'telephone',
-            '5': 'proof_link',
-        }
+        result = {}
+        for vk_id, fifty in self._cursor.execute(sql_requests.select_all_vk_ids_sorted).fetchall():
+            result[vk_id] = cheaters.Cheater(vk_id=vk_id, fifty=bool(fifty))
+
+        for vk_id, screen_name in self._cursor.execute(sql_requests.select_all_screen_names).fetchall():
+            cheater = result.get(vk_id)
+            if cheater is not None and cheater.screen_name is None:
+                cheater.screen_name = screen_name
+
+        for attr in ('telephone', 'card', 'proof_link'):
+            values = {}  # {vk_id: {значение: None}} - dict вместо set, чтобы сохранить порядок
+            for vk_id, value in self._cursor.execute(sql_requests.select_all_attr.format(attr=attr)).fetchall():
+                if vk_id in result and value:
+                    values.setdefault(vk_id, {})[value] = None
+            for vk_id, vk_id_values in values.items():
+                result[vk_id].get(attr).extend(vk_id_values)
+
+        return list(result.values())
+
+    def iter_cheaters(self) -> Iterator[cheaters.Cheater]:
+        """
+        Генератор всех кидал из таблицы vk_ids, сначала обычные, потом "полтинники", внутри - по vk_id.
+        vk_id читаются отдельным курсором по IN_CHUNK_SIZE, данные на каждую пачку добираются
+        через _get_cheaters_dict, так что в памяти не больше одной пачки.
+
+        :return: Кидалы по одному.
+        """
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(sql_requests.select_all_vk_ids_sorted)
+            while True:
+                rows = cursor.fetchmany(IN_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield from self._get_cheaters_dict([row[0] for row in rows]).values()
+        finally:
+            cursor.close()
+
+    def get_cheaters_by_ids(self, vk_ids: List[str]) -> List[cheaters.Cheater]:
+        """
+        Метод возвращает кидал с данными из БД по списку vk_id.
+        Если загружен индекс в памяти - кидалы берутся из него.
+        Порядок как в vk_ids, повторы и те, про кого в БД ничего нет, пропускаются.
+
+        :param vk_ids: Список user_id или group_id.
+        :return: Список кидал.
+        """
+        if self.index is not None:
+            found = (self.index.get(vk_id) for vk_id in dict.fromkeys(vk_ids) if vk_id)
+            return [cheater for cheater in found if cheater]
+        return list(self._get_cheaters_dict(vk_ids).values())
 
-        result = []
-        one_cheater = cheaters.Cheater()
-
-        for cheater_record in result_tuple:
-            if one_cheater.vk_id != cheater_record[0]:
-                if one_cheater:
-                    result.append(one_cheater)
-                one_cheater = cheaters.Cheater(
-                    vk_id=cheater_record[0],
-                    screen_name=cheater_record[1],
-                    fifty=bool(cheater_record[2])
-                )
-            for i in range(3, 6):  # 3 - cards, 4 - tel, 5 - proof
-                if cheater_record[i]:
-                    one_cheater.__getattribute__(db_dict[str(i)]).append(cheater_record[i])
-
-        result.append(one_cheater)
-        return result
+    def _get_cheaters_dict(self, vk_ids: List[str]) -> Dict[str, cheaters.Cheater]:
+        """
+        Метод читает кидал из БД по списку vk_id.
+        На каждую таблицу делается один запрос (на каждые IN_CHUNK_SIZE id), а не по запросу на таблицу на кидалу.
+
+        :param vk_ids: Список user_id или group_id.
+        :return: {vk_id: Cheater} в порядке vk_ids, без тех, про кого в БД ничего нет.
+        """
+        found = {vk_id: cheaters.Cheater() for vk_id in vk_ids if vk_id}
+        for placeholders, chunk in self._chunks_for_in(list(found)):
+            sql_query = sql_requests.select_vk_ids_by_ids.format(ids=placeholders)
+            for vk_id, fifty in self._cursor.execute(sql_query, chunk).fetchall():
+                if found[vk_id].vk_id is None:
+                    found[vk_id].vk_id = vk_id
+                    found[vk_id].fifty = bool(fifty)
+
+            sql_query = sql_requests.select_screen_names_by_ids.format(ids=placeholders)
+            for vk_id, screen_name in self._cursor.execute(sql_query, chunk).fetchall():
+                if found[vk_id].screen_name is None:
+                    found[vk_id].screen_name = screen_name
+
+            for attr in ('telephone', 'card', 'proof_link'):
+                sql_query = sql_requests.select_attr_by_ids.format(attr=attr, ids=placeholders)
+                for vk_id, value in self._cursor.execute(sql_query, chunk).fetchall():
+                    found[vk_id].get(attr).append(value)
+
+        return {vk_id: cheater for vk_id, cheater in found.items() if cheater}
 
     def get_dict_from_table(self, table: str, columns: list, condition_dict: dict = None) -> Optional[List[dict]]:
         """
@@ -740,8 +1013,8 @@ class DBCheaters:
 
         :return: Список словарей с результатами or None.
         """
-        sql_query = self._construct_select(table=table, what_select=columns, where_select=condition_dict)
-        self._cursor.execute(sql_query)
+        sql_query, sql_params = self._build_select(table=table, what_select=columns, where_select=condition_dict)
+        self._cursor.execute(sql_query, sql_params)
         query_result = self._cursor.fetchall()
         if query_result:
             result = []
@@ -771,39 +1044,33 @@ class DBCheaters:
         """
         # vk_ids
         sql_result = self._cursor.execute(sql_requests.select_publics).fetchall()
-        for item in sql_result:
-            id_num = item[0].lstrip('public')
-            self._update_table('vk_ids', {'vk_id': 'club' + id_num}, {'vk_id': item[0]})
-        # screen_names
-        sql_result = self._cursor.execute(sql_requests.select_publics_from_table.format('screen_names')).fetchall()
-        for item in sql_result:
-            id_num = item[0].lstrip('public')
-            self._update_table('screen_names', {'vk_id': 'club' + id_num}, {'vk_id': item[0]})
-        self._connection.commit()
+        with self.transaction():
+            for item in sql_result:
+                id_num = item[0].lstrip('public')
+                # Если club уже есть с тем же fifty - записи сливаются: club удаляется, public становится им.
+                self._cursor.execute(sql_requests.delete_vk_id_merged_into, ('club' + id_num, item[0]))
+                self._update_table('vk_ids', {'vk_id': 'club' + id_num}, {'vk_id': item[0]})
+            # screen_names
+            sql_result = self._cursor.execute(
+                sql_requests.select_publics_from_table.format('screen_names')).fetchall()
+            for item in sql_result:
+                id_num = item[0].lstrip('public')
+                self._cursor.execute(sql_requests.delete_screen_names_merged_into, ('club' + id_num, item[0]))
+                self._update_table('screen_names', {'vk_id': 'club' + id_num}, {'vk_id': item[0]})
+        if self.index is not None:
+            self.load_index()
 
     def delete_duplicate(self):
         """
         Метод удаляет из таблиц vk_ids и screen_names дубликаты.
+        В vk_ids остается первая запись про каждый vk_id, в screen_names - про каждый screen_name.
         """
-        # vk_ids
-        sql_result = self._cursor.execute(sql_requests.select_duplicate_vk_id).fetchall()
-        for row in sql_result:
-            # pk | vk_id | fifty | count
-            first_pk = row[0]
-            duplicate_id = row[1]
-            sql_query = self._construct_delete('vk_ids', {'vk_id': duplicate_id, '!pk': first_pk})
-            self._cursor.execute(sql_query)
-
-        # screen_names
-        sql_result = self._cursor.execute(sql_requests.select_duplicate_screen_names).fetchall()
-        for row in sql_result:
-            # pk | screen_name | vk_id | changed | count
-            first_pk = row[0]
-            duplicate_name = row[1]
-            sql_query = self._construct_delete('screen_names', {'screen_name': duplicate_name, '!pk': first_pk})
-            self._cursor.execute(sql_query)
-
-        self._connection.commit()
+        with self.transaction():
+            self._cursor.execute(sql_requests.delete_duplicate_rows.format(table='vk_ids', columns='vk_id'))
+            self._cursor.execute(sql_requests.delete_duplicate_rows.format(table='screen_names',
+                                                                           columns='screen_name'))
+        if self.index is not None:
+            self.load_index()
 
     def delete_cheater(self, vk_id: str):
         """
@@ -836,6 +1103,8 @@ class DBCheaters:
         # Если таки есть новое имя - назначаем.
         if screen_name:
             self.add_screen_name(screen_name, vk_id)
+        else:
+            self._reindex([vk_id])
 
     def update_fifty(self, vk_id: str, fifty: bool = None):
         """
@@ -844,9 +1113,118 @@ class DBCheaters:
         :param vk_id: id Вконтакте.
         :param fifty: Новый параметр.
         """
-        if fifty:
-            self._update_table('vk_ids', {'fifty': fifty}, {'vk_id': vk_id})
-        else:
+        if not fifty:
             vk_info = self.get_dict_from_table('vk_ids', ['fifty'], {'vk_id': vk_id})
-            old_fifty = vk_info[0]['fifty']
-            self._update_table('vk_ids', {'fifty': not old_fifty}, {'vk_id': vk_id})
+            fifty = not vk_info[0]['fifty']
+        with self.transaction():
+            # У vk_id одно значение fifty: остальные строки (например, с другим fifty) сливаются в первую.
+            self._cursor.execute(sql_requests.delete_vk_id_extra_rows, (vk_id, vk_id))
+            self._update_table('vk_ids', {'fifty': fifty}, {'vk_id': vk_id})
+        self._reindex([vk_id])
+
+    def load_states(self, since: float) -> List[tuple]:
+        """
+        Метод читает сохраненные состояния диалогов (см. state_storage), которые менялись не раньше since.
+
+        :param since: time.time(), старее которого состояния не нужны.
+        :return: [(peer_id, state, payload json, updated)]
+        """
+        return self._cursor.execute(sql_requests.select_states, (since,)).fetchall()
+
+    def save_states(self, states: List[tuple], deleted_peer_ids: Iterable[int] = ()):
+        """
+        Метод одной транзакцией записывает состояния диалогов и удаляет сброшенные.
+
+        :param states: [(peer_id, state, payload json, updated)]
+        :param deleted_peer_ids: Чьи состояния удалить.
+        """
+        with self.transaction():
+            self._cursor.executemany(sql_requests.upsert_state, states)
+            self._cursor.executemany(sql_requests.delete_state, [(peer_id,) for peer_id in deleted_peer_ids])
+
+    def delete_expired_states(self, before: float) -> int:
+        """
+        Метод удаляет состояния диалогов, которые не менялись с before.
+
+        :param before: time.time() границы.
+        :return: Сколько удалено.
+        """
+        self._cursor.execute(sql_requests.delete_expired_states, (before,))
+        self._commit()
+        return self._cursor.rowcount
+
+    def add_broadcast(self, message: str, admin_peer_id: int, total: int = 0) -> int:
+        """
+        Метод заводит в БД новую рассылку (см. broadcast).
+
+        :param message: Текст рассылки.
+        :param admin_peer_id: Кто запустил (ему идут отчеты).
+        :param total: Сколько получателей.
+        :return: pk рассылки.
+        """
+        self._cursor.execute(sql_requests.insert_broadcast, (message, admin_peer_id, total, time.time()))
+        self._commit()
+        return self._cursor.lastrowid
+
+    def update_broadcast(self, pk: int, total: int, sent: int, failed: int, last_peer_id: int):
+        """
+        Метод сохраняет ход рассылки.
+
+        :param pk: pk рассылки.
+        :param total: Сколько всего получателей.
+        :param sent: Сколько отправлено.
+        :param failed: Скольким не доставлено.
+        :param last_peer_id: До какого id (по возрастанию) отправлено.
+        """
+        self._cursor.execute(sql_requests.update_broadcast, (total, sent, failed, last_peer_id, time.time(), pk))
+        self._commit()
+
+    def finish_broadcast(self, pk: int):
+        """
+        Метод помечает рассылку законченной.
+
+        :param pk: pk рассылки.
+        """
+        self._cursor.execute(sql_requests.finish_broadcast, (time.time(), pk))
+        self._commit()
+
+    def get_unfinished_broadcasts(self) -> List[tuple]:
+        """
+        Метод возвращает незаконченные рассылки (например, прерванные рестартом).
+
+        :return: [(pk, message, admin_peer_id, total, sent, failed, last_peer_id)]
+        """
+        return self._cursor.execute(sql_requests.select_unfinished_broadcasts).fetchall()
+
+    def get_resolved_pages(self, names: List[str]) -> Dict[str, tuple]:
+        """
+        Метод возвращает из кеша поиска страниц то, что уже находили через API (см. vkbot.VKBot.resolve_pages).
+
+        :param names: Что искали: id123, club123 или screen_name (в нижнем регистре).
+        :return: {name: (page_type, page_id, screen_name, title, banned, fetched)}
+        """
+        result = {}
+        for placeholders, chunk in self._chunks_for_in(list(names)):
+            for name, *page in self._cursor.execute(sql_requests.select_resolved_pages.format(ids=placeholders), chunk):
+                result[name] = tuple(page)
+        return result
+
+    def save_resolved_pages(self, pages: List[tuple]):
+        """
+        Метод одной транзакцией записывает в кеш поиска страниц ответы API.
+
+        :param pages: [(name, page_type, page_id, screen_name, title, banned, fetched)]
+        """
+        with self.transaction():
+            self._cursor.executemany(sql_requests.upsert_resolved_page, pages)
+
+    def delete_resolved_pages(self, before: float) -> int:
+        """
+        Метод удаляет из кеша поиска страниц записи, полученные раньше before.
+
+        :param before: time.time() границы.
+        :return: Сколько удалено.
+        """
+        self._cursor.execute(sql_requests.delete_resolved_pages_before, (before,))
+        self._commit()
+        return self._cursor.rowcount
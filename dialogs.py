@@ -45,7 +45,12 @@ cheater_story_to_admin = 'Пользователь vk.com/{} хочет поде
 admin_menu = 'Ты в админском меню.'
 return_to_main = 'Ты на главной.'
 spam_header = 'Напиши текст, который ты хочешь разослать всем членам группы.'
-spam_send = 'Сейчас отправляю(нет) всем текст:\n'
+spam_send = 'Начинаю рассылку всем членам группы. Буду присылать отчеты о ходе. Текст:\n'
+spam_busy = 'Уже идет другая рассылка. Дождись ее окончания.'
+spam_progress = 'Рассылка: отправлено {} из {}, {:.1f} сообщений в секунду, осталось примерно {}.'
+spam_done = 'Рассылка закончена: доставлено {} из {}, не доставлено {}.'
+spam_resumed = 'Бот перезапускался: продолжаю незаконченную рассылку с того же места.'
+spam_error = 'Рассылка прервана из-за ошибки. Она продолжится с того же места после перезапуска бота.'
 
 add_cheater_id = 'Введи адрес страницы, телефон, номер карты или ссылку на стену. ' \
                  'Если хочешь добавить полтиника - введи 50.' \
@@ -77,7 +82,9 @@ admin_help = """
 В этом меню можно  добавить/удалить кидалу, разослать всем что-то.
 Можно воспользоваться одной из команд:
 !help !помощь - помощь
-!export !экспорт - получить текстовый файл с кидалами"""
+!export !экспорт - получить текстовый файл с кидалами
+!export csv, !export jsonl - то же в другом формате"""
+export_unknown_format = 'Не знаю такой формат. Есть: {}.'
 
 # Заготовки для развернутых ответов. -----------------------------------------------------------------------------------
 cheaters_card = """
@@ -102,3 +109,10 @@ cheaters_group = 'Группа vk.com/{group} есть в наших базах.
 update_db_from_file = 'Ты решил обновить БД через файл. Жди, пожалуйста.'
 no_data_in_file = 'В файле нет нужных данных.'
 file_update_success = 'БД обновлена!'
+file_update_started = 'Импорт идет в фоне, я напишу, когда закончу.'
+file_update_busy = 'Уже идет импорт другого файла, подожди, пока он закончится.'
+file_update_progress = 'Проверено страниц: {} из {}'
+file_download_error = 'Не получилось скачать файл, попробуй еще раз.'
+file_update_error = 'Импорт сломался, подробности в логе.'
+too_many_requests = 'ВК говорит, что слишком много запросов, повтори через полчаса.'
+file_update_stats = 'Добавлено записей: {inserted}, обновлено: {updated}, уже были в базе: {skipped}.'
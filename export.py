@@ -0,0 +1,93 @@
+"""
+Экспорт кидал в файл.
+Кидалы идут генератором (DBCheaters.iter_cheaters) и пишутся в файл по одному,
+поэтому память на экспорт не растет вместе с БД.
+"""
+import dataclasses
+import json
+import os
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator
+
+from cheaters import Cheater
+
+# Строки перед "полтинниками" в текстовом экспорте. Строку fifty понимает импорт из файла.
+FIFTY_HEADER = '\nDalee idut poltinniky: realnye prodavcy - rabotayut, kak povezet.\nfifty\n'
+# Кодировка файла экспорта.
+EXPORT_ENCODING = 'utf-8'
+
+
+def iter_text(cheaters_iter: Iterable[Cheater]) -> Iterator[str]:
+    """
+    Текстовый формат (как файл для импорта): кидалы через Cheater.str_lines, "полтинники" после FIFTY_HEADER.
+    Кидалы должны идти отсортированными по fifty.
+
+    :param cheaters_iter: Кидалы.
+    :return: Строки файла.
+    """
+    fifty = False
+    for cheater in cheaters_iter:
+        if cheater.fifty and not fifty:
+            yield FIFTY_HEADER
+            fifty = True
+        yield cheater.str_lines() + '\n'
+
+
+def iter_csv(cheaters_iter: Iterable[Cheater]) -> Iterator[str]:
+    """
+    CSV через Cheater.str_csv.
+
+    :param cheaters_iter: Кидалы.
+    :return: Строки файла.
+    """
+    for cheater in cheaters_iter:
+        yield cheater.str_csv()
+
+
+def iter_jsonl(cheaters_iter: Iterable[Cheater]) -> Iterator[str]:
+    """
+    JSON Lines: один кидала - один json-объект в строке.
+
+    :param cheaters_iter: Кидалы.
+    :return: Строки файла.
+    """
+    for cheater in cheaters_iter:
+        yield json.dumps(dataclasses.asdict(cheater), ensure_ascii=False) + '\n'
+
+
+# Форматы экспорта: {расширение файла: генератор строк}.
+EXPORT_FORMATS: Dict[str, Callable[[Iterable[Cheater]], Iterator[str]]] = {
+    'txt': iter_text,
+    'csv': iter_csv,
+    'jsonl': iter_jsonl,
+}
+
+
+def register_format(extension: str, formatter: Callable[[Iterable[Cheater]], Iterator[str]]):
+    """
+    Добавляет формат экспорта.
+
+    :param extension: Расширение файла, по нему формат выбирается в export_to_file.
+    :param formatter: Генератор, который превращает кидал в строки файла.
+    """
+    EXPORT_FORMATS[extension] = formatter
+
+
+def export_to_file(cheaters_iter: Iterable[Cheater], export_format: str = 'txt') -> str:
+    """
+    Функция пишет кидал во временный файл в нужном формате.
+    Удалить файл после использования должен вызывающий.
+
+    :param cheaters_iter: Кидалы (лучше генератором).
+    :param export_format: Формат из EXPORT_FORMATS.
+    :return: Путь к файлу.
+    """
+    formatter = EXPORT_FORMATS[export_format]
+    file_descriptor, path = tempfile.mkstemp(suffix='.' + export_format, prefix='export_')
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding=EXPORT_ENCODING, newline='') as file:
+            file.writelines(formatter(cheaters_iter))
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
@@ -2,8 +2,11 @@
 Main bot file.
 python3 main.py [config_filename.json]
 """
-import re
+import asyncio
+import os
 import shutil
+import time
+from typing import Tuple
 
 from vkbottle.bot import Message
 from vkbottle.dispatch.rules.base import (
@@ -14,16 +17,20 @@ from vkbottle.dispatch.rules.base import (
     StateGroupRule,
     FromPeerRule,
 )
-from vkbottle import DocMessagesUploader
+from vkbottle import GroupEventType
 from dialogstates import DialogStates, AdminStates
 
+import backup
+import callback_server
 import cheaters
 import startup
+import state_storage
 import dialogs
+import export
 import vk_keyboards
 import vkbot
 
-from CustomRules import AdminUserRule
+from CustomRules import AdminUserRule, CheaterSearchRule
 
 
 def main():
@@ -40,7 +47,14 @@ def main():
     start_bot(
         db_filename=startup_parameters['db_filename'],
         vk_token=startup_parameters['vk_token'],
-        cheaters_filename=startup_parameters['cheaters_filename']
+        cheaters_filename=startup_parameters['cheaters_filename'],
+        admins_cache_ttl=startup_parameters['admins_cache_ttl'],
+        use_memory_index=startup_parameters['memory_index'],
+        db_pragmas=startup_parameters['db_pragmas'],
+        backup_settings=backup.BackupSettings(**startup_parameters['backup']),
+        state_ttl=startup_parameters['state_ttl'],
+        callback_settings=callback_server.CallbackSettings(**startup_parameters['callback']),
+        profile_cache_ttl=startup_parameters['profile_cache_ttl'],
     )
 
 
@@ -49,7 +63,7 @@ async def bot_load(bot: vkbot.VKBot):
     Метод стартует при начале работы бота.
     """
     await bot.get_async_params()
-    wrong_id = bot.db.delete_duplicates()
+    wrong_id = await bot.db.delete_duplicates()
     for vk_id in wrong_id['screen_name']:
         if vk_id:
             await bot.update_db_screen_name(vk_id)
@@ -57,22 +71,63 @@ async def bot_load(bot: vkbot.VKBot):
             wrong_id['vk_id'].append(vk_id)
     if wrong_id['vk_id']:
         await bot.send_message_to_admins(dialogs.wrong_id + str(wrong_id['vk_id']))
+    if bot.use_memory_index:
+        await bot.db.load_index()
+    # Устаревшие записи кеша поиска страниц все равно не используются.
+    await bot.db.delete_resolved_pages(time.time() - vkbot.RESOLVE_CACHE_TTL)
 
 
-def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
+async def bot_shutdown(bot: vkbot.VKBot):
+    """
+    Метод стартует при остановке бота: дописывает в БД состояния диалогов и закрывает БД.
+    """
+    await bot.state_dispenser.flush()
+    # Закрытие ждет запросы из очереди потока БД: не блокируем цикл событий.
+    await asyncio.to_thread(bot.db.close)
+
+
+def start_bot(db_filename: str, vk_token: str, cheaters_filename: str,
+              admins_cache_ttl: float = vkbot.ADMINS_CACHE_TTL, use_memory_index: bool = False,
+              db_pragmas: dict = None, backup_settings: backup.BackupSettings = None,
+              state_ttl: float = state_storage.STATE_TTL,
+              callback_settings: callback_server.CallbackSettings = None,
+              profile_cache_ttl: float = vkbot.PROFILE_CACHE_TTL):
     """
     Запускает бота.
 
     :param db_filename: имя файла БД.
     :param vk_token: Токен.
     :param cheaters_filename: Имя файла для парсинга кидал.
+    :param admins_cache_ttl: Сколько секунд живет кеш админов группы.
+    :param use_memory_index: Искать кидал по индексу в памяти, а не через БД.
+    :param db_pragmas: Настройки соединения с БД (см. database.DEFAULT_PRAGMAS).
+    :param backup_settings: Настройки резервного копирования БД.
+    :param state_ttl: Сколько секунд хранится состояние диалога, которое не менялось.
+    :param callback_settings: Настройки Callback API. Если порт не задан - работаем через long polling.
+    :param profile_cache_ttl: Сколько секунд живет профиль пользователя в кеше.
     """
 
     bot = vkbot.VKBot(
         vk_token,
         db_filename,
         cheaters_filename,
+        admins_cache_ttl,
+        use_memory_index,
+        db_pragmas,
+        backup_settings,
+        state_ttl,
+        profile_cache_ttl=profile_cache_ttl,
     )
+    print('Настройки БД:', bot.db.pragmas)
+
+    # В группе поменялись руководители - сбрасываем кеш админов.
+    @bot.on.raw_event(GroupEventType.GROUP_OFFICERS_EDIT, dict)
+    async def group_officers_edit_handler(event: dict):
+        """
+        Изменение списка руководителей группы.
+        """
+        bot.invalidate_group_admins()
+        await bot.get_group_admins()
 
     # Кнопка "Рассказать про кидалу".
     @bot.on.message(
@@ -132,16 +187,12 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         """
         Рассказ про кидалу. Пользователь прислал историю.
         """
-        users_info = await bot.api.users.get([message.from_id], fields=['screen_name'])
+        profile = await bot.get_user_profile(message.from_id)
 
         # Отправляем историю админам.
-        message_text = dialogs.cheater_story_to_admin.format(str(users_info[0].screen_name))
-        await bot.api.messages.send(
-            message=message_text,
-            user_ids=await bot.get_group_admins(),
-            forward_messages=message.id,
-            random_id=0,
-        )
+        screen_name = profile.screen_name if profile else 'id' + str(message.from_id)
+        message_text = dialogs.cheater_story_to_admin.format(str(screen_name))
+        await bot.send_message_to_admins(message_text, message.id)
 
         # отвечаем вопрошающему
         answer_message = dialogs.thanks
@@ -156,8 +207,8 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         Приветствие.
         Парсит слова "привет" в русской и английской раскладке, "начать".
         """
-        users_info = await bot.api.users.get([message.from_id])
-        answer_message = dialogs.hello.format(users_info[0].first_name)
+        profile = await bot.get_user_profile(message.from_id)
+        answer_message = dialogs.hello.format(profile.first_name if profile else '')
         await bot.answer_to_peer(answer_message, message.peer_id)
 
     # Кинули файл с кидалами.
@@ -185,26 +236,28 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         3215321532159999
         """
         if message.attachments[0].doc.title == bot.cheaters_filename:
-            await message.answer(dialogs.update_db_from_file)
             attachments_url = message.attachments[0].doc.url
-            answer_message = await bot.update_cheaters_from_file(attachments_url)
-            await bot.answer_to_peer(answer_message, message.peer_id)
+            # Импорт идет в фоне, результат бот пришлет сам.
+            if bot.start_update_cheaters_from_file(attachments_url, message.peer_id):
+                await bot.outbox.send(message.peer_id,
+                                      dialogs.update_db_from_file + '\n' + dialogs.file_update_started)
+            else:
+                await bot.outbox.send(message.peer_id, dialogs.file_update_busy)
         else:
             return 'Не бросайся файлами, я такие не ем.'
 
     # Ловим кидалу.
     @bot.on.message(
-        func=lambda message: bool(re.match(cheaters.get_regexp('search'),
-                                           message.text.lower().lstrip('+').replace(' ', ''))),
+        CheaterSearchRule('search'),
         state=None
     )
-    async def check_cheater_handler(message: Message):
+    async def check_cheater_handler(message: Message, cheater_match: cheaters.CheaterMatch):
         """
         Главное меню. Если пользователь присылает что-то похожее на ссылку vk, карту, телефон, то пробуем ему помочь.
+        Совпадение уже нашел CheaterSearchRule.
         """
         answer_message = ''
-        reg_match = re.search(cheaters.get_regexp('search'), message.text.lower().lstrip('+').replace(' ', ''))
-        cheaters_db = bot.get_cheater_from_db2(reg_match.lastgroup, reg_match[reg_match.lastgroup])
+        cheaters_db = await bot.get_cheater_from_db2(cheater_match.group, cheater_match.value)
         if isinstance(cheaters_db, list):
             for cheater in cheaters_db:
                 answer_message += str(cheater)
@@ -224,7 +277,8 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         """
         answer_message = bot.group_id
         keyboard = vk_keyboards.get_keyboard(None, await bot.is_admin(message.from_id))
-        await message.answer(
+        await bot.outbox.send(
+            message.peer_id,
             answer_message,
             keyboard=keyboard,
         )
@@ -243,7 +297,8 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         answer_message = str(group_id) + '\n'
         answer_message += ' '.join(str(vk_id) for vk_id in members.items)
         keyboard = vk_keyboards.get_keyboard(None, await bot.is_admin(message.from_id))
-        await message.answer(
+        await bot.outbox.send(
+            message.peer_id,
             answer_message,
             keyboard=keyboard,
         )
@@ -261,7 +316,8 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
             answer_message = answer_message.state
         else:
             answer_message = str(answer_message)
-        await message.answer(
+        await bot.outbox.send(
+            message.peer_id,
             answer_message,
         )
 
@@ -271,13 +327,27 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
     )
     async def debug_get_admins_handler(message: Message):
         """
-        Вывести админов группы.
+        Вывести админов группы. Список перечитывается из API.
         """
+        bot.invalidate_group_admins()
         answer_message = await bot.get_group_admins()
-        await message.answer(
+        await bot.outbox.send(
+            message.peer_id,
             str(answer_message),
         )
 
+    @bot.on.message(
+        AdminUserRule(bot),
+        CommandRule("outbox"),
+    )
+    async def debug_get_outbox_metrics_handler(message: Message):
+        """
+        Вывести метрики очереди исходящих сообщений.
+        """
+        metrics = bot.outbox.metrics()
+        answer_message = '\n'.join(name + ': ' + str(value) for name, value in metrics.items())
+        await bot.outbox.send(message.peer_id, answer_message)
+
     @bot.on.message(
         AdminUserRule(bot),
         CommandRule('main'),
@@ -298,8 +368,8 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         """
         Метод меняет все public на club в БД.
         """
-        bot.backup_db('cheaters_public_bak.db')
-        bot.public_to_club()
+        await bot.backup_db('cheaters_public_bak.db')
+        await bot.public_to_club()
         return 'Обновил'
 
     # Админское меню ------------------------------------------------------------------------------------------------
@@ -353,8 +423,6 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         Кнопка "Передумал". Для всех.
         """
         new_state = AdminStates.MAIN
-        if message.state_peer:
-            message.state_peer.payload.clear()
         answer_message = dialogs.admin_menu
         await bot.answer_to_peer(answer_message, message.from_id, new_state)
 
@@ -368,12 +436,11 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         Начало рассылки всем членам группы.
         """
         new_state = AdminStates.MAIN
-        # Выбираем всех пользователей. Я знаю, что комментировать код - плохо.
-        # Пока эта тема не в приоритете.
-        # group_info = await bot.api.groups.get_by_id()
-        # group_id = group_info[0].id
-        # members = await bot.api.groups.get_members(group_id=group_id)
-        answer_message = dialogs.spam_send + message.text
+        # Рассылка идет в фоне, о ходе бот сам пишет админу (см. broadcast.Broadcaster).
+        if bot.broadcaster.start(bot.group_id, message.text, message.from_id):
+            answer_message = dialogs.spam_send + message.text
+        else:
+            answer_message = dialogs.spam_busy
         await bot.answer_to_peer(answer_message, message.from_id, new_state)
 
     @bot.on.message(
@@ -417,12 +484,13 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         if cheater:
             if cheater.get('vk_id'):
                 answer_message = 'Добавляю кидалу\n' + str(cheater)
-                await message.answer(answer_message)
-                update = bot.add_cheater(cheater, cheater_db)
-                await message.answer(
+                await bot.outbox.send(message.peer_id, answer_message)
+                update = await bot.add_cheater(cheater, cheater_db)
+                await bot.outbox.send(
+                    message.peer_id,
                     message='Добавил(обновил) следующие поля\n' + str(update),
                 )
-                message.state_peer.payload.clear()
+                await bot.state_dispenser.set(message.from_id, message.state_peer.state)
             else:
                 return 'Нужен vk_id.'
         else:
@@ -437,36 +505,32 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         Удаление кидалы. Парсим текст для удаления.
         """
         # Парсим строчку.
-        reg_match = re.search(cheaters.get_regexp('del'), message.text)
+        reg_match = cheaters.search_regexp(message.text, 'del')
         if reg_match:
-            cheaters_to_del = bot.get_cheater_from_db2(reg_match.lastgroup, reg_match[reg_match.lastgroup])
+            cheaters_to_del = await bot.get_cheater_from_db2(reg_match.group, reg_match.value)
         else:
             return dialogs.dont_understand
 
         if cheaters_to_del:
             if len(cheaters_to_del) == 1:
-                match reg_match.lastgroup:
+                match reg_match.group:
                     case 'vk_id' | 'group_id' | 'screen_name':
                         answer_message = dialogs.del_cheater_user_commit.format(str(cheaters_to_del[0]))
                     case 'card' | 'telephone' | 'proof_link':
-                        answer_message = dialogs.del_cheater_item_commit.format(reg_match.lastgroup,
+                        answer_message = dialogs.del_cheater_item_commit.format(reg_match.group,
                                                                                 str(cheaters_to_del[0]))
                     case _:
                         return dialogs.dont_understand
                 new_state = AdminStates.DEL_CHEATER_COMMIT
-                bot.state_dispenser.set(message.from_id,
-                                        new_state,
-                                        cheaters_to_del=cheaters_to_del,
-                                        item_to_del={reg_match.lastgroup: reg_match})
-                await bot.answer_to_peer(answer_message, message.from_id, new_state)
+                await bot.answer_to_peer(answer_message, message.from_id, new_state,
+                                         cheaters_to_del=cheaters_to_del,
+                                         item_to_del={reg_match.group: reg_match.value})
             elif len(cheaters_to_del) > 1:
                 new_state = AdminStates.DEL_CHEATER_CHOICE
                 answer_message = dialogs.del_cheater_choice
-                bot.state_dispenser.set(message.from_id,
-                                        new_state,
-                                        cheaters_to_del=cheaters_to_del,
-                                        item_to_del={reg_match.lastgroup: reg_match})
-                await bot.answer_to_peer(answer_message, message.from_id, new_state)
+                await bot.answer_to_peer(answer_message, message.from_id, new_state,
+                                         cheaters_to_del=cheaters_to_del,
+                                         item_to_del={reg_match.group: reg_match.value})
         else:
             return dialogs.del_cheater_not_found
 
@@ -483,13 +547,12 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         match list(item_to_del.keys())[0]:
             case 'vk_id' | 'group_id' | 'screen_name':
                 for cheater in cheaters_to_del:
-                    bot.delete_cheater(list(item_to_del.keys())[0])
+                    await bot.delete_cheater(list(item_to_del.keys())[0])
             case 'card' | 'telephone' | 'proof_link':
                 for cheater in cheaters_to_del:
-                    bot.delete_cheater_item(list(item_to_del.keys())[0], list(item_to_del.keys())[0], cheater.vk_id)
+                    await bot.delete_cheater_item(list(item_to_del.keys())[0], list(item_to_del.keys())[0],
+                                                  cheater.vk_id)
         new_state = AdminStates.DEL_CHEATER
-        bot.state_dispenser.set(message.from_id, new_state)
-        message.state_peer.payload.clear()
         answer_message = 'Удалили (нет)'
         await bot.answer_to_peer(answer_message, message.from_id, new_state)
 
@@ -502,8 +565,6 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         Не удаляем.
         """
         new_state = AdminStates.DEL_CHEATER
-        bot.state_dispenser.set(message.from_id, new_state)
-        message.state_peer.payload.clear()
         answer_message = 'Ок, не удаляем.'
         await bot.answer_to_peer(answer_message, message.from_id, new_state)
 
@@ -521,31 +582,31 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         cheater_db = message.state_peer.payload.get('cheater_db')  # кидала из БД
 
         formatted_message_text = message.text.lower().replace(' ', '').split('\n')
-        regexp = cheaters.get_regexp('all')
         #  При разборе выражения будет учитываться только первый vk_id/screen_name
         id_found = False  # Если в присланном пользователе тексте нашелся id, то значение станет True
         #  Если ничего не распарсится, надо вывести предупреждение
         no_result = True
 
         for line in formatted_message_text:
-            reg_match = re.match(regexp, line)
+            reg_match = cheaters.match_regexp(line, 'all')
 
             # Собираем параметры из API (если надо).
-            if not id_found and reg_match and (reg_match.lastgroup in ('vk_id', 'group_id', 'screen_name')):
+            if not id_found and reg_match and (reg_match.group in ('vk_id', 'group_id', 'screen_name')):
                 # Если в запросе vk_id или screen_name - запрашиваем vk_api.
-                match reg_match.lastgroup:
+                match reg_match.group:
                     case 'vk_id' | 'group_id':
-                        search_name = cheaters.PREFIX[reg_match.lastgroup] + reg_match[reg_match.lastgroup]
+                        search_name = cheaters.PREFIX[reg_match.group] + reg_match.value
                     case _:
-                        search_name = reg_match[reg_match.lastgroup]
+                        search_name = reg_match.value
                 api_vk_id, api_screen_name, is_banned, vk_name = await bot.get_from_api_id_screen_name_banned(
                     search_name)
                 # Если пользователь/группа забанены - выводим предупреждение, чтоб не пугаться пустого screen_name.
-                if reg_match.lastgroup == 'screen_name' and api_screen_name:
-                    await message.answer(f'Это имя @{api_screen_name} принадлежит пользователю(сообществу) @{api_vk_id}.'
-                                         f'Если нужен другой - придется найти его старый id.')
+                if reg_match.group == 'screen_name' and api_screen_name:
+                    await bot.outbox.send(message.peer_id,
+                                          f'Это имя @{api_screen_name} принадлежит пользователю(сообществу) '
+                                          f'@{api_vk_id}. Если нужен другой - придется найти его старый id.')
                 if is_banned:
-                    await message.answer(dialogs.add_cheater_id_delete.format(api_vk_id))
+                    await bot.outbox.send(message.peer_id, dialogs.add_cheater_id_delete.format(api_vk_id))
                 # Если пользователь/группа удалены - нефиг их добавлять.
                 if not api_vk_id:
                     return dialogs.add_cheater_no_id
@@ -557,23 +618,23 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
                 if cheater_add is None:
                     cheater_add = cheaters.Cheater()
 
-                if reg_match.lastgroup in ('vk_id', 'group_id', 'screen_name'):
+                if reg_match.group in ('vk_id', 'group_id', 'screen_name'):
                     cheater_add.update2('vk_id', api_vk_id)
                     cheater_add.update2('screen_name', api_screen_name)
                     id_found = True
                 else:
-                    cheater_add.update2(reg_match.lastgroup, reg_match[reg_match.lastgroup])
+                    cheater_add.update2(reg_match.group, reg_match.value)
 
                 # Смотрим в нашу БД
-                if reg_match.lastgroup in ('vk_id', 'group_id', 'screen_name'):
-                    cheater_db_list = bot.get_cheater_from_db2(reg_match.lastgroup, reg_match[reg_match.lastgroup])
+                if reg_match.group in ('vk_id', 'group_id', 'screen_name'):
+                    cheater_db_list = await bot.get_cheater_from_db2(reg_match.group, reg_match.value)
                     if cheater_db_list:
                         cheater_db = cheater_db_list[0]
-                        if reg_match.lastgroup == 'screen_name':
+                        if reg_match.group == 'screen_name':
                             # Если имя сменило владельца - обновляем имя у старого и меняем cheaters_db
                             if cheater_db.vk_id != cheater_add.vk_id:
                                 await bot.update_db_screen_name(cheater_db.vk_id)
-                                cheater_db = bot.get_cheater_from_db(cheater_add.vk_id)
+                                cheater_db = await bot.get_cheater_from_db(cheater_add.vk_id)
                         if cheater_db.screen_name != cheater_add.screen_name:
                             await bot.update_db_screen_name(cheater_db.vk_id, cheater_add.screen_name)
             else:
@@ -589,7 +650,8 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
                                       cheater_add=cheater_add,
                                       cheater_db=cheater_db)
         answer_message += '\nЧтобы записать кидалу в базу, нажми "Добавить"'
-        await message.answer(
+        await bot.outbox.send(
+            message.peer_id,
             message=answer_message,
         )
 
@@ -602,24 +664,29 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         """
         Помощь.
         """
-        await message.answer(message=dialogs.admin_help)
+        await bot.outbox.send(message.peer_id, message=dialogs.admin_help)
 
     @bot.on.message(
         AdminUserRule(bot),
         StateGroupRule(AdminStates),
-        CommandRule('export') | CommandRule('экспорт')
+        CommandRule('export') | CommandRule('экспорт') |
+        CommandRule('export', args_count=1) | CommandRule('экспорт', args_count=1)
     )
-    async def admin_export_to_csv_handler(message: Message):
+    async def admin_export_to_csv_handler(message: Message, args: Tuple[str] = ('txt',)):
         """
         Экспорт базы данных в читаемый формат.
-        """
-        file_to_peer = bot.export_db()
-        uploader = DocMessagesUploader(bot.api)
-        doc = await uploader.upload('kidaly.txt',
-                                    file_to_peer.encode(),
-                                    peer_id=message.from_id,
-                                    )
-        await message.answer(
+        Формат можно указать аргументом: /export csv (см. export.EXPORT_FORMATS).
+        """
+        export_format = args[0].lower()
+        if export_format not in export.EXPORT_FORMATS:
+            return dialogs.export_unknown_format.format(', '.join(export.EXPORT_FORMATS))
+        path = await bot.export_db(export_format)
+        try:
+            doc = await bot.upload_doc_file(path, 'kidaly.' + export_format, message.from_id)
+        finally:
+            os.remove(path)
+        await bot.outbox.send(
+            message.peer_id,
             attachment=doc
         )
 
@@ -642,17 +709,24 @@ def start_bot(db_filename: str, vk_token: str, cheaters_filename: str):
         """
         Common message.
         """
-        users_info = await bot.api.users.get([message.from_id], fields=['screen_name'])
-
         answer_message = dialogs.dont_understand
         answer_message += dialogs.samples
 
         await bot.answer_to_peer(answer_message, message.from_id, None)
 
     bot.loop_wrapper.on_startup.append(bot_load(bot))
+    bot.loop_wrapper.on_shutdown.append(bot_shutdown(bot))
 
-    print('Запускаю бота')
-    bot.run_forever()
+    if callback_settings and callback_settings.port:
+        server = callback_server.CallbackServer(bot, callback_settings)
+        bot.loop_wrapper.add_task(server.start())
+        # Сначала перестаем принимать события, потом сохраняем состояния.
+        bot.loop_wrapper.on_shutdown.insert(0, server.stop())
+        print('Запускаю бота (Callback API)')
+        bot.loop_wrapper.run_forever(bot.loop)
+    else:
+        print('Запускаю бота')
+        bot.run_forever()
 
 
 if __name__ == '__main__':
@@ -660,7 +734,6 @@ if __name__ == '__main__':
 
 # Global TO DO
 # TODO Удалить запись из БД.
-# TODO Сделать webhook.
 # TODO Сделать красивый вывод при найденном кидале.
 # TODO Обновить импорт из файла экспорта.
 # TODO Сделать проверку обновления кода в папке.
@@ -0,0 +1,124 @@
+"""
+Индекс кидал в памяти для быстрого поиска.
+Держит всех кидал из БД в словарях по значениям атрибутов, заполняется и обновляется через DBCheaters.
+Значения сравниваются как в SQL-поиске (DBCheaters.get_cheater_id_list_by_param) - точно, без нормализации,
+поэтому с индексом и без него поиск находит одно и то же.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from cheaters import Cheater, CheaterRecord
+
+# Атрибуты, по которым ищем. vk_id ищется напрямую в словаре кидал.
+INDEXED_ATTRS = ('screen_name', 'telephone', 'card', 'proof_link')
+
+
+class CheatersIndex:
+    """
+    Индекс кидал в памяти: {vk_id: CheaterRecord} и {атрибут: {значение: {vk_id}}}.
+    Кидалы хранятся неизменяемыми CheaterRecord (меньше памяти),
+    наружу отдаются копиями Cheater, чтобы правка результата не меняла индекс.
+    Сам в БД не ходит - кидал в него кладет DBCheaters (см. DBCheaters.load_index).
+    Пишет в индекс поток БД (см. async_database), а ищет цикл событий, поэтому все операции под блокировкой.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cheaters: Dict[str, CheaterRecord] = {}
+        self._attrs: Dict[str, Dict[str, Set[str]]] = {attr: {} for attr in INDEXED_ATTRS}
+
+    def __len__(self):
+        return len(self._cheaters)
+
+    @staticmethod
+    def _attr_values(cheater: CheaterRecord) -> Iterable[Tuple[str, str]]:
+        """
+        Все пары (атрибут, ключ) кидалы.
+        """
+        if cheater.screen_name:
+            yield 'screen_name', cheater.screen_name
+        for attr in ('telephone', 'card', 'proof_link'):
+            for value in cheater.get(attr):
+                if value:
+                    yield attr, value
+
+    def clear(self):
+        """
+        Метод очищает индекс.
+        """
+        with self._lock:
+            self._cheaters.clear()
+            for values in self._attrs.values():
+                values.clear()
+
+    def load(self, cheaters_dict: Dict[str, Cheater]):
+        """
+        Метод заменяет содержимое индекса.
+
+        :param cheaters_dict: {vk_id: Cheater}.
+        """
+        with self._lock:
+            self.clear()
+            for vk_id, cheater in cheaters_dict.items():
+                self.put(vk_id, cheater)
+
+    def put(self, vk_id: str, cheater: Cheater):
+        """
+        Метод добавляет кидалу в индекс или заменяет старую запись про этот vk_id.
+
+        :param vk_id: Под каким vk_id кидала лежит в БД.
+        :param cheater: Кидала.
+        """
+        with self._lock:
+            self.remove(vk_id)
+            record = CheaterRecord.from_cheater(cheater)
+            self._cheaters[vk_id] = record
+            for attr, key in self._attr_values(record):
+                self._attrs[attr].setdefault(key, set()).add(vk_id)
+
+    def remove(self, vk_id: str):
+        """
+        Метод убирает кидалу из индекса. Если его нет - ничего не делает.
+
+        :param vk_id: id кидалы.
+        """
+        with self._lock:
+            cheater = self._cheaters.pop(vk_id, None)
+            if cheater is None:
+                return
+            for attr, key in self._attr_values(cheater):
+                vk_ids = self._attrs[attr].get(key)
+                if vk_ids is not None:
+                    vk_ids.discard(vk_id)
+                    if not vk_ids:
+                        del self._attrs[attr][key]
+
+    def get(self, vk_id: str) -> Optional[Cheater]:
+        """
+        Метод возвращает копию кидалы по vk_id.
+
+        :param vk_id: id кидалы.
+        :return: Cheater или None.
+        """
+        with self._lock:
+            record = self._cheaters.get(vk_id)
+            if record is None:
+                return None
+            return record.to_cheater()
+
+    def find(self, param: str, value: str) -> List[Cheater]:
+        """
+        Метод ищет кидал по значению атрибута.
+
+        :param param: vk_id, screen_name, telephone, card или proof_link.
+        :param value: Значение (пустое ничего не находит).
+        :return: Копии найденных кидал, отсортированные по vk_id.
+        """
+        if not value:
+            return []
+        with self._lock:
+            if param == 'vk_id':
+                cheater = self.get(value)
+                return [cheater] if cheater else []
+            vk_ids = self._attrs.get(param, {}).get(value, ())
+            return [self._cheaters[vk_id].to_cheater() for vk_id in sorted(vk_ids)]
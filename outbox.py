@@ -0,0 +1,233 @@
+"""
+Очередь исходящих сообщений.
+Все сообщения бота идут через одну очередь: одинаковые сообщения разным получателям склеиваются
+в один messages.send с peer_ids, частота запросов ограничена общим лимитом,
+а при flood control (ошибки 6 и 9) запрос повторяется с нарастающей паузой.
+"""
+import asyncio
+import collections
+import dataclasses
+import logging
+import random
+import time
+from typing import Any, Deque, Dict, List, Tuple
+
+from vkbottle import API
+from vkbottle.exception_factory import VKAPIError
+
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+# Сколько запросов messages.send в секунду отправлять (лимит группы - 20, оставляем запас другим методам).
+SEND_RATE = 15
+# Сколько получателей можно указать в одном messages.send.
+SEND_MAX_PEERS = 100
+# Сколько раз повторять запрос при flood control и пауза перед первым повтором (секунд, дальше - вдвое больше).
+SEND_MAX_RETRIES = 5
+SEND_RETRY_DELAY = 1
+# Коды ошибок VK API, после которых запрос стоит повторить позже.
+SEND_RETRY_ERRORS = (6, 9)
+# По скольким последним отправкам считается задержка в metrics.
+LATENCY_WINDOW = 1000
+
+
+@dataclasses.dataclass
+class OutgoingMessage:
+    """
+    Сообщение в очереди.
+      peer_ids: List[int]
+        получатели
+      params: Tuple[Tuple[str, Any], ...]
+        параметры messages.send (message, keyboard, ...), по ним сообщения склеиваются
+      future: asyncio.Future
+        результат отправки
+      enqueued: float
+        time.monotonic() постановки в очередь
+    """
+    peer_ids: List[int]
+    params: Tuple[Tuple[str, Any], ...]
+    future: asyncio.Future
+    enqueued: float = dataclasses.field(default_factory=time.monotonic)
+
+
+@dataclasses.dataclass
+class _Batch:
+    """
+    Склеенные сообщения с одинаковыми параметрами: уходят одним запросом.
+    """
+    params: Tuple[Tuple[str, Any], ...]
+    peer_ids: List[int] = dataclasses.field(default_factory=list)
+    messages: List[OutgoingMessage] = dataclasses.field(default_factory=list)
+
+
+def group_messages(messages: List[OutgoingMessage], max_peers: int = SEND_MAX_PEERS) -> List[_Batch]:
+    """
+    Функция склеивает сообщения с одинаковыми параметрами в пачки до max_peers получателей.
+    Порядок сообщений для каждого получателя сохраняется: сообщение не встает в пачку,
+    если в ней или после нее этому получателю уже идет сообщение.
+
+    :param messages: Сообщения в порядке очереди.
+    :param max_peers: Максимум получателей в пачке.
+    :return: Пачки в порядке отправки.
+    """
+    batches: List[_Batch] = []
+    for message in messages:
+        peers = set(message.peer_ids)
+        target = None
+        for batch in reversed(batches):
+            if peers & set(batch.peer_ids):
+                break
+            if batch.params == message.params and len(batch.peer_ids) + len(peers) <= max_peers:
+                target = batch
+                break
+        if target is None:
+            target = _Batch(message.params)
+            batches.append(target)
+        target.peer_ids.extend(message.peer_ids)
+        target.messages.append(message)
+    return batches
+
+
+class MessageSender:
+    """
+    Отправитель сообщений: очередь + фоновая задача run, которая ее разбирает.
+    """
+
+    def __init__(self, api: API, rate: float = SEND_RATE, max_peers: int = SEND_MAX_PEERS,
+                 max_retries: int = SEND_MAX_RETRIES, retry_delay: float = SEND_RETRY_DELAY):
+        """
+        :param api: API бота.
+        :param rate: Сколько запросов в секунду отправлять.
+        :param max_peers: Сколько получателей в одном запросе.
+        :param max_retries: Сколько раз повторять запрос при flood control.
+        :param retry_delay: Пауза перед первым повтором, секунд.
+        """
+        self.api = api
+        self.max_peers = max_peers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.rate_limiter = ratelimit.TokenBucket(rate)
+        self._queue: asyncio.Queue[OutgoingMessage] = asyncio.Queue()
+        self._latencies: Deque[float] = collections.deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'requests': 0, 'messages': 0, 'retries': 0, 'failed': 0}
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Сколько сообщений ждет отправки.
+        """
+        return self._queue.qsize()
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Метрики очереди: глубина, счетчики и задержка от постановки в очередь до отправки (секунд).
+
+        :return: {queue_depth, requests, messages, retries, failed, latency_avg, latency_max}
+        """
+        latencies = self._latencies
+        return {
+            'queue_depth': self.queue_depth,
+            **self._counters,
+            'latency_avg': round(sum(latencies) / len(latencies), 3) if latencies else 0,
+            'latency_max': round(max(latencies), 3) if latencies else 0,
+        }
+
+    def put(self, peer_ids: int | List[int], message: str = None, **params) -> asyncio.Future:
+        """
+        Метод ставит сообщение в очередь и сразу возвращается.
+
+        :param peer_ids: Получатель или список получателей.
+        :param message: Текст.
+        :param params: Остальные параметры messages.send (keyboard, forward_messages, attachment, ...).
+        :return: Future с ответом messages.send (со списком ответов, если запросов несколько).
+        """
+        if isinstance(peer_ids, int):
+            peer_ids = [peer_ids]
+        if message is not None:
+            params['message'] = message
+        params = tuple(sorted((key, value) for key, value in params.items() if value is not None))
+        peer_ids = list(dict.fromkeys(peer_ids))
+        futures = []
+        # Получателей больше, чем влезает в один запрос, - ставим несколько сообщений.
+        for start in range(0, len(peer_ids), self.max_peers):
+            future = asyncio.get_running_loop().create_future()
+            # Ошибку уже записали в лог: если результат никто не ждет, asyncio не должен ругаться на нее еще раз.
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._queue.put_nowait(OutgoingMessage(peer_ids[start:start + self.max_peers], params, future))
+            futures.append(future)
+        if len(futures) == 1:
+            return futures[0]
+        return asyncio.gather(*futures)
+
+    async def send(self, peer_ids: int | List[int], message: str = None, **params) -> Any:
+        """
+        Метод ставит сообщение в очередь и ждет, пока оно уйдет. Ошибка отправки выбрасывается здесь.
+        Параметры как у put.
+
+        :return: Ответ messages.send.
+        """
+        return await self.put(peer_ids, message, **params)
+
+    async def run(self):
+        """
+        Фоновая задача: забирает из очереди все, что накопилось, склеивает и отправляет.
+        """
+        while True:
+            messages = [await self._queue.get()]
+            while not self._queue.empty():
+                messages.append(self._queue.get_nowait())
+            for batch in group_messages(messages, self.max_peers):
+                await self._send_batch(batch)
+            for _ in messages:
+                self._queue.task_done()
+
+    async def _send_batch(self, batch: _Batch):
+        """
+        Метод отправляет пачку одним запросом, при flood control - повторяет.
+        random_id у повторов один и тот же, поэтому VK не доставит сообщение дважды.
+        """
+        params = dict(batch.params)
+        if len(batch.peer_ids) == 1:
+            params['peer_id'] = batch.peer_ids[0]
+        else:
+            params['peer_ids'] = batch.peer_ids
+        params['random_id'] = random.getrandbits(31)
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                result = await self.api.messages.send(**params)
+            except VKAPIError as error:
+                if error.code in SEND_RETRY_ERRORS and attempt < self.max_retries:
+                    self._counters['retries'] += 1
+                    delay = self.retry_delay * 2 ** attempt
+                    logger.warning('messages.send: ошибка ' + str(error.code) + ', повтор через ' + str(delay) + ' с')
+                    await asyncio.sleep(delay)
+                    continue
+                self._finish(batch, error=error)
+                return
+            except Exception as error:
+                self._finish(batch, error=error)
+                return
+            self._finish(batch, result=result)
+            return
+
+    def _finish(self, batch: _Batch, result: Any = None, error: Exception = None):
+        """
+        Метод отдает результат (или ошибку) всем, кто ждет сообщения из пачки, и обновляет метрики.
+        """
+        now = time.monotonic()
+        self._counters['requests'] += 1
+        if error is not None:
+            self._counters['failed'] += len(batch.messages)
+            logger.error('Не удалось отправить сообщение ' + str(batch.peer_ids) + ': ' + str(error))
+        else:
+            self._counters['messages'] += len(batch.messages)
+        for message in batch.messages:
+            self._latencies.append(now - message.enqueued)
+            if message.future.done():
+                continue
+            if error is not None:
+                message.future.set_exception(error)
+            else:
+                message.future.set_result(result)
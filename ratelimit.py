@@ -0,0 +1,46 @@
+"""
+Ограничение частоты запросов к VK API.
+"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты "ведро с токенами".
+    Токены пополняются со скоростью rate в секунду, но в ведре их не бывает больше capacity.
+    Каждый запрос забирает токен, если токенов нет - ждет через asyncio.sleep, не блокируя остальных.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        :param rate: Сколько токенов добавляется в секунду.
+        :param capacity: Размер ведра (сколько запросов можно сделать пачкой). По умолчанию - rate.
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """
+        Метод добавляет токены за время, прошедшее с прошлого пополнения.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1):
+        """
+        Метод ждет, пока в ведре наберется tokens токенов, и забирает их.
+        Ожидающие обслуживаются по очереди.
+
+        :param tokens: Сколько токенов нужно.
+        """
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
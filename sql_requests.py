@@ -50,54 +50,161 @@ select_id_screen_names = 'select vk_ids.vk_id, screen_name, fifty ' \
                          'from vk_ids JOIN screen_names ' \
                          'on vk_ids.vk_id = screen_names.vk_id'
 
-select_all_cheaters_full_info = """
-SELECT vk_ids.vk_id, screen_name, fifty, card, telephone, proof_link FROM vk_ids 
-LEFT JOIN screen_names on vk_ids.vk_id = screen_names.vk_id 
-LEFT JOIN cards on vk_ids.vk_id = cards.vk_id 
-LEFT JOIN telephones on vk_ids.vk_id = telephones.vk_id
-LEFT JOIN proof_links on vk_ids.vk_id = proof_links.vk_id
-ORDER by fifty, vk_ids.vk_id
+# Полный список кидал: каждая таблица читается целиком один раз, сливается в DBCheaters.get_cheaters_full_list.
+# vk_ids - по одной строке на vk_id (первая по pk), "полтинники" в конце.
+select_all_vk_ids_sorted = 'select vk_id, fifty from vk_ids where pk in (select min(pk) from vk_ids group by vk_id) ' \
+                           'order by fifty, vk_id'
+select_all_screen_names = 'select vk_id, screen_name from screen_names where changed = 0 order by pk'
+select_all_attr = 'select vk_id, {attr} from {attr}s order by pk'
+
+# Выборка атрибутов сразу для нескольких кидал. {ids} - плейсхолдеры "?, ?, ..." для vk_id.
+select_vk_ids_by_ids = 'select vk_id, fifty from vk_ids where vk_id in ({ids}) order by pk'
+select_screen_names_by_ids = 'select vk_id, screen_name from screen_names where changed = 0 and vk_id in ({ids}) order by pk'
+select_attr_by_ids = 'select vk_id, {attr} from {attr}s where vk_id in ({ids}) order by pk'
+
+# Все vk_id, про которых в БД есть хоть что-то (для индекса в памяти).
+select_all_cheater_vk_ids = """
+select vk_id from vk_ids
+union select vk_id from screen_names where changed = 0
+union select vk_id from telephones
+union select vk_id from cards
+union select vk_id from proof_links
 """
 
 select_publics = 'select vk_id from vk_ids where vk_id like "public%"'
 select_publics_from_table = 'select vk_id from {}  where vk_id like "public%"'
+# Слияние public123 в club123 (см. DBCheaters.publics_to_clubs): удаляются строки club, с которыми совпадет public.
+delete_vk_id_merged_into = 'delete from vk_ids where vk_id = ? and fifty in (select fifty from vk_ids where vk_id = ?)'
+delete_screen_names_merged_into = 'delete from screen_names where vk_id = ? and changed = 0 and screen_name in ' \
+                                  '(select screen_name from screen_names where vk_id = ? and changed = 0)'
+# Все строки vk_id, кроме первой (см. DBCheaters.update_fifty).
+delete_vk_id_extra_rows = 'delete from vk_ids where vk_id = ? and pk <> (select min(pk) from vk_ids where vk_id = ?)'
 
-select_duplicate_vk_id = """
-select *, count(vk_id) as count  from vk_ids
-group by vk_id, fifty
-having count(*) > 1
-"""
-
-select_duplicate_vk_id2 = """
-select *, count(vk_id) as count  from vk_ids
+# Кидалы, дубликаты которых нельзя удалить автоматически (см. DBCheaters.delete_duplicates):
+# vk_id с разными fifty, screen_name у нескольких vk_id и несколько screen_name у одного vk_id.
+# vk_id берется из строки с минимальным pk группы.
+select_unresolved_duplicates = """
+select 'vk_id', vk_id, min(pk) from vk_ids
 group by vk_id
 having count(*) > 1
-"""
-
-select_duplicate_screen_names = """
-select *, count(screen_name) as count  from screen_names
-group by screen_name, vk_id, changed
-having count(*) > 1
-"""
-
-select_duplicate_screen_names2 = """
-select *, count(screen_name) as count  from screen_names
-where changed=0
+union all
+select 'screen_name', vk_id, min(pk) from screen_names
+where changed = 0
 group by screen_name
 having count(*) > 1
-"""
-
-select_duplicate_screen_names3 = """
-select *, count(vk_id) as count from screen_names
+union all
+select 'screen_name', vk_id, min(pk) from screen_names
 where changed = 0
 group by vk_id
-having count(*)>1
-"""
-
-select_duplicate_attr = """
-select *, count(vk_id) as count  from {attr}s
-group by vk_id, {attr}
 having count(*) > 1
 """
 
 select_row_names = "select name from pragma_table_info('{}')"
+
+# Удаление полных дубликатов: из каждой группы одинаковых {columns} остается строка с минимальным pk.
+delete_duplicate_rows = 'delete from {table} where pk not in (select min(pk) from {table} group by {columns})'
+
+# Колонки, одинаковые у полных дубликатов, по таблицам. На них же стоят уникальные индексы (миграции 2 и 3).
+duplicate_columns = {
+    'vk_ids': 'vk_id, fifty',
+    'screen_names': 'screen_name, vk_id, changed',
+    'telephones': 'telephone, vk_id',
+    'cards': 'card, vk_id',
+    'proof_links': 'proof_link, vk_id',
+}
+
+# Импорт vk_id: новые добавляются, у существующих обновляется fifty.
+update_fifty_if_changed = 'update vk_ids set fifty = ? where vk_id = ? and fifty is not ?'
+insert_vk_id_if_not_exists = 'insert into vk_ids (vk_id, fifty) select ?, ? where not exists ' \
+                             '(select 1 from vk_ids where vk_id = ?)'
+
+# Состояния диалогов (см. state_storage): payload - json, updated - time.time() последней записи.
+select_states = 'select peer_id, state, payload, updated from states where updated >= ?'
+upsert_state = 'insert into states (peer_id, state, payload, updated) values (?, ?, ?, ?) ' \
+               'on conflict(peer_id) do update set state = excluded.state, payload = excluded.payload, ' \
+               'updated = excluded.updated'
+delete_state = 'delete from states where peer_id = ?'
+delete_expired_states = 'delete from states where updated < ?'
+
+# Рассылки (см. broadcast): last_peer_id - до какого члена группы (по возрастанию id) уже отправлено.
+insert_broadcast = 'insert into broadcasts (message, admin_peer_id, total, sent, failed, last_peer_id, updated) ' \
+                   'values (?, ?, ?, 0, 0, 0, ?)'
+update_broadcast = 'update broadcasts set total = ?, sent = ?, failed = ?, last_peer_id = ?, updated = ? where pk = ?'
+finish_broadcast = 'update broadcasts set finished = 1, updated = ? where pk = ?'
+select_unfinished_broadcasts = 'select pk, message, admin_peer_id, total, sent, failed, last_peer_id from broadcasts ' \
+                               'where finished = 0 order by pk'
+
+# Кеш поиска страниц через API (см. vkbot.VKBot.resolve_pages): name - что искали (id123, club123 или screen_name),
+# page_id = 0 - страница не найдена (отрицательный кеш), fetched - time.time() запроса к API.
+select_resolved_pages = 'select name, page_type, page_id, screen_name, title, banned, fetched from resolved_pages ' \
+                        'where name in ({ids})'
+upsert_resolved_page = 'insert into resolved_pages (name, page_type, page_id, screen_name, title, banned, fetched) ' \
+                       'values (?, ?, ?, ?, ?, ?, ?) on conflict(name) do update set page_type = excluded.page_type, ' \
+                       'page_id = excluded.page_id, screen_name = excluded.screen_name, title = excluded.title, ' \
+                       'banned = excluded.banned, fetched = excluded.fetched'
+delete_resolved_pages_before = 'delete from resolved_pages where fetched < ?'
+
+# Миграции схемы БД: {номер версии: скрипт, который приводит к ней схему предыдущей версии}.
+# Номер текущей версии хранится в таблице parameters (см. database.SCHEMA_VERSION_PARAM).
+# Скрипты должны быть идемпотентны: если миграция прервалась, она будет выполнена заново.
+migrations = {
+    1: """
+create index if not exists vk_ids_vk_id on vk_ids(vk_id);
+create index if not exists screen_names_screen_name on screen_names(screen_name, changed);
+create index if not exists screen_names_vk_id on screen_names(vk_id, changed);
+create index if not exists telephones_telephone on telephones(telephone);
+create index if not exists telephones_vk_id on telephones(vk_id);
+create index if not exists cards_card on cards(card);
+create index if not exists cards_vk_id on cards(vk_id);
+create index if not exists proof_links_proof_link on proof_links(proof_link);
+create index if not exists proof_links_vk_id on proof_links(vk_id);
+create index if not exists parameters_parameter on parameters(parameter);
+""",
+    2: ";\n".join([
+        delete_duplicate_rows.format(table='screen_names', columns='screen_name, vk_id, changed'),
+        delete_duplicate_rows.format(table='telephones', columns='telephone, vk_id'),
+        delete_duplicate_rows.format(table='cards', columns='card, vk_id'),
+        delete_duplicate_rows.format(table='proof_links', columns='proof_link, vk_id'),
+        "create unique index if not exists screen_names_unique on screen_names(screen_name, vk_id) where changed = 0",
+        "create unique index if not exists telephones_unique on telephones(telephone, vk_id)",
+        "create unique index if not exists cards_unique on cards(card, vk_id)",
+        "create unique index if not exists proof_links_unique on proof_links(proof_link, vk_id)",
+    ]),
+    3: ";\n".join([
+        delete_duplicate_rows.format(table='vk_ids', columns=duplicate_columns['vk_ids']),
+        "create unique index if not exists vk_ids_unique on vk_ids(vk_id, fifty)",
+    ]),
+    4: """
+create table if not exists states(
+  peer_id integer primary key,
+  state text,
+  payload text,
+  updated real
+);
+create index if not exists states_updated on states(updated);
+""",
+    5: """
+create table if not exists broadcasts(
+  pk integer primary key,
+  message text,
+  admin_peer_id integer,
+  total integer,
+  sent integer,
+  failed integer,
+  last_peer_id integer,
+  updated real,
+  finished bool default 0
+);
+""",
+    6: """
+create table if not exists resolved_pages(
+  name text primary key,
+  page_type text,
+  page_id integer,
+  screen_name text,
+  title text,
+  banned bool,
+  fetched real
+);
+""",
+}
@@ -13,6 +13,23 @@ parameters_from_json = {
     'cheaters_filename': 'kidaly.txt',
 }
 
+# Необязательные параметры: если их нет в конфиге, берется значение по умолчанию, без вопросов.
+optional_parameters_from_json = {
+    'admins_cache_ttl': 300,
+    'memory_index': False,
+    # Настройки соединения с БД поверх database.DEFAULT_PRAGMAS, например {"journal_mode": "delete"}.
+    'db_pragmas': {},
+    # Резервные копии БД (см. backup.BackupSettings), например {"interval": 86400, "keep": 7, "compression": "gz"}.
+    'backup': {},
+    # Сколько секунд хранится состояние диалога, которое не менялось (неделя).
+    'state_ttl': 604800,
+    # Callback API (см. callback_server.CallbackSettings), например {"port": 8080, "secret_key": "..."}.
+    # Без порта бот работает через long polling.
+    'callback': {},
+    # Сколько секунд хранится профиль пользователя (имя для приветствия и т.п.) в кеше.
+    'profile_cache_ttl': 3600,
+}
+
 parameters_from_db = {
     'vk_token': 'str',
     'cheaters_filename': 'str',
@@ -70,6 +87,8 @@ def get_parameters_from_json(json_filename=config_json) -> dict:
             file_need_to_rewrite = True
             json_parameters[param] = user_input
         result[param] = json_parameters[param]
+    for param, default in optional_parameters_from_json.items():
+        result[param] = json_parameters.get(param, default)
 
     if file_need_to_rewrite:
         print('Creating config file', json_filename)
@@ -0,0 +1,186 @@
+"""
+Состояния диалогов (StateDispenser) с сохранением в БД.
+Состояния читаются из памяти, а изменения копятся и пишутся в таблицу states пачкой раз в flush_interval,
+поэтому рестарт бота не сбрасывает начатые диалоги (добавление/удаление кидалы), а ответы не ждут записи в БД.
+Состояния, которые не менялись дольше ttl, удаляются и из памяти, и из БД.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+from vkbottle import ABCStateDispenser, BaseStateGroup
+from vkbottle.dispatch.dispenser.base import StatePeer
+
+import async_database
+from cheaters import Cheater, CHEATER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд живет состояние, которое никто не трогал.
+STATE_TTL = 7 * 24 * 60 * 60
+# Раз во сколько секунд изменения состояний пишутся в БД.
+STATE_FLUSH_INTERVAL = 5
+# Ключ, под которым кидала лежит в json payload.
+CHEATER_KEY = '__cheater__'
+
+
+def _encode_payload_value(value: Any) -> Any:
+    """
+    Кидалы в payload пишутся списком значений полей: {"__cheater__": [vk_id, fifty, ...]}.
+    """
+    if isinstance(value, Cheater):
+        return {CHEATER_KEY: [getattr(value, name) for name in CHEATER_FIELDS]}
+    raise TypeError('Payload value is not JSON serializable: ' + type(value).__name__)
+
+
+def _decode_payload_object(obj: dict) -> Any:
+    """
+    Обратно к _encode_payload_value.
+    """
+    if CHEATER_KEY in obj and len(obj) == 1:
+        return Cheater(*obj[CHEATER_KEY])
+    return obj
+
+
+def dump_payload(payload: dict) -> str:
+    """
+    Функция превращает payload в компактный json. Кроме обычных типов json, понимает Cheater.
+
+    :param payload: payload состояния.
+    :return: json.
+    """
+    return json.dumps(payload, default=_encode_payload_value, ensure_ascii=False, separators=(',', ':'))
+
+
+def load_payload(text: str) -> dict:
+    """
+    Функция читает payload из json (см. dump_payload).
+
+    :param text: json.
+    :return: payload.
+    """
+    return json.loads(text, object_hook=_decode_payload_object) if text else {}
+
+
+class SQLiteStateDispenser(ABCStateDispenser):
+    """
+    StateDispenser для vkbottle с сохранением в БД через AsyncDBCheaters.
+    После создания надо вызвать load (прочитать состояния из БД) и запустить run_periodically фоновой задачей.
+    """
+
+    def __init__(self, db: async_database.AsyncDBCheaters,
+                 ttl: float = STATE_TTL, flush_interval: float = STATE_FLUSH_INTERVAL):
+        """
+        :param db: БД.
+        :param ttl: Сколько секунд живет состояние без изменений.
+        :param flush_interval: Раз во сколько секунд писать изменения в БД.
+        """
+        self.db = db
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._states: Dict[int, StatePeer] = {}
+        self._updated: Dict[int, float] = {}  # time.time() последнего изменения
+        self._dirty: Set[int] = set()  # изменены и еще не записаны
+        self._deleted: Set[int] = set()  # удалены и еще не удалены из БД
+        self._flush_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    async def load(self):
+        """
+        Метод читает из БД состояния, которые еще не устарели.
+        """
+        rows = await self.db.load_states(time.time() - self.ttl)
+        for peer_id, state, payload, updated in rows:
+            try:
+                self._states[peer_id] = StatePeer(peer_id=peer_id, state=state, payload=load_payload(payload))
+            except (TypeError, ValueError):
+                logger.exception('Не удалось прочитать состояние ' + str(peer_id))
+                self._deleted.add(peer_id)
+                continue
+            self._updated[peer_id] = updated
+        logger.info('Загружено состояний диалогов: ' + str(len(self._states)))
+
+    def _expired(self, peer_id: int, now: float) -> bool:
+        """
+        Состояние не менялось дольше ttl.
+        """
+        return now - self._updated.get(peer_id, now) > self.ttl
+
+    def _forget(self, peer_id: int):
+        """
+        Метод убирает состояние из памяти и помечает его на удаление из БД.
+        """
+        self._states.pop(peer_id, None)
+        self._updated.pop(peer_id, None)
+        self._dirty.discard(peer_id)
+        self._deleted.add(peer_id)
+
+    async def get(self, peer_id: int) -> Optional[StatePeer]:
+        state_peer = self._states.get(peer_id)
+        if state_peer is not None and self._expired(peer_id, time.time()):
+            self._forget(peer_id)
+            return None
+        return state_peer
+
+    async def set(self, peer_id: int, state: BaseStateGroup | str, **payload):
+        self._states[peer_id] = StatePeer(peer_id=peer_id, state=state, payload=payload)
+        self._updated[peer_id] = time.time()
+        self._dirty.add(peer_id)
+        self._deleted.discard(peer_id)
+
+    async def delete(self, peer_id: int):
+        self._forget(peer_id)
+
+    def evict_expired(self) -> int:
+        """
+        Метод убирает устаревшие состояния из памяти (из БД - при следующем flush).
+
+        :return: Сколько убрано.
+        """
+        now = time.time()
+        expired = [peer_id for peer_id in self._states if self._expired(peer_id, now)]
+        for peer_id in expired:
+            self._forget(peer_id)
+        return len(expired)
+
+    async def flush(self):
+        """
+        Метод одной транзакцией пишет в БД все накопленные изменения.
+        """
+        async with self._flush_lock:
+            if not self._dirty and not self._deleted:
+                return
+            dirty, deleted = self._dirty, self._deleted
+            self._dirty, self._deleted = set(), set()
+            rows = [(peer_id, self._states[peer_id].state, dump_payload(self._states[peer_id].payload),
+                     self._updated[peer_id])
+                    for peer_id in dirty if peer_id in self._states]
+            try:
+                await self.db.save_states(rows, deleted)
+            except Exception:
+                # Не записалось - попробуем в следующий раз, если состояние не поменяли снова.
+                self._dirty |= {peer_id for peer_id in dirty if peer_id in self._states}
+                self._deleted |= deleted - set(self._states)
+                raise
+
+    async def run_periodically(self):
+        """
+        Фоновая задача: раз в flush_interval убирает устаревшие состояния и пишет изменения в БД.
+        """
+        next_cleanup = 0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.evict_expired()
+                now = time.time()
+                if now >= next_cleanup:
+                    # Устаревшие, которых нет в памяти (например, оставшиеся с прошлого запуска).
+                    await self.db.delete_expired_states(now - self.ttl)
+                    next_cleanup = now + self.ttl / 10
+                await self.flush()
+            except Exception:
+                logger.exception('Не удалось сохранить состояния диалогов')
@@ -26,6 +26,61 @@ class TestCheater(unittest.TestCase):
             reg_match = re.search(cheaters.get_regexp('search'), regex_samples[i].lower().lstrip('+').replace(' ', ''))
             self.assertEqual((reg_match.lastgroup, reg_match[reg_match.lastgroup]),
                              (regexp_result[i][0], regexp_result[i][1]))
+            self.assertEqual(cheaters.match_regexp(cheaters.normalize_search_text(regex_samples[i]), 'search'),
+                             cheaters.CheaterMatch(*regexp_result[i]))
+
+    def test_get_regexp_without_args(self):
+        # Без аргументов берутся все регулярки (раньше тут было IndexError).
+        self.assertEqual(cheaters.get_regexp(), cheaters.get_regexp('all'))
+        self.assertEqual(re.search(cheaters.get_regexp(), '79991112233').lastgroup, 'telephone')
+
+    def test_compiled_regexp_registry(self):
+        self.assertIs(cheaters.get_compiled_regexp('search'), cheaters.get_compiled_regexp('main'))
+        self.assertIs(cheaters.get_compiled_regexp('search'), cheaters.get_compiled_regexp('del'))
+        self.assertIs(cheaters.get_compiled_regexp(), cheaters.get_compiled_regexp('all'))
+        self.assertEqual(cheaters.get_compiled_regexp('card', 'telephone').pattern,
+                         cheaters.get_regexp('card', 'telephone'))
+        self.assertIsNone(cheaters.match_regexp('привет', 'search'))
+        self.assertEqual(cheaters.search_regexp('карта 4000000000000001', 'card'),
+                         cheaters.CheaterMatch('card', '4000000000000001'))
+
+    def test_parse_cheaters_file(self):
+        content = '79990000000\n' \
+                  'https://vk.com/id1\n' \
+                  '+7 999 111-22-33\r\n' \
+                  'vk.com/durov\n' \
+                  '4000 0000 0000 0001\n' \
+                  'vk.com/wall-1_2\n' \
+                  'fifty\n' \
+                  'vk.com/public3\n' \
+                  'непонятная строка\n'
+        self.assertEqual(cheaters.parse_cheaters_file(content), [
+            {'vk_id': 'id1', 'fifty': False, 'screen_name': '',
+             'telephone': ['79991112233'], 'card': [], 'proof_link': []},
+            {'vk_id': '', 'fifty': False, 'screen_name': 'durov',
+             'telephone': [], 'card': ['4000000000000001'], 'proof_link': ['wall-1_2']},
+            {'vk_id': 'club3', 'fifty': True, 'screen_name': '',
+             'telephone': [], 'card': [], 'proof_link': []},
+        ])
+
+    def test_cheater_record(self):
+        cheater = cheaters.Cheater(vk_id='id1', screen_name='durov', card=['4000000000000001'])
+        self.assertFalse(hasattr(cheater, '__dict__'))
+        self.assertTrue(cheater)
+        self.assertFalse(cheaters.Cheater())
+        self.assertEqual(cheater.get('card'), ['4000000000000001'])
+        self.assertIsNone(cheater.get('unknown'))
+
+        record = cheaters.CheaterRecord.from_cheater(cheater)
+        self.assertEqual(record.card, ('4000000000000001',))
+        self.assertEqual(record.get('screen_name'), 'durov')
+        self.assertFalse(cheaters.CheaterRecord())
+        with self.assertRaises(AttributeError):
+            record.vk_id = 'id2'
+        copy = record.to_cheater()
+        self.assertEqual(copy, cheater)
+        copy.card.append('1')
+        self.assertEqual(record.card, ('4000000000000001',))
 
 
 if __name__ == '__main__':
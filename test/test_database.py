@@ -2,12 +2,19 @@
 Тут будем проводить тестирование проекта.
 """
 import datetime
+import gzip
 import os
-import filecmp
+import json
 import shutil
+import sqlite3
+import tempfile
 import unittest
 
+import backup
+import cheaters
 import database
+import export
+import sql_requests
 
 TEMPLATE_DB = 'cheaters.db'
 TEST_DB = 'test-cheaters.db'
@@ -22,96 +29,32 @@ class TestDatabaseBasic(unittest.TestCase):
         del self.db
         os.remove(TEST_DB)
 
-    def test_type_conversion_sql(self):
-        value1 = 'asd'
-        result1 = '"asd"'
-        value2 = None
-        result2 = 'NULL'
-        value3 = 123
-        result3 = '123'
-        value4 = False
-        result4 = 'False'
-
-        self.assertEqual(self.db._type_conversion_sql(value1), result1)
-        self.assertEqual(self.db._type_conversion_sql(value2), result2)
-        self.assertEqual(self.db._type_conversion_sql(value3), result3)
-        self.assertEqual(self.db._type_conversion_sql(value4), result4)
-
     def test_tuple_list_to_list(self):
         tl1 = [('pk',), ('vk_id',), ('fifty',)]
         l1 = ['pk', 'vk_id', 'fifty']
         self.assertEqual(self.db._tuple_list_to_list(tl1), l1)
 
-    def test_construct_insert(self):
-        test_table = 'parameters'
-        values_dict = {'param1': '123',
-                       'p2': 312,
-                       'p3': False}
-        result = 'INSERT into parameters (param1, p2, p3) values ("123", 312, False)'
-        self.assertEqual(self.db._construct_insert(test_table, values_dict), result)
-
-        test_table = 'vk_ids'
-        values_dict = {'vk_id': 'id123',
-                       'fifty': True,
-                       'pk': None}
-        result = 'INSERT into vk_ids (vk_id, fifty, pk) values ("id123", True, NULL)'
-        self.assertEqual(self.db._construct_insert(test_table, values_dict), result)
-
-    def test_construct_select(self):
-        test_table = 'vk_ids'
-        what_select = '*'
-        where_select = {'vk_id': 'club111',
-                        'fifty': None}
-        result = 'SELECT * from vk_ids where vk_id="club111" and fifty=NULL'
-        self.assertEqual(self.db._construct_select(test_table, what_select, where_select), result)
-
-        test_table = 'screen_names'
-        what_select = ['screen_name', 'changed']
-        where_select = {'vk_id': 'club111',
-                        'changed': 1}
-        operator = 'or'
-        result = 'SELECT screen_name, changed from screen_names where vk_id="club111" or changed=1'
-        self.assertEqual(self.db._construct_select(test_table, what_select, where_select, operator), result)
-
-        test_table = 'cards'
-        what_select = 'vk_id'
-        where_select = {'vk_id': 'id349587984',
-                        }
-        result = 'SELECT vk_id from cards where vk_id="id349587984"'
-        self.assertEqual(self.db._construct_select(table=test_table,
-                                                   what_select=what_select,
-                                                   where_select=where_select),
-                         result)
-
-    def test_construct_update(self):
-        table = 'telephones'
-        set_param = {'telephone': '+8789665544'}
-        result = 'UPDATE telephones set telephone="+8789665544"'
-        self.assertEqual(self.db._construct_update(table, set_param), result)
-
-        table = 'screen_names'
-        set_param = {'changed': True,
-                     'pk': 123}
-        where_update = {'screen_name': 'asdasdasd',
-                        'changed': None}
-        operator = 'or'
-        result = 'UPDATE screen_names set changed=True, pk=123 where screen_name="asdasdasd" or changed=NULL'
-        self.assertEqual(self.db._construct_update(table, set_param, where_update, operator), result)
-
-    def test_construct_delete(self):
-        table = 'vk_ids'
-        where_delete = {'pk': 123,
-                        '!vk_id': 'club888',
-                        'fifty': None}
-        result = 'DELETE from vk_ids where pk=123 and vk_id!="club888" and fifty=NULL'
-        self.assertEqual(self.db._construct_delete(table, where_delete), result)
-
-        table = 'screen_names'
-        where_delete = {'pk': 123,
-                        '!vk_id': 'club69',
-                        'changed': False}
-        result = 'DELETE from screen_names where pk=123 and vk_id!="club69" and changed=False'
-        self.assertEqual(self.db._construct_delete(table, where_delete), result)
+    def test_build_queries(self):
+        self.assertEqual(self.db._build_select('vk_ids', '*', {'vk_id': 'club111', 'fifty': None}),
+                         ('SELECT * from vk_ids where vk_id=? and fifty=?', ('club111', None)))
+        self.assertEqual(self.db._build_select('screen_names', ['screen_name', 'changed'],
+                                               {'vk_id': 'club111', 'changed': 1}, 'or'),
+                         ('SELECT screen_name, changed from screen_names where vk_id=? or changed=?', ('club111', 1)))
+        self.assertEqual(self.db._build_select('cards', 'vk_id'), ('SELECT vk_id from cards', ()))
+        self.assertEqual(self.db._build_insert('vk_ids', {'vk_id': 'id123', 'fifty': True}),
+                         ('INSERT into vk_ids (vk_id, fifty) values (?, ?) on conflict do nothing', ('id123', True)))
+        self.assertEqual(self.db._build_update('screen_names', {'changed': True, 'pk': 123}, {'screen_name': 'a"b'}),
+                         ('UPDATE screen_names set changed=?, pk=? where screen_name=?', (True, 123, 'a"b')))
+        self.assertEqual(self.db._build_delete('vk_ids', {'pk': 123, '!vk_id': 'club888'}),
+                         ('DELETE from vk_ids where pk=? and vk_id!=?', (123, 'club888')))
+
+        # Текст запроса одной формы не зависит от значений.
+        self.assertIs(self.db._build_select('cards', 'vk_id', {'card': '1'})[0],
+                      self.db._build_select('cards', 'vk_id', {'card': '2'})[0])
+
+        # Кавычки в значениях больше не ломают запрос.
+        self.db.add_cards('12"34', 'id"1')
+        self.assertEqual(self.db.get_cheater_id_list_by_param(card='12"34'), ['id"1'])
 
     def test_construct_create_table(self):
         table = 'vk_ids'
@@ -134,19 +77,60 @@ class TestDatabaseBasic(unittest.TestCase):
         result = '''create table proof_links(pk integer primary key,proof_link text,vk_id text)'''
         self.assertEqual(self.db._construct_create_table(table), result)
 
+    def _db_dump(self, filename: str) -> list:
+        connection = sqlite3.connect(filename)
+        dump = list(connection.iterdump())
+        connection.close()
+        return dump
+
     def test_backup_db_file(self):
         nowtime = datetime.datetime.now().isoformat(timespec='minutes')
         new_name = (self.db.db_filename.rstrip('.db') + '_' + nowtime + '.db').replace(':', '-')
-        self.db.backup_db_file()
+        self.assertEqual(self.db.backup_db_file(), new_name)
         self.assertTrue(os.path.isfile(new_name))
-        self.assertTrue(filecmp.cmp(self.db.db_filename, new_name))
+        self.assertEqual(self._db_dump(new_name), self._db_dump(self.db.db_filename))
         os.remove(new_name)
 
         backup_name = 'cheaters_public_bak.db'
         self.db.backup_db_file(backup_name)
         self.assertTrue(os.path.isfile(backup_name))
-        self.assertTrue(filecmp.cmp(self.db.db_filename, backup_name))
+        self.assertEqual(self._db_dump(backup_name), self._db_dump(self.db.db_filename))
+        os.remove(backup_name)
+
+        backup_name = self.db.backup_db_file(compression='gz')
+        self.assertTrue(backup_name.endswith('.db.gz'))
+        with gzip.open(backup_name, 'rb') as gz_file, open('test-backup.db', 'wb') as db_file:
+            shutil.copyfileobj(gz_file, db_file)
+        self.assertEqual(self._db_dump('test-backup.db'), self._db_dump(self.db.db_filename))
         os.remove(backup_name)
+        os.remove('test-backup.db')
+
+    def test_rotate_backups(self):
+        with tempfile.TemporaryDirectory() as directory:
+            names = [os.path.join(directory, 'test-cheaters_2022-06-0' + str(day) + 'T12-00.db.gz')
+                     for day in (3, 1, 2)]
+            names.append(os.path.join(directory, 'test-cheaters_public_bak.db'))
+            # Копии других БД с похожим именем: rstrip('.db') когда-то делал из них тот же префикс test-cheaters_.
+            names.append(os.path.join(directory, 'test-cheatersdb_2022-06-01T12-00.db'))
+            names.append(os.path.join(directory, 'test-cheaters.bak_2022-06-01T12-00.db'))
+            for name in names:
+                open(name, 'w').close()
+            removed = backup.rotate_backups(TEST_DB, directory, keep=1)
+            self.assertEqual(removed, sorted(names[1:3]))
+            self.assertEqual(sorted(os.listdir(directory)),
+                             sorted(os.path.basename(name) for name in names[:1] + names[3:]))
+        self.assertTrue(os.path.basename(backup.backup_name('cheatersdb.db')).startswith('cheatersdb_'))
+        self.assertEqual(os.path.dirname(backup.backup_name(os.path.join('data', 'cheaters.db'), 'backups')),
+                         'backups')
+
+    def test_apply_pragmas(self):
+        self.assertEqual(self.db.pragmas['journal_mode'], 'wal')
+        self.assertEqual(self.db.pragmas['busy_timeout'], database.DEFAULT_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.db._apply_pragmas({'cache_size': -2000}), {'cache_size': -2000})
+        with self.assertRaises(ValueError):
+            self.db._apply_pragmas({'user_version': 1})
+        with self.assertRaises(ValueError):
+            self.db._apply_pragmas({'synchronous': 'off; drop table vk_ids'})
 
     def test_get_add_del_param(self):
         param1 = 'prampram'
@@ -431,6 +415,149 @@ class TestDatabaseMakeCheater(unittest.TestCase):
                                                               proof_link=proof_link),
                          ['id267462630'])
 
+    def test_import_cheaters(self):
+        cheaters_list = [
+            {'vk_id': 'id777001', 'fifty': False, 'screen_name': 'importer', 'telephone': ['79990001122'], 'card': []},
+            {'vk_id': 'id777002', 'fifty': True, 'screen_name': '', 'telephone': [],
+             'card': ['1111222233334444', '1111222233334444']},
+        ]
+        self.assertEqual(self.db.import_cheaters(cheaters_list), {'inserted': 5, 'updated': 0, 'skipped': 1})
+
+        # Повторный импорт ничего не добавляет, но обновляет fifty.
+        cheaters_list[0]['fifty'] = True
+        self.assertEqual(self.db.import_cheaters(cheaters_list), {'inserted': 0, 'updated': 1, 'skipped': 6})
+        self.assertEqual(self.db.get_cheaters_by_ids(['id777001', 'id777002']),
+                         [cheaters.Cheater(vk_id='id777001', fifty=True, screen_name='importer',
+                                           telephone=['79990001122']),
+                          cheaters.Cheater(vk_id='id777002', fifty=True, card=['1111222233334444'])])
+
+        # vk_id со строкой на каждое значение fifty: импорт сливает их, а не падает на уникальном индексе.
+        self.db.add_vk_id('id777003', False)
+        self.db.add_vk_id('id777003', True)
+        for fifty in (True, False):
+            cheaters_list = [{'vk_id': 'id777003', 'fifty': fifty, 'telephone': ['79990003344']}]
+            self.db.import_cheaters(cheaters_list)
+            self.assertEqual(self.db._select_list_from_table('vk_ids', ['vk_id', 'fifty'], {'vk_id': 'id777003'}),
+                             [['id777003', int(fifty)]])
+            self.db.add_vk_id('id777003', not fifty)
+        self.assertEqual(self.db.get_cheater_id_list_by_param(telephone='79990003344'), ['id777003'])
+
+    def test_transaction(self):
+        with self.db.transaction():
+            self.db.add_vk_id('id777003')
+            self.db.add_cards('5555666677778888', 'id777003')
+        self.assertTrue(self.db.check_the_existence('cards', {'card': '5555666677778888'}))
+
+        with self.assertRaises(ValueError):
+            with self.db.transaction():
+                self.db.add_vk_id('id777004')
+                raise ValueError
+        self.assertFalse(self.db.check_the_existence('vk_ids', {'vk_id': 'id777004'}))
+
+    def test_get_cheaters_by_ids(self):
+        cheater = {
+            'vk_id': 'club332211',
+            'fifty': True,
+            'screen_name': 'very_poor_club',
+            'telephone': ['1234', '4567'],
+            'card': ['1234567812345678'],
+            'proof_link': ['wall-123', 'wall12345'],
+        }
+        self.db.add_cheater(cheater)
+        self.db.update_db_screen_name('club332211', 'new_name')
+        self.db.add_telephones('9998887766', 'id_only_phone')
+
+        found = self.db.get_cheaters_by_ids(['id_only_phone', 'club332211', 'id_not_in_db', 'club332211', None])
+        self.assertEqual(found,
+                         [cheaters.Cheater(telephone=['9998887766']),
+                          cheaters.Cheater(vk_id='club332211',
+                                           fifty=True,
+                                           screen_name='new_name',
+                                           telephone=['1234', '4567'],
+                                           card=['1234567812345678'],
+                                           proof_link=['wall-123', 'wall12345'])])
+        self.assertEqual(self.db.get_cheaters_by_ids([]), [])
+
+        many_ids = ['id' + str(i) for i in range(database.IN_CHUNK_SIZE + 10)] + ['club332211']
+        self.assertEqual([item.vk_id for item in self.db.get_cheaters_by_ids(many_ids)][-1], 'club332211')
+
+    def test_get_cheaters_full_list(self):
+        self.db.add_cheater({'vk_id': 'club332211', 'fifty': True, 'screen_name': 'very_poor_club',
+                             'telephone': ['79990004455', '79990004466'],
+                             'card': ['1234567812345678', '1234567812345679'],
+                             'proof_link': ['wall-1_1', 'wall-1_2']})
+        # Тот же vk_id еще раз с другим fifty - в списке он все равно один.
+        self.db.add_vk_id('club332211', False)
+        full_list = self.db.get_cheaters_full_list()
+        vk_ids = [cheater.vk_id for cheater in full_list]
+        self.assertEqual(len(vk_ids), len(set(vk_ids)))
+        self.assertEqual([cheater.fifty for cheater in full_list], sorted(cheater.fifty for cheater in full_list))
+        self.assertEqual(full_list[vk_ids.index('club332211')],
+                         cheaters.Cheater(vk_id='club332211', fifty=True, screen_name='very_poor_club',
+                                          telephone=['79990004455', '79990004466'],
+                                          card=['1234567812345678', '1234567812345679'],
+                                          proof_link=['wall-1_1', 'wall-1_2']))
+
+    def test_iter_cheaters_export(self):
+        full_list = self.db.get_cheaters_full_list()
+        streamed = list(self.db.iter_cheaters())
+        self.assertEqual(streamed, full_list)
+        self.assertEqual([cheater.fifty for cheater in streamed], sorted(cheater.fifty for cheater in streamed))
+
+        for export_format in export.EXPORT_FORMATS:
+            path = export.export_to_file(self.db.iter_cheaters(), export_format)
+            try:
+                with open(path, encoding=export.EXPORT_ENCODING) as file:
+                    content = file.read()
+            finally:
+                os.remove(path)
+            if export_format == 'txt':
+                # Текстовый экспорт читается импортом из файла (строки с screen_name он разбирает отдельно).
+                parsed = cheaters.parse_cheaters_file(content)
+                self.assertEqual([(item['vk_id'], item['fifty']) for item in parsed if item['vk_id']],
+                                 [(cheater.vk_id, cheater.fifty) for cheater in streamed])
+            elif export_format == 'jsonl':
+                self.assertEqual([cheaters.Cheater(**json.loads(line)) for line in content.splitlines()], streamed)
+            else:
+                self.assertEqual(len(content.splitlines()), len(streamed))
+
+    def test_memory_index(self):
+        self.db.add_cheater({'vk_id': 'club332211', 'fifty': True, 'screen_name': 'Very_Poor_Club',
+                             'telephone': ['79990004455'], 'card': ['1234567812345678'], 'proof_link': ['wall-123']})
+        vk_ids = ['club332211', 'id210886928', 'id_not_in_db']
+        from_db = self.db.get_cheaters_by_ids(vk_ids)
+        self.db.load_index()
+        self.assertEqual(self.db.get_cheaters_by_ids(vk_ids), from_db)
+
+        # Значения сравниваются точно, как в SQL-поиске, пустые ничего не находят.
+        self.assertEqual(self.db.index.find('screen_name', 'Very_Poor_Club'), from_db[:1])
+        self.assertEqual(self.db.index.find('screen_name', 'very_poor_club'), [])
+        self.assertEqual(self.db.index.find('card', '1234567812345678'), from_db[:1])
+        self.assertEqual(self.db.index.find('card', '1234 5678 1234 5678'), [])
+        self.assertEqual(self.db.index.find('telephone', '79990004455'), from_db[:1])
+        self.assertEqual(self.db.index.find('card', '0000000000000000'), [])
+        self.assertEqual(self.db.index.find('card', ''), [])
+
+        # Запись через DBCheaters сразу видна в индексе.
+        self.db.add_cards('0000000000000000', 'club332211')
+        self.db.update_db_screen_name('club332211', 'new_name')
+        self.assertEqual(self.db.index.find('card', '0000000000000000')[0].screen_name, 'new_name')
+        self.assertEqual(self.db.index.find('screen_name', 'Very_Poor_Club'), [])
+
+        # Откаченная транзакция не остается в индексе.
+        with self.assertRaises(ValueError):
+            with self.db.transaction():
+                self.db.add_vk_id('id_rolled_back')
+                raise ValueError
+        self.assertEqual(self.db.get_cheaters_by_ids(['id_rolled_back']), [])
+
+        # Правка найденного кидалы не меняет индекс.
+        self.db.index.find('vk_id', 'club332211')[0].card.append('1')
+        self.assertNotIn('1', self.db.index.get('club332211').card)
+
+        self.db.drop_index()
+        self.assertEqual(self.db.get_cheaters_by_ids(['club332211'])[0].screen_name, 'new_name')
+
 
 class TestCheckDatabase(unittest.TestCase):
     def setUp(self) -> None:
@@ -465,7 +592,18 @@ class TestCheckDatabase(unittest.TestCase):
         self.assertEqual(count_bool_new, 0)
         self.assertEqual(count_int_new, count_bool+count_int)
 
-    def test_delete_duplicates(self):
+    def _drop_unique_indexes(self):
+        """
+        Схема как до миграций 2 и 3: без уникальных индексов дубликаты можно вставить.
+        """
+        indexes = self.db._cursor.execute('select name from sqlite_master where type = "index" '
+                                          'and name like "%_unique"').fetchall()
+        for name, in indexes:
+            self.db._cursor.execute('drop index ' + name)
+        self.db.del_param(database.SCHEMA_VERSION_PARAM)
+        self.db.add_param({database.SCHEMA_VERSION_PARAM: 1})
+
+    def _insert_duplicates(self):
         for i in range(3):
             self.db._cursor.execute('insert into cards (card, vk_id) values ("1234", "id123a")')
             self.db._cursor.execute('insert into telephones (telephone, vk_id) values ("+7999", "id123b")')
@@ -483,13 +621,101 @@ class TestCheckDatabase(unittest.TestCase):
             self.db._cursor.execute('insert into screen_names (screen_name, vk_id, changed) values ("ada", "id01", 0)')
         self.db._connection.commit()
 
+    def _table_rows(self, table: str, first_only: bool = False) -> list:
+        """
+        Строки таблицы по колонкам дубликатов; first_only - только первая (min(pk)) строка каждой группы.
+        """
+        columns = sql_requests.duplicate_columns[table]
+        if first_only:
+            query = 'select min(pk), ' + columns + ' from ' + table + ' group by ' + columns + ' order by 1'
+        else:
+            query = 'select pk, ' + columns + ' from ' + table + ' order by pk'
+        return self.db._cursor.execute(query).fetchall()
+
+    def test_delete_duplicates(self):
         result = {
             'vk_id': ['id000', 'id55a', 'id55aaa'],
             'screen_name': ['id0', 'id0', '', 'id0', 'id01'],
         }
         for item in result:
             result[item].sort()
+
+        # Миграции 2 и 3 удаляют полные дубликаты перед тем, как повесить уникальные индексы.
+        self._drop_unique_indexes()
+        self._insert_duplicates()
+        self.assertEqual(self.db._cursor.execute('select count(*) from cards where card = "1234"').fetchone()[0], 3)
+        expected = {table: self._table_rows(table, first_only=True) for table in sql_requests.duplicate_columns}
+        self.db._migrate()
+        self.assertEqual(self.db.get_schema_version(), max(sql_requests.migrations))
+        for table, rows in expected.items():
+            self.assertEqual(self._table_rows(table), rows, table)
+        self.assertEqual(self.db._cursor.execute('select screen_name, vk_id, changed from screen_names '
+                                                 'where screen_name = "ad55a" order by pk').fetchall(),
+                         [('ad55a', 'id0', 1), ('ad55a', 'id0', 0), ('ad55a', 'i12', 0)])
+        # Остались только конфликты для админа.
+        self.assertEqual(self.db.delete_duplicates(), result)
+        for table, rows in expected.items():
+            self.assertEqual(self._table_rows(table), rows, table)
+
+        # delete_duplicates сам удаляет полные дубликаты так же, как миграции.
+        self._drop_unique_indexes()
+        self._insert_duplicates()
+        expected = {table: self._table_rows(table, first_only=True) for table in sql_requests.duplicate_columns}
         self.assertEqual(self.db.delete_duplicates(), result)
+        for table, rows in expected.items():
+            self.assertEqual(self._table_rows(table), rows, table)
+
+    def test_schema_catalog(self):
+        self.assertEqual(self.db.schema['vk_ids'], ('pk', 'vk_id', 'fifty'))
+        queries = []
+        self.db._connection.set_trace_callback(queries.append)
+        rows = self.db._select_dict_from_table('vk_ids', '*', {'vk_id': 'id210886928'})
+        self.db._connection.set_trace_callback(None)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(set(rows[0]), {'pk', 'vk_id', 'fifty'})
+
+        row = self.db._select_rows_from_table('vk_ids', ['vk_id', 'fifty'], {'vk_id': 'id210886928'})[0]
+        self.assertEqual(row['vk_id'], row[0])
+        self.assertEqual(dict(row), {'vk_id': 'id210886928', 'fifty': rows[0]['fifty']})
+
+    def test_unique_constraints(self):
+        count_query = 'select count(*) from vk_ids where vk_id = "id55b"'
+        self.db.add_vk_id('id55b', False)
+        self.db.add_vk_id('id55b', False)
+        self.assertEqual(self.db._cursor.execute(count_query).fetchone()[0], 1)
+        self.db.add_vk_id('id55b', True)
+        self.assertEqual(self.db._cursor.execute(count_query).fetchone()[0], 2)
+        # Разные fifty у одного vk_id - конфликт для админа.
+        self.assertIn('id55b', self.db.delete_duplicates()['vk_id'])
+        # Обычное обновление не удаляет строку молча, а падает на уникальном индексе.
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db._update_table('vk_ids', {'fifty': True}, {'vk_id': 'id55b'})
+        self.assertEqual(self.db._cursor.execute(count_query).fetchone()[0], 2)
+        # update_fifty сливает строки vk_id явно: остается первая, с новым fifty.
+        self.db.update_fifty('id55b')
+        self.assertEqual(self.db._cursor.execute('select vk_id, fifty from vk_ids where vk_id = "id55b"').fetchall(),
+                         [('id55b', 1)])
+        # publics_to_clubs сливает public77 с уже существующим club77.
+        self.db.add_vk_id('public77', False)
+        self.db.add_vk_id('club77', False)
+        self.db.publics_to_clubs()
+        self.assertEqual(self.db._cursor.execute('select vk_id, fifty from vk_ids where vk_id like "%77"').fetchall(),
+                         [('club77', 0)])
+        self.db.add_cards(['1111', '1111'], 'id55b')
+        self.assertEqual(self.db._cursor.execute('select count(*) from cards where card = "1111"').fetchone()[0], 1)
+
+    def test_migrate(self):
+        self.assertEqual(self.db.get_schema_version(), max(sql_requests.migrations))
+        indexes = self.db._cursor.execute('select tbl_name, sql from sqlite_master where type = "index"').fetchall()
+        indexed_tables = {table for table, sql in indexes if sql}
+        self.assertTrue({'vk_ids', 'screen_names', 'telephones', 'cards', 'proof_links'} <= indexed_tables)
+        plan = self.db._cursor.execute('explain query plan select vk_id from cards where card = "1234"').fetchall()
+        self.assertIn('INDEX', str(plan))
+
+        # Повторное открытие не должно ничего ломать и менять версию.
+        del self.db
+        self.db = database.DBCheaters(TEST_DB)
+        self.assertEqual(self.db.get_schema_version(), max(sql_requests.migrations))
 
 
 
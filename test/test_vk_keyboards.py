@@ -0,0 +1,83 @@
+"""
+Тестирование клавиатур vk_keyboards.py
+"""
+import json
+import unittest
+
+import vk_keyboards
+from dialogstates import DialogStates, AdminStates
+
+MAIN_ROWS = [
+    [('Рассказать про кидалу', {'main': 'tell_about_cheater'}, 'primary')],
+    [('Помочь нам', {'main': 'help_us'}, 'positive')],
+    [('Как проверить', {'main': 'how_check'}, 'secondary')],
+]
+MAIN_ADMIN_ROWS = [
+    [('Админ меню', {'main': 'admin'}, 'negative')],
+]
+
+# {уровень меню: (inline, ряды, ряды только для админов)}, кнопка - (текст, payload, цвет).
+EXPECTED = {
+    None: (False, MAIN_ROWS, MAIN_ADMIN_ROWS),
+    # Своей клавиатуры нет - выдается главная.
+    AdminStates.DEL_CHEATER_CHOICE: (False, MAIN_ROWS, MAIN_ADMIN_ROWS),
+    DialogStates.TELL_ABOUT_CHEATER_STATE: (False, [[('Передумал', {'tell_about_cheater': 'main'}, 'negative')]], []),
+    AdminStates.MAIN: (False, [
+        [('Добавить кидалу', {'admin': 'add_cheater'}, 'positive'),
+         ('Удалить кидалу', {'admin': 'del_cheater'}, 'negative')],
+        [('Разослать всем чо-то', {'admin': 'mass_sending'}, 'positive'),
+         ('Вернуться на главную', {'admin': 'return_to_main'}, 'negative')],
+    ], []),
+    AdminStates.SPAM: (False, [[('Передумал', {'admin': 'main'}, 'negative')]], []),
+    AdminStates.ADD_CHEATER: (False, [[('Добавить', {'admin': 'add'}, 'positive'),
+                                       ('Передумал', {'admin': 'main'}, 'negative')]], []),
+    AdminStates.DEL_CHEATER: (False, [[('Передумал', {'admin': 'main'}, 'negative')]], []),
+    AdminStates.DEL_CHEATER_COMMIT: (True, [[('Да', {'del_cheater': 'yes'}, 'negative'),
+                                             ('Нет', {'del_cheater': 'no'}, 'positive')]], []),
+}
+
+
+def expected_keyboard(inline: bool, rows: list) -> dict:
+    """
+    Клавиатура в том виде, в котором ее ждет VK API.
+    """
+    return {
+        'one_time': False,
+        'inline': inline,
+        'buttons': [[{'action': {'label': label, 'payload': json.dumps(payload), 'type': 'text'}, 'color': color}
+                     for label, payload, color in row]
+                    for row in rows],
+    }
+
+
+class TestKeyboards(unittest.TestCase):
+    def test_keyboard_json(self):
+        self.assertEqual(set(EXPECTED) - {AdminStates.DEL_CHEATER_CHOICE}, set(vk_keyboards.KEYBOARDS))
+        for menu_level, (inline, rows, admin_rows) in EXPECTED.items():
+            for is_admin in (False, True):
+                with self.subTest(menu_level=menu_level, is_admin=is_admin):
+                    expected = expected_keyboard(inline, rows + admin_rows if is_admin else rows)
+                    self.assertEqual(json.loads(vk_keyboards.get_keyboard(menu_level, is_admin)), expected)
+
+    def test_keyboard_cache(self):
+        keyboard = vk_keyboards.get_keyboard(AdminStates.MAIN, True)
+        self.assertIs(vk_keyboards.get_keyboard(AdminStates.MAIN, True), keyboard)
+        # is_admin приводится к bool: 1 и True - одна запись кеша.
+        self.assertIs(vk_keyboards.get_keyboard(AdminStates.MAIN, 1), keyboard)
+        self.assertIsNot(vk_keyboards.get_keyboard(AdminStates.MAIN, False), keyboard)
+        # Неизвестный уровень меню берет ту же клавиатуру, что и главное.
+        self.assertIs(vk_keyboards.get_keyboard(AdminStates.DEL_CHEATER_CHOICE), vk_keyboards.get_keyboard(None))
+
+        # Перерегистрация клавиатуры сбрасывает кеш.
+        layout = vk_keyboards.KEYBOARDS[AdminStates.SPAM]
+        try:
+            vk_keyboards.register_keyboard(AdminStates.SPAM, [[vk_keyboards.Button('Стоп', {'admin': 'main'})]])
+            button = json.loads(vk_keyboards.get_keyboard(AdminStates.SPAM))['buttons'][0][0]
+            self.assertEqual(button['action']['label'], 'Стоп')
+        finally:
+            vk_keyboards.register_keyboard(AdminStates.SPAM, layout.rows, layout.admin_rows, layout.inline)
+        self.assertIsNot(vk_keyboards.get_keyboard(AdminStates.MAIN, True), keyboard)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
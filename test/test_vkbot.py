@@ -2,29 +2,534 @@
 Тестирование методов vkbot'а
 """
 
+import asyncio
+import threading
+import time
+import types
 import unittest
+import unittest.mock
+import aiohttp.test_utils
+import aiohttp.web
+import async_database
+import broadcast
+import callback_server
+import dialogs
+import outbox
+import ratelimit
+import state_storage
+from dialogstates import AdminStates
 import cheaters
 import vkbot
 import shutil
+from vkbottle.exception_factory import VKAPIError
 
 TEMPLATE_DB = 'cheaters.db'
 TEST_DB = 'test-cheaters.db'
 
 
-class TestBot(unittest.TestCase):
+class TestBot(unittest.IsolatedAsyncioTestCase):
     def setUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
         self.bot = vkbot.VKBot('123',
                                TEST_DB,
                                'kidaly.txt')
-        shutil.copyfile(TEMPLATE_DB, TEST_DB)
 
+    def tearDown(self) -> None:
+        self.bot.db.close()
 
-    def test_get_cheater_by_id(self):
+    async def test_get_cheater_by_id(self):
         vk_id = 'id210886928'
         cheater = cheaters.Cheater(vk_id=vk_id,
                                    screen_name='v.timofeev2001',
                                    proof_link=['wall-49018503_271397'])
-        self.assertEqual(self.bot.get_cheater_by_id(vk_id=vk_id), cheater)
+        self.assertEqual(await self.bot.get_cheater_by_id(vk_id=vk_id), cheater)
+
+    async def test_memory_index_matches_db(self):
+        await self.bot.db.add_cheater({'vk_id': 'club332211', 'fifty': True, 'screen_name': 'Very_Poor_Club',
+                                       'telephone': ['79990004455'], 'card': ['1234567812345678'],
+                                       'proof_link': ['wall-123']})
+        queries = [('vk_id', '210886928'), ('vk_id', '0'), ('group_id', '332211'),
+                   ('screen_name', 'v.timofeev2001'), ('screen_name', 'V.Timofeev2001'),
+                   ('screen_name', 'Very_Poor_Club'), ('screen_name', 'very_poor_club'), ('screen_name', ''),
+                   ('telephone', '79990004455'), ('telephone', '7-999-000-44-55'), ('telephone', ''),
+                   ('card', '1234567812345678'), ('card', '1234 5678 1234 5678'), ('card', 'abc'), ('card', ''),
+                   ('proof_link', 'wall-49018503_271397'), ('proof_link', 'WALL-123'), ('proof_link', '')]
+        from_db = [await self.bot.get_cheater_from_db2(param, value) for param, value in queries]
+        await self.bot.db.load_index()
+        from_index = [await self.bot.get_cheater_from_db2(param, value) for param, value in queries]
+        for query, db_result, index_result in zip(queries, from_db, from_index):
+            with self.subTest(query=query):
+                self.assertEqual(index_result, db_result)
+        # Запросы не пустые: совпадения есть, но только точные.
+        self.assertEqual([query for query, result in zip(queries, from_db) if result],
+                         [queries[0], queries[2], queries[3], queries[5], queries[8], queries[11], queries[15]])
+
+
+class TestGroupAdminsCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
+        self.bot = vkbot.VKBot('123', TEST_DB, 'kidaly.txt', admins_cache_ttl=60)
+        self.bot.group_id = 1
+        self.requests = 0
+        self.managers = [1, 2]
+
+        async def get_members(group_id, filter):
+            self.requests += 1
+            return types.SimpleNamespace(items=[types.SimpleNamespace(id=i) for i in self.managers])
+
+        self.bot.api = types.SimpleNamespace(groups=types.SimpleNamespace(get_members=get_members))
+
+    def tearDown(self) -> None:
+        self.bot.db.close()
+
+    async def test_is_admin_uses_cache(self):
+        admins = self.bot.group_admins
+        self.assertTrue(await self.bot.is_admin(1))
+        self.assertFalse(await self.bot.is_admin(3))
+        self.assertEqual(self.requests, 1)
+
+        self.managers = [3]
+        self.assertFalse(await self.bot.is_admin(3))
+        self.bot.invalidate_group_admins()
+        self.assertTrue(await self.bot.is_admin(3))
+        self.assertEqual(self.requests, 2)
+        # Список обновляется на месте - правила с ссылкой на него видят новых админов.
+        self.assertIs(self.bot.group_admins, admins)
+        self.assertEqual(admins, [3])
+
+
+class TestProfileCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
+        self.bot = vkbot.VKBot('123', TEST_DB, 'kidaly.txt', profile_cache_size=2)
+        self.requests = []
+
+        async def get(user_ids, fields):
+            self.requests.append(user_ids[0])
+            await asyncio.sleep(0)
+            return [types.SimpleNamespace(first_name='Name' + str(user_ids[0]), screen_name='id' + str(user_ids[0]),
+                                          deactivated=None)]
+
+        self.bot.api = types.SimpleNamespace(users=types.SimpleNamespace(get=get))
+
+    def tearDown(self) -> None:
+        self.bot.db.close()
+
+    async def test_single_flight_and_lru(self):
+        profiles = await asyncio.gather(*(self.bot.get_user_profile(1) for _ in range(5)))
+        self.assertEqual(self.requests, [1])
+        self.assertEqual(profiles[0], vkbot.UserProfile('Name1', 'id1', False))
+        self.assertTrue(all(profile is profiles[0] for profile in profiles))
+
+        await self.bot.get_user_profile(2)
+        await self.bot.get_user_profile(1)
+        # Кеш на 2 профиля: 3 вытесняет давно не использованный 2.
+        await self.bot.get_user_profile(3)
+        await self.bot.get_user_profile(1)
+        await self.bot.get_user_profile(2)
+        self.assertEqual(self.requests, [1, 2, 3, 2])
+
+        self.bot.profile_cache.ttl = -1
+        self.bot.profile_cache.invalidate()
+        await self.bot.get_user_profile(1)
+        await self.bot.get_user_profile(1)
+        self.assertEqual(self.requests, [1, 2, 3, 2, 1, 1])
+
+
+class TestResolveCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
+        self.bot = vkbot.VKBot('123', TEST_DB, 'kidaly.txt')
+        self.requests = []
+        users = {'1': types.SimpleNamespace(id=1, screen_name='durov', first_name='Pavel', last_name='Durov',
+                                            deactivated=None),
+                 '2': types.SimpleNamespace(id=2, screen_name='id2', first_name='Ivan', last_name='Ivanov',
+                                            deactivated=None)}
+        # Старые имена: API находит по ним страницу, но возвращает ее под новым именем.
+        old_names = {'pavel_old': '1'}
+        groups = {'5': types.SimpleNamespace(id=5, screen_name='myclub', name='Club', ban_info=None,
+                                             deactivated=None, type=types.SimpleNamespace(value='page'))}
+
+        async def users_get(user_ids, fields):
+            self.requests.append(('users', list(user_ids)))
+            found = [user for key, user in users.items() if key in user_ids or user.screen_name in user_ids
+                     or any(old_names[name] == key for name in user_ids if name in old_names)]
+            if len(found) < len(user_ids):
+                raise VKAPIError[113](error_msg='Invalid user id', request_params=[])
+            return found
+
+        async def groups_get(group_ids, fields):
+            self.requests.append(('groups', list(group_ids)))
+            found = [group for key, group in groups.items() if key in group_ids or group.screen_name in group_ids]
+            if len(found) < len(group_ids):
+                raise VKAPIError[100](error_msg='Invalid group id', request_params=[])
+            return found
+
+        self.bot.api = types.SimpleNamespace(users=types.SimpleNamespace(get=users_get),
+                                             groups=types.SimpleNamespace(get_by_id=groups_get))
+
+    def tearDown(self) -> None:
+        self.bot.db.close()
+
+    async def test_resolve_uses_db_cache(self):
+        pages = await self.bot.resolve_pages(['id1', 'myclub', 'club5', 'nobody'])
+        self.assertEqual(pages['id1'], vkbot.ResolvedPage('user', 1, 'durov', 'Pavel Durov', False))
+        self.assertEqual(pages['myclub'].vk_id, 'public5')
+        self.assertIs(pages['club5'], pages['myclub'])
+        self.assertEqual(pages['nobody'].page_id, 0)
+        self.assertTrue(self.requests)
+
+        # Все уже в кеше, включая screen_name, найденный по id, и то, что nobody не существует.
+        self.requests.clear()
+        self.assertEqual(await self.bot.get_from_api_id_screen_name_banned('Durov'),
+                         ('id1', 'durov', False, 'Pavel Durov'))
+        self.assertEqual(await self.bot.get_from_api_id_screen_name_banned('nobody'), ('', '', False, ''))
+        self.assertEqual(self.requests, [])
+
+        # Отрицательный кеш живет меньше: устаревшая запись спрашивается у API снова.
+        negative_ttl = vkbot.RESOLVE_NEGATIVE_TTL
+        vkbot.RESOLVE_NEGATIVE_TTL = -1
+        try:
+            await self.bot.resolve_pages(['nobody', 'id1'])
+        finally:
+            vkbot.RESOLVE_NEGATIVE_TTL = negative_ttl
+        self.assertEqual(self.requests, [('users', ['nobody']), ('groups', ['nobody'])])
+
+    async def test_resolve_renamed_in_batch(self):
+        # В пачке ответ про старое имя приходит под новым - такое имя спрашивается еще раз отдельно,
+        # а не попадает в отрицательный кеш.
+        pages = await self.bot.resolve_pages(['pavel_old', 'id2'])
+        self.assertEqual(pages['pavel_old'].vk_id, 'id1')
+        self.assertEqual(pages['id2'].vk_id, 'id2')
+        self.assertEqual(self.requests, [('users', ['pavel_old', '2']), ('groups', ['pavel_old']),
+                                         ('users', ['pavel_old'])])
+        self.requests.clear()
+        self.assertEqual((await self.bot.resolve_pages(['pavel_old']))['pavel_old'].vk_id, 'id1')
+        self.assertEqual(self.requests, [])
+
+        # Без переименований ненайденное по одному не переспрашивается.
+        await self.bot.resolve_pages(['nobody', 'id2', 'club5'])
+        self.assertEqual(self.requests, [('users', ['nobody']), ('groups', ['5', 'nobody']), ('groups', ['5']),
+                                         ('groups', ['nobody'])])
+
+
+class TestImport(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
+        self.bot = vkbot.VKBot('123', TEST_DB, 'kidaly.txt')
+        self.answers = []
+
+        async def answer_to_peer(text, peer_id, new_state=None, **payload):
+            self.answers.append((peer_id, text))
+
+        self.bot.answer_to_peer = answer_to_peer
+        self.file_body = b''
+        app = aiohttp.web.Application()
+        app.router.add_get('/file.txt', self._serve_file)
+        self.server = aiohttp.test_utils.TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self) -> None:
+        await self.server.close()
+        self.bot.db.close()
+
+    async def _serve_file(self, request):
+        return aiohttp.web.Response(body=self.file_body)
+
+    async def test_rate_limiter(self):
+        bucket = ratelimit.TokenBucket(50, capacity=1)
+        started = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        # Первый токен есть сразу, остальные 5 ждут по 1/50 с.
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    async def test_one_import_at_a_time(self):
+        release = asyncio.Event()
+
+        async def download_file(url):
+            await release.wait()
+            return ''
+
+        self.bot._download_file = download_file
+        self.assertTrue(self.bot.start_update_cheaters_from_file('url', 7))
+        self.assertFalse(self.bot.start_update_cheaters_from_file('url', 7))
+        release.set()
+        await self.bot._import_task
+        self.assertEqual(self.answers, [(7, dialogs.no_data_in_file)])
+        # Предыдущий импорт закончился - можно запускать следующий.
+        self.assertTrue(self.bot.start_update_cheaters_from_file('url', 7))
+        await self.bot._import_task
+
+    async def test_file_size_limit(self):
+        url = str(self.server.make_url('/file.txt'))
+        with unittest.mock.patch.object(vkbot, 'IMPORT_MAX_FILE_SIZE', 1000):
+            self.file_body = b'x' * 1001
+            self.assertEqual(await self.bot.update_cheaters_from_file(url), dialogs.file_download_error)
+            self.file_body = b'x' * 1000
+            self.assertEqual(await self.bot._download_file(url), 'x' * 1000)
+
+
+class TestAsyncDB(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
+        self.db = async_database.AsyncDBCheaters(TEST_DB)
+
+    def tearDown(self) -> None:
+        self.db.close()
+
+    async def test_calls_run_in_db_thread(self):
+        vk_id = 'id210886928'
+        thread_names = await self.db.run(lambda db: threading.current_thread().name)
+        self.assertTrue(thread_names.startswith('db'))
+        cheaters_db = await self.db.get_cheaters_by_ids([vk_id])
+        self.assertEqual(cheaters_db[0].screen_name, 'v.timofeev2001')
+        # Статический метод тоже идет через поток БД.
+        self.assertEqual(await self.db._tuple_list_to_list([(1, 2), (3,)]), [1, 2, 3])
+        self.assertEqual(self.db.db_filename, TEST_DB)
+
+    async def test_close(self):
+        await self.db.add_vk_id('id_before_close')
+        self.db.close()
+        # Повторное закрытие (например, в tearDown после остановки бота) ничего не делает.
+        self.db.close()
+        with self.assertRaises(RuntimeError):
+            await self.db.get_cheaters_by_ids(['id_before_close'])
+        self.db = async_database.AsyncDBCheaters(TEST_DB)
+        self.assertEqual(len(await self.db.get_cheaters_by_ids(['id_before_close'])), 1)
+
+
+class TestStateStorage(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
+        self.db = async_database.AsyncDBCheaters(TEST_DB)
+
+    def tearDown(self) -> None:
+        self.db.close()
+
+    async def test_states_survive_restart(self):
+        cheater = cheaters.Cheater(vk_id='id1', screen_name='durov', card=['4000000000000001'])
+        states = state_storage.SQLiteStateDispenser(self.db)
+        await states.set(1, AdminStates.DEL_CHEATER_COMMIT, cheaters_to_del=[cheater], item_to_del={'vk_id': '1'})
+        await states.set(2, AdminStates.ADD_CHEATER, cheater_add=cheater, cheater_db=None)
+        await states.set(3, AdminStates.MAIN)
+        await states.delete(3)
+        await states.flush()
+
+        restarted = state_storage.SQLiteStateDispenser(self.db)
+        await restarted.load()
+        self.assertEqual(len(restarted), 2)
+        state_peer = await restarted.get(1)
+        self.assertEqual(state_peer.state, 'AdminStates:' + AdminStates.DEL_CHEATER_COMMIT.value)
+        self.assertEqual(state_peer.payload, {'cheaters_to_del': [cheater], 'item_to_del': {'vk_id': '1'}})
+        self.assertEqual((await restarted.get(2)).payload, {'cheater_add': cheater, 'cheater_db': None})
+        self.assertIsNone(await restarted.get(3))
+
+    async def test_states_expire(self):
+        states = state_storage.SQLiteStateDispenser(self.db, ttl=60)
+        await states.set(1, AdminStates.MAIN)
+        await states.set(2, AdminStates.MAIN)
+        states._updated[1] -= 120
+        self.assertIsNone(await states.get(1))
+        states._updated[2] -= 120
+        self.assertEqual(states.evict_expired(), 1)
+        self.assertEqual(len(states), 0)
+        await states.flush()
+        self.assertEqual(await self.db.load_states(0), [])
+
+
+class TestCallbackServer(unittest.IsolatedAsyncioTestCase):
+    # Событие message_new в том виде, в котором его присылает VK.
+    MESSAGE_NEW = {
+        'type': 'message_new',
+        'event_id': 'a1b2c3',
+        'v': '5.131',
+        'group_id': 1,
+        'secret': 'secret',
+        'object': {
+            'message': {'date': 1650000000, 'from_id': 10, 'id': 1, 'out': 0, 'peer_id': 10,
+                        'text': 'ping', 'conversation_message_id': 1, 'fwd_messages': [],
+                        'important': False, 'random_id': 0, 'attachments': [], 'is_hidden': False},
+            'client_info': {'button_actions': ['text'], 'keyboard': True, 'inline_keyboard': True,
+                            'carousel': True, 'lang_id': 0},
+        },
+    }
+
+    async def asyncSetUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
+        self.bot = vkbot.VKBot('123', TEST_DB, 'kidaly.txt')
+        self.bot.group_id = 1
+        self.texts = []
+
+        @self.bot.on.message(text='ping')
+        async def ping_handler(message):
+            self.texts.append(message.text)
+
+        settings = callback_server.CallbackSettings(port=1, secret_key='secret', confirmation_code='code')
+        server = callback_server.CallbackServer(self.bot, settings)
+        self.client = aiohttp.test_utils.TestClient(aiohttp.test_utils.TestServer(server.make_app()))
+        await self.client.start_server()
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        self.bot.db.close()
+
+    async def test_events(self):
+        response = await self.client.post('/', json={'type': 'confirmation', 'group_id': 1, 'secret': 'secret'})
+        self.assertEqual(await response.text(), 'code')
+
+        response = await self.client.post('/', json={**self.MESSAGE_NEW, 'secret': 'wrong'})
+        self.assertEqual(response.status, 403)
+        response = await self.client.post('/', data='not json')
+        self.assertEqual(response.status, 400)
+
+        # Повтор того же события VK не должен обработаться второй раз.
+        for _ in range(2):
+            response = await self.client.post('/', json=self.MESSAGE_NEW)
+            self.assertEqual(await response.text(), 'ok')
+        await asyncio.gather(*self.bot._background_tasks)
+        self.assertEqual(self.texts, ['ping'])
+
+
+class TestOutbox(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.requests = []
+        self.errors = []
+
+        async def send(**params):
+            self.requests.append(params)
+            if self.errors:
+                raise self.errors.pop(0)
+            return params.get('peer_id') or params['peer_ids']
+
+        api = types.SimpleNamespace(messages=types.SimpleNamespace(send=send))
+        self.sender = outbox.MessageSender(api, rate=1000, retry_delay=0)
+        self.task = asyncio.get_running_loop().create_task(self.sender.run())
+
+    async def asyncTearDown(self) -> None:
+        self.task.cancel()
+
+    async def test_coalesce(self):
+        futures = [self.sender.put(peer_id, 'hi') for peer_id in (1, 2, 3)]
+        futures.append(self.sender.put(1, 'bye'))
+        futures.append(self.sender.put(4, 'hi'))
+        futures.append(self.sender.put(1, 'hi'))
+        await asyncio.gather(*futures)
+        self.assertEqual([(request.get('peer_id') or request['peer_ids'], request['message'])
+                          for request in self.requests],
+                         [([1, 2, 3, 4], 'hi'), (1, 'bye'), (1, 'hi')])
+        metrics = self.sender.metrics()
+        self.assertEqual(metrics['messages'], 6)
+        self.assertEqual(metrics['requests'], 3)
+        self.assertEqual(metrics['queue_depth'], 0)
+
+    async def test_retry_on_flood(self):
+        self.errors = [VKAPIError[9](error_msg='Flood control', request_params=[])]
+        self.assertEqual(await self.sender.send(1, 'hi'), 1)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.requests[0]['random_id'], self.requests[1]['random_id'])
+        self.assertEqual(self.sender.metrics()['retries'], 1)
+
+        self.errors = [VKAPIError[7](error_msg='Permission denied', request_params=[])]
+        with self.assertRaises(VKAPIError):
+            await self.sender.send(1, 'hi')
+        self.assertEqual(self.sender.metrics()['failed'], 1)
+
+
+class TestBroadcast(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        shutil.copyfile(TEMPLATE_DB, TEST_DB)
+        self.db = async_database.AsyncDBCheaters(TEST_DB)
+        self.members = list(range(2500, 0, -1))
+        self.pages = []
+        self.requests = []
+        self.reports = []
+        self.send_errors = []  # ошибки очередных messages.send (None - отправить)
+        self.members_errors = []
+
+        async def get_members(group_id, offset, count, sort):
+            self.pages.append(offset)
+            if self.members_errors and self.members_errors.pop(0):
+                raise aiohttp.ClientError('connection reset')
+            members = sorted(self.members)
+            return types.SimpleNamespace(count=len(members), items=members[offset:offset + count])
+
+        async def send(**params):
+            if self.send_errors:
+                error = self.send_errors.pop(0)
+                if error is not None:
+                    raise error
+            self.requests.append(params['peer_ids'])
+            # Одному получателю из пачки сообщения от группы запрещены.
+            return [types.SimpleNamespace(peer_id=peer_id, error=peer_id == params['peer_ids'][0] or None)
+                    for peer_id in params['peer_ids']]
+
+        async def report(peer_id, text):
+            self.reports.append((peer_id, text))
+
+        api = types.SimpleNamespace(groups=types.SimpleNamespace(get_members=get_members),
+                                    messages=types.SimpleNamespace(send=send))
+        self.sender = outbox.MessageSender(api, rate=1000)
+        self.task = asyncio.get_running_loop().create_task(self.sender.run())
+        self.broadcaster = broadcast.Broadcaster(api, self.db, self.sender, report, report_interval=0,
+                                                 batch_retries=1, retry_delay=0)
+
+    async def asyncTearDown(self) -> None:
+        self.task.cancel()
+        self.db.close()
+
+    async def test_broadcast(self):
+        pk = await self.db.add_broadcast('hi', 7)
+        state = await self.broadcaster.run(1, broadcast.BroadcastState(pk, 'hi', 7))
+        self.assertEqual(sorted(self.pages), [0, 1000, 2000])
+        self.assertEqual(len(self.requests), 25)
+        self.assertTrue(all(len(peer_ids) == 100 for peer_ids in self.requests))
+        self.assertEqual(sum(self.requests, []), list(range(1, 2501)))
+        self.assertEqual((state.total, state.sent, state.failed), (2500, 2475, 25))
+        self.assertEqual(await self.db.get_unfinished_broadcasts(), [])
+        self.assertEqual(self.reports[-1], (7, dialogs.spam_done.format(2475, 2500, 25)))
+
+    async def test_resume_skips_sent(self):
+        pk = await self.db.add_broadcast('hi', 7)
+        # Первые 1200 уже получили сообщение до рестарта.
+        await self.db.update_broadcast(pk, 2500, 1190, 10, 1200)
+        self.assertEqual(await self.db.get_unfinished_broadcasts(), [(pk, 'hi', 7, 2500, 1190, 10, 1200)])
+        self.assertTrue(self.broadcaster.resume(1))
+        self.assertFalse(self.broadcaster.start(1, 'bye', 7))
+        await self.broadcaster._task
+        self.assertEqual(sum(self.requests, []), list(range(1201, 2501)))
+        self.assertEqual(await self.db.get_unfinished_broadcasts(), [])
+
+    async def test_send_errors(self):
+        self.members = list(range(1, 401))
+        pk = await self.db.add_broadcast('hi', 7)
+        # Вторая пачка: сеть упала один раз - пачка повторяется; третью VK отверг - она недоставлена.
+        self.send_errors = [None, aiohttp.ClientError('timeout'), None,
+                            VKAPIError[7](error_msg='Permission denied', request_params=[])]
+        state = await self.broadcaster.run(1, broadcast.BroadcastState(pk, 'hi', 7))
+        self.assertEqual(sum(self.requests, []), list(range(1, 101)) + list(range(101, 201)) + list(range(301, 401)))
+        self.assertEqual((state.sent, state.failed), (297, 103))
+        self.assertEqual(self.broadcaster.transient_errors, 1)
+
+        # Пачка так и не ушла: рассылка прерывается, checkpoint остается перед ней.
+        self.requests.clear()
+        pk = await self.db.add_broadcast('bye', 7)
+        self.send_errors = [None] + [aiohttp.ClientError('timeout')] * 2
+        with self.assertRaises(aiohttp.ClientError):
+            await self.broadcaster.run(1, broadcast.BroadcastState(pk, 'bye', 7))
+        self.assertEqual(await self.db.get_unfinished_broadcasts(), [(pk, 'bye', 7, 400, 99, 1, 100)])
+        self.assertEqual(self.broadcaster.transient_errors, 3)
+
+    async def test_resume_continues_after_error(self):
+        first = await self.db.add_broadcast('hi', 7)
+        second = await self.db.add_broadcast('bye', 8)
+        # Для первой рассылки не удалось получить членов группы.
+        self.members_errors = [True]
+        self.assertTrue(self.broadcaster.resume(1))
+        await self.broadcaster._task
+        self.assertEqual([row[0] for row in await self.db.get_unfinished_broadcasts()], [first])
+        self.assertEqual(sum(self.requests, []), list(range(1, 2501)))
+        self.assertIn((8, dialogs.spam_done.format(2475, 2500, 25)), self.reports)
 
 
 if __name__ == '__main__':
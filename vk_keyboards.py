@@ -1,12 +1,83 @@
 """
-JSON для клавиатур
+JSON для клавиатур.
+Клавиатуры описываются данными через register_keyboard, JSON каждой собирается один раз и берется из кеша.
 """
+import functools
+import json
+from typing import Dict, List, NamedTuple, Optional
 
 from vkbottle import Keyboard, KeyboardButtonColor, Text
 from vkbottle import BaseStateGroup
 from dialogstates import DialogStates, AdminStates
 
 
+class Button(NamedTuple):
+    """
+    Описание кнопки.
+      label: str
+        текст на кнопке
+      payload: dict
+        payload, который придет в сообщении
+      color: KeyboardButtonColor
+        цвет кнопки
+    """
+    label: str
+    payload: dict
+    color: KeyboardButtonColor = KeyboardButtonColor.SECONDARY
+
+
+class KeyboardLayout(NamedTuple):
+    """
+    Описание клавиатуры.
+      rows: List[List[Button]]
+        ряды кнопок
+      admin_rows: List[List[Button]]
+        ряды, которые добавляются в конец только для админов
+      inline: bool
+        клавиатура в сообщении
+    """
+    rows: List[List[Button]]
+    admin_rows: List[List[Button]] = []
+    inline: bool = False
+
+
+# Реестр клавиатур: {уровень меню: описание}. None - главная клавиатура,
+# она же выдается для уровней без своей клавиатуры, чтобы пользователь не оставался без кнопок.
+KEYBOARDS: Dict[Optional[BaseStateGroup], KeyboardLayout] = {}
+
+
+def register_keyboard(menu_level: Optional[BaseStateGroup],
+                      rows: List[List[Button]],
+                      admin_rows: List[List[Button]] = None,
+                      inline: bool = False):
+    """
+    Регистрирует клавиатуру для уровня меню. Если клавиатура уже была - заменяет ее.
+
+    :param menu_level: Для какого меню клавиатура (None - главная).
+    :param rows: Ряды кнопок.
+    :param admin_rows: Ряды кнопок, которые видят только админы.
+    :param inline: Клавиатура в сообщении.
+    """
+    KEYBOARDS[menu_level] = KeyboardLayout(rows, admin_rows or [], inline)
+    _get_keyboard_json.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_keyboard_json(menu_level: Optional[BaseStateGroup], is_admin: bool) -> str:
+    """
+    Собирает json клавиатуры из реестра. Результат кешируется.
+    """
+    layout = KEYBOARDS[menu_level]
+    keyboard = Keyboard(one_time=False, inline=layout.inline)
+    rows = layout.rows + layout.admin_rows if is_admin else layout.rows
+    for number, row in enumerate(rows):
+        if number:
+            keyboard.row()
+        for button in row:
+            keyboard.add(Text(button.label, payload=json.dumps(button.payload)), color=button.color)
+    return keyboard.get_json()
+
+
 def get_keyboard(menu_level: BaseStateGroup = None, is_admin: bool = False) -> str:
     """
     Возвращает json клавиатуры.
@@ -15,60 +86,57 @@ def get_keyboard(menu_level: BaseStateGroup = None, is_admin: bool = False) -> s
     :param is_admin: Если клавиатура предусматривает опционально админские кнопки, ставить True.
     :return: json клавиатуры.
     """
-    # Главная клавиатура в конце.
-    # Сделано специально, чтобы пользователь не оставался без клавиатуры.
-    if menu_level == DialogStates.TELL_ABOUT_CHEATER_STATE:
-        keyboard = Keyboard(one_time=False, inline=False)
-        keyboard.add(Text("Передумал", payload='{"tell_about_cheater": "main"}'),
-                     color=KeyboardButtonColor.NEGATIVE)
-
-    elif menu_level == AdminStates.MAIN:
-        keyboard = Keyboard(one_time=False, inline=False)
-        keyboard.add(Text("Добавить кидалу", payload='{"admin": "add_cheater"}'),
-                     color=KeyboardButtonColor.POSITIVE)
-        keyboard.add(Text("Удалить кидалу", payload='{"admin": "del_cheater"}'),
-                     color=KeyboardButtonColor.NEGATIVE)
-        keyboard.row()
-        keyboard.add(Text("Разослать всем чо-то", payload='{"admin": "mass_sending"}'),
-                     color=KeyboardButtonColor.POSITIVE)
-        keyboard.add(Text("Вернуться на главную", payload='{"admin": "return_to_main"}'),
-                     color=KeyboardButtonColor.NEGATIVE)
-
-    elif menu_level == AdminStates.SPAM:
-        keyboard = Keyboard(one_time=False, inline=False)
-        keyboard.add(Text("Передумал", payload='{"admin": "main"}'),
-                     color=KeyboardButtonColor.NEGATIVE)
-
-    elif menu_level == AdminStates.ADD_CHEATER:
-        keyboard = Keyboard(one_time=False, inline=False)
-        keyboard.add(Text("Добавить", payload='{"admin": "add"}'),
-                     color=KeyboardButtonColor.POSITIVE)
-        keyboard.add(Text("Передумал", payload='{"admin": "main"}'),
-                     color=KeyboardButtonColor.NEGATIVE)
-
-    elif menu_level == AdminStates.DEL_CHEATER:
-        keyboard = Keyboard(one_time=False, inline=False)
-        keyboard.add(Text("Передумал", payload='{"admin": "main"}'),
-                     color=KeyboardButtonColor.NEGATIVE)
-    elif menu_level == AdminStates.DEL_CHEATER_COMMIT:
-        keyboard = Keyboard(one_time=False, inline=True)
-        keyboard.add(Text("Да", payload='{"del_cheater": "yes"}'),
-                     color=KeyboardButtonColor.NEGATIVE)
-        keyboard.add(Text("Нет", payload='{"del_cheater": "no"}'),
-                     color=KeyboardButtonColor.POSITIVE)
-    else:
-        keyboard = Keyboard(one_time=False, inline=False)
-        keyboard.add(Text("Рассказать про кидалу", payload='{"main": "tell_about_cheater"}'),
-                     color=KeyboardButtonColor.PRIMARY)
-        keyboard.row()
-        keyboard.add(Text("Помочь нам", payload='{"main": "help_us"}'),
-                     color=KeyboardButtonColor.POSITIVE)
-        keyboard.row()
-        keyboard.add(Text("Как проверить", payload='{"main": "how_check"}'),
-                     color=KeyboardButtonColor.SECONDARY)
-        if is_admin:
-            keyboard.row()
-            keyboard.add(Text("Админ меню", payload='{"main": "admin"}'),
-                         color=KeyboardButtonColor.NEGATIVE)
+    if menu_level not in KEYBOARDS:
+        menu_level = None
+    return _get_keyboard_json(menu_level, bool(is_admin))
 
-    return keyboard.get_json()
+
+register_keyboard(
+    None,
+    [
+        [Button("Рассказать про кидалу", {"main": "tell_about_cheater"}, KeyboardButtonColor.PRIMARY)],
+        [Button("Помочь нам", {"main": "help_us"}, KeyboardButtonColor.POSITIVE)],
+        [Button("Как проверить", {"main": "how_check"}, KeyboardButtonColor.SECONDARY)],
+    ],
+    admin_rows=[
+        [Button("Админ меню", {"main": "admin"}, KeyboardButtonColor.NEGATIVE)],
+    ],
+)
+
+register_keyboard(
+    DialogStates.TELL_ABOUT_CHEATER_STATE,
+    [[Button("Передумал", {"tell_about_cheater": "main"}, KeyboardButtonColor.NEGATIVE)]],
+)
+
+register_keyboard(
+    AdminStates.MAIN,
+    [
+        [Button("Добавить кидалу", {"admin": "add_cheater"}, KeyboardButtonColor.POSITIVE),
+         Button("Удалить кидалу", {"admin": "del_cheater"}, KeyboardButtonColor.NEGATIVE)],
+        [Button("Разослать всем чо-то", {"admin": "mass_sending"}, KeyboardButtonColor.POSITIVE),
+         Button("Вернуться на главную", {"admin": "return_to_main"}, KeyboardButtonColor.NEGATIVE)],
+    ],
+)
+
+register_keyboard(
+    AdminStates.SPAM,
+    [[Button("Передумал", {"admin": "main"}, KeyboardButtonColor.NEGATIVE)]],
+)
+
+register_keyboard(
+    AdminStates.ADD_CHEATER,
+    [[Button("Добавить", {"admin": "add"}, KeyboardButtonColor.POSITIVE),
+      Button("Передумал", {"admin": "main"}, KeyboardButtonColor.NEGATIVE)]],
+)
+
+register_keyboard(
+    AdminStates.DEL_CHEATER,
+    [[Button("Передумал", {"admin": "main"}, KeyboardButtonColor.NEGATIVE)]],
+)
+
+register_keyboard(
+    AdminStates.DEL_CHEATER_COMMIT,
+    [[Button("Да", {"del_cheater": "yes"}, KeyboardButtonColor.NEGATIVE),
+      Button("Нет", {"del_cheater": "no"}, KeyboardButtonColor.POSITIVE)]],
+    inline=True,
+)
@@ -1,25 +1,51 @@
 """
 Classes for VKBot
 """
+import asyncio
 import re
-import requests
 import time
-from typing import List, Tuple, Optional, Union
+from typing import Any, Dict, List, Tuple, Optional, Union, Coroutine, NamedTuple
 import logging
 
+import aiohttp
 import vkbottle
-from vkbottle import BaseStateGroup
+from vkbottle import BaseStateGroup, DocMessagesUploader
 from vkbottle.bot import Bot
 from vkbottle.exception_factory import VKAPIError
 
+import async_database
+import backup
+import broadcast
+import cache
 import cheaters
-import database
 import dialogs
+import export
+import outbox
+import ratelimit
+import state_storage
 import vk_keyboards
 from cheaters import Cheater
 
 logger = logging.getLogger(__name__)
 
+# Ограничение частоты запросов к VK API при импорте из файла (запросов в секунду).
+# Импорт делит лимит с ответами пользователям, поэтому берем меньше лимита группы.
+IMPORT_API_RATE = 3
+# Максимальный размер файла для импорта (байт) и размер куска при скачивании.
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+IMPORT_CHUNK_SIZE = 64 * 1024
+# Максимум страниц в одном запросе users.get и groups.getById.
+USERS_GET_MAX_IDS = 1000
+GROUPS_GET_MAX_IDS = 500
+# Сколько секунд живет закешированный список админов группы. Кеш обновляется в фоне с этим периодом.
+ADMINS_CACHE_TTL = 300
+# Кеш профилей пользователей (users.get для приветствия и историй): сколько профилей и сколько секунд хранить.
+PROFILE_CACHE_SIZE = 10000
+PROFILE_CACHE_TTL = 3600
+# Кеш поиска страниц (id <-> screen_name) в БД: сколько секунд верить найденной странице и тому, что страницы нет.
+RESOLVE_CACHE_TTL = 7 * 24 * 60 * 60
+RESOLVE_NEGATIVE_TTL = 24 * 60 * 60
+
 GROUP_TYPES = {
     'group': 'club',
     'page': 'public',
@@ -27,6 +53,81 @@ GROUP_TYPES = {
 }
 
 
+class UserProfile(NamedTuple):
+    """
+    Профиль пользователя из users.get (то, что нужно боту для ответов).
+      first_name: str
+        имя
+      screen_name: str
+        короткое имя страницы
+      deactivated: bool
+        страница удалена или заблокирована
+    """
+    first_name: str
+    screen_name: str
+    deactivated: bool = False
+
+
+class ResolvedPage(NamedTuple):
+    """
+    Страница, найденная через API (строка кеша resolved_pages).
+      page_type: str
+        'user' или тип группы ('group', 'page', 'event')
+      page_id: int
+        id страницы (0 - не найдена)
+      screen_name: str
+        короткое имя
+      title: str
+        имя-фамилия или название группы
+      banned: bool
+        страница удалена или заблокирована
+    """
+    page_type: str = ''
+    page_id: int = 0
+    screen_name: str = ''
+    title: str = ''
+    banned: bool = False
+
+    @classmethod
+    def from_user(cls, user: Any) -> 'ResolvedPage':
+        """
+        Страница из ответа users.get.
+        """
+        return cls('user', user.id, user.screen_name or '', user.first_name + ' ' + user.last_name,
+                   bool(user.deactivated))
+
+    @classmethod
+    def from_group(cls, group: Any) -> 'ResolvedPage':
+        """
+        Страница из ответа groups.getById.
+        """
+        return cls(group.type.value if group.type else 'group', group.id, group.screen_name or '', group.name,
+                   bool(group.ban_info or group.deactivated))
+
+    @property
+    def vk_id(self) -> str:
+        """
+        vk_id страницы, как он хранится в БД: id123, club123, public123, event123.
+        """
+        if self.page_type == 'user':
+            return cheaters.PREFIX['vk_id'] + str(self.page_id)
+        return GROUP_TYPES.get(self.page_type, cheaters.PREFIX['group_id']) + str(self.page_id)
+
+
+def page_keys(page: ResolvedPage) -> List[str]:
+    """
+    Функция возвращает, по каким ключам страница попадает в кеш: id и screen_name.
+
+    :param page: Найденная страница.
+    :return: Ключи кеша.
+    """
+    prefix = cheaters.PREFIX['vk_id' if page.page_type == 'user' else 'group_id']
+    keys = [prefix + str(page.page_id)]
+    if page.screen_name and page.screen_name != keys[0]:
+        keys.append(page.screen_name.lower())
+    return keys
+
+
 class IsUserAdminMiddleware(vkbottle.BaseMiddleware):
     """
     Класс для обработки сообщения до поиска хендлеров.
@@ -45,15 +146,35 @@ class VKBot(Bot):
     Main bot class.
     """
 
-    def __init__(self, vk_token: str, db_filename: str, cheaters_filename: str):
+    def __init__(self, vk_token: str, db_filename: str, cheaters_filename: str,
+                 admins_cache_ttl: float = ADMINS_CACHE_TTL, use_memory_index: bool = False,
+                 db_pragmas: dict = None, backup_settings: backup.BackupSettings = None,
+                 state_ttl: float = state_storage.STATE_TTL,
+                 profile_cache_size: int = PROFILE_CACHE_SIZE, profile_cache_ttl: float = PROFILE_CACHE_TTL):
         super().__init__(vk_token)
         self.labeler.vbml_ignore_case = True
         self.db_filename = db_filename
         self.cheaters_filename = cheaters_filename
-        self.db = database.DBCheaters(self.db_filename)
+        self.db = async_database.AsyncDBCheaters(self.db_filename, db_pragmas)
+        # Состояния диалогов хранятся в БД и переживают рестарт (загружаются в get_async_params).
+        self.state_dispenser = state_storage.SQLiteStateDispenser(self.db, state_ttl)
+        # Искать кидал по индексу в памяти (загружается в main.bot_load) или каждый раз через БД.
+        self.use_memory_index = use_memory_index
+        self.backup_settings = backup_settings or backup.BackupSettings()
         self.group_info = self.api.groups.get_by_id
         self.group_id = ''
+        # Список меняется только на месте: на него ссылаются FromPeerRule и AdminUserRule.
         self.group_admins = []
+        self.admins_cache_ttl = admins_cache_ttl
+        self._group_admins_updated: Optional[float] = None  # time.monotonic() последнего обновления
+        self._group_admins_lock = asyncio.Lock()
+        self.import_rate_limiter = ratelimit.TokenBucket(IMPORT_API_RATE)
+        self.profile_cache = cache.TTLCache(profile_cache_size, profile_cache_ttl)
+        # Все сообщения бота уходят через очередь (разбирается фоновой задачей из get_async_params).
+        self.outbox = outbox.MessageSender(self.api)
+        self.broadcaster = broadcast.Broadcaster(self.api, self.db, self.outbox)
+        self._import_task: Optional[asyncio.Task] = None
+        self._background_tasks = set()
         # TODO Сделать на старте проверку
         #  дублей, приведение типов True/False
 
@@ -67,197 +188,312 @@ class VKBot(Bot):
         """
         group_info = await self.api.groups.get_by_id()
         self.group_id = group_info[0].id
-        self.group_admins = await self.get_group_admins()
+        await self.refresh_group_admins()
+        self.run_in_background(self._refresh_group_admins_periodically())
+        self.run_in_background(self.outbox.run())
+        if self.backup_settings.interval:
+            self.run_in_background(backup.backup_periodically(self.db_filename, self.backup_settings))
+        await self.state_dispenser.load()
+        self.run_in_background(self.state_dispenser.run_periodically())
+        # Рассылка, прерванная рестартом, продолжается с того же места.
+        self.broadcaster.resume(self.group_id)
+
+    def run_in_background(self, coro: Coroutine) -> asyncio.Task:
+        """
+        Метод запускает корутину фоновой задачей, не дожидаясь ее окончания.
+        Ссылка на задачу хранится, пока она не закончится, исключения пишутся в лог.
+
+        :param coro: Корутина.
+        :return: Задача.
+        """
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+        return task
+
+    def _background_task_done(self, task: asyncio.Task):
+        """
+        Колбэк окончания фоновой задачи.
+        """
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error('Фоновая задача упала', exc_info=task.exception())
+
+    def start_update_cheaters_from_file(self, url: str, peer_id: int) -> bool:
+        """
+        Метод запускает импорт из файла в фоне, чтобы бот продолжал отвечать остальным.
+        Одновременно идет только один импорт.
+
+        :param url: ссылка на файл ВК
+        :param peer_id: Кому сообщать о ходе импорта и результате.
+        :return: Запустился импорт или нет (уже идет другой).
+        """
+        if self._import_task and not self._import_task.done():
+            return False
+        self._import_task = self.run_in_background(self._update_cheaters_from_file_task(url, peer_id))
+        return True
+
+    async def _update_cheaters_from_file_task(self, url: str, peer_id: int):
+        """
+        Фоновая задача импорта: по окончании отправляет результат админу.
+        """
+        try:
+            answer_message = await self.update_cheaters_from_file(url, peer_id)
+        except Exception:
+            logger.exception('Импорт из файла не удался')
+            answer_message = dialogs.file_update_error
+        await self.answer_to_peer(answer_message, peer_id)
+
+    async def _report_import_progress(self, peer_id: Optional[int], text: str):
+        """
+        Метод сообщает админу о ходе импорта. Если некому - только пишет в лог.
+        """
+        logger.info(text)
+        if peer_id:
+            await self.outbox.send(peer_id, text)
+
+    @staticmethod
+    async def _download_file(url: str) -> str:
+        """
+        Метод асинхронно скачивает текстовый файл по ссылке кусками, не блокируя цикл событий.
 
-    async def update_cheaters_from_file(self, url: str) -> str:
+        :param url: Ссылка на файл.
+        :return: Текст файла.
+        """
+        content = bytearray()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(IMPORT_CHUNK_SIZE):
+                    content += chunk
+                    if len(content) > IMPORT_MAX_FILE_SIZE:
+                        raise ValueError('Файл больше ' + str(IMPORT_MAX_FILE_SIZE) + ' байт')
+        return content.decode(errors='replace')
+
+    async def update_cheaters_from_file(self, url: str, peer_id: int = None) -> str:
         """
         Функция возьмет текстовый файл по ссылке, распарсит его, перенесет все данные в БД.
 
         :param url: ссылка на файл ВК
+        :param peer_id: Кому сообщать о ходе импорта.
         :return: Ответ
         """
-        logging.info('Сейчас начнем парсить файл: \n' + url + '\n')
+        logger.info('Сейчас начнем парсить файл: \n' + url + '\n')
 
-        content = requests.get(url).content.decode()
-        cheaters_list = await self._get_cheaters_list_from_file(content)  # Список кидал
+        try:
+            content = await self._download_file(url)
+        except (aiohttp.ClientError, ValueError) as error:
+            logger.warning('Не удалось скачать файл: ' + str(error))
+            return dialogs.file_download_error
+        cheaters_list = await self._get_cheaters_list_from_file(content, peer_id)  # Список кидал
 
+        if isinstance(cheaters_list, str):  # Ошибка при разборе
+            return cheaters_list
         if cheaters_list:
-            await self._update_database_from_list(cheaters_list)  # Update DB
-            return dialogs.file_update_success
+            import_result = await self._update_database_from_list(cheaters_list)  # Update DB
+            return dialogs.file_update_success + '\n' + dialogs.file_update_stats.format(**import_result)
         else:  # если результат пустой
             return dialogs.no_data_in_file
 
-    async def _get_cheaters_list_from_file(self, content: str) -> list:
+    async def _get_cheaters_list_from_file(self, content: str, peer_id: int = None) -> list | str:
         """
         Функция получает на вход текст из файла и возвращает списком кидал.
         Если по дороге возникает исключение, не позволяющее нормально продолжить работу - возвращает текст.
+        Файл сначала разбирается целиком (cheaters.parse_cheaters_file), потом все страницы
+        проверяются по API пачками (см. _resolve_cheaters_pages).
 
         :param content: Текст из файла.
+        :param peer_id: Кому сообщать о ходе разбора.
         :return: List кидал.
         """
-        # TODO Неправильно привязались карты, надо рассмотреть
-        fifty = False  # Идентификатор "Полтинников" - кто иногда кидает
-        one_cheater = cheaters.Cheater()
-        cheater = {'vk_id': '', 'fifty': fifty, 'screen_name': '', 'telephone': [], 'card': []}  # TODO Удалить
-        cheaters_list = []  # Список кидал
-        for line in content.split('\n'):
-            logger.debug('Разбираем строку: \n' + line)
-
-            # Ищем в строке vk.com
-            if re.search(r'vk\.com', line):
-                subline = line
-            else:
-                # Если это не vk_id, все символы в строке делаем слитно, надеясь, что получится последовательность цифр.
-                subline = re.sub(r'[- +\r]', '', str(line))
-            match = re.search(cheaters.get_regexp(), subline)
-            if match:
-                print("Найдено совпадение из регулярки: \n", match.groupdict())
-                if match.lastgroup in ['vk_id', 'screen_name']:
-                    if cheater.get('vk_id') or cheater.get('screen_name'):
-                        # Запись добавляется в список, когда встречается следующая запись про кидалу.
-                        # Сделано, чтобы можно было добавлять телефоны и карты конкретного кидалы.
-                        # Последняя запись добавляется после цикла.
-                        print('Добавляю кидалу в список. \n', cheater)
-                        cheaters_list.append(cheater)
-                        cheater = {'vk_id': '', 'fifty': fifty, 'screen_name': '', 'telephone': [], 'card': []}
-                    if match.lastgroup == 'vk_id':
-                        # Если это vk_id - добавляем id в cheater.
-                        cheater['vk_id'] = match[match.lastgroup]
-                        user = None
-                        try:
-                            user = await self.api.users.get(user_ids=match[match.lastgroup],
-                                                            fields=['screen_name']
-                                                            )
-                            print('Запрос юзера вернул:\n', user)
-                        except VKAPIError[6]:
-                            print('Слишком много запросов, повтори через полчаса')
-                            return "VKAPIError_6 Слишком много запросов, повтори через полчаса"
-                        if user:
-                            if user[0].screen_name != cheater['vk_id']:
-                                cheater['screen_name'] = user[0].screen_name
-                    elif match.lastgroup == 'screen_name':
-                        # Если имя - ищем vk_id и добавляем id и screen_name в cheater.
-                        user = None
-                        group = None
-                        try:
-                            user = await self.api.users.get(user_ids=match[match.lastgroup],
-                                                            fields=['screen_name']
-                                                            )
-                            print('Запрос юзера вернул:\n', user)
-                        except VKAPIError[6]:
-                            print('Слишком много запросов, повтори через полчаса')
-                            return "VKAPIError_6 Слишком много запросов, повтори через полчаса"
-                        if user:
-                            cheater['vk_id'] = 'id' + str(user[0].id)
-                            if user[0].screen_name != cheater['vk_id']:
-                                cheater['screen_name'] = user[0].screen_name
-                        else:
-                            try:
-                                group = await self.api.groups.get_by_id(group_id=match[match.lastgroup],
-                                                                        fields=['screen_name']
-                                                                        )
-                                print('Запрос группы:\n', group)
-                                if group[0].type.value == 'group':
-                                    group_type = 'club'
-                                elif group[0].type.value == 'page':
-                                    group_type = 'public'
-                                elif group[0].type.value == 'event':
-                                    group_type = 'event'
-                                else:
-                                    group_type = 'club'
-                                cheater['vk_id'] = group_type + str(group[0].id)
-                                # VK_API возвращает screen_name=vk_id, если имени нет.
-                                if group[0].screen_name != cheater['vk_id']:
-                                    cheater['screen_name'] = group[0].screen_name
-                            except VKAPIError[100]:
-                                print('Группа', match[match.lastgroup], 'не найдена')
-                            except VKAPIError[6]:
-                                print('Слишком много запросов, повтори через полчаса')
-                                return "VKAPIError_6 Слишком много запросов, повтори через полчаса"
-                        # Если не нашелся ни юзер, ни группа.
-                        if not user and not group:
-                            print('В файле попался неправильный идентификатор, не могу понять, кто это: ', line)
-                            print('Возможно, страница удалена \n ')
-                            cheater[match.lastgroup] = match[match.lastgroup]
-                else:
-                    # Если найдена карта или телефон - добавляем их в cheater с предыдущим vk_id.
-                    print(cheater)
-                    cheater.setdefault(match.lastgroup, []).append(match[match.lastgroup])
-            elif subline == 'fifty':
-                fifty = True
-                print('Далее идут полтиники')
-            else:
-                print('Непонятная строка \n')
-            # Пауза, чтоб ВК не банил.
-            time.sleep(0.5)
-        # Последний в списке
-        if cheater.get('vk_id'):
-            print('Добавляю кидалу в список. \n', cheater)
-            cheaters_list.append(cheater)
-
-        print('Вот итоговый список:', cheaters_list, '\n')
+        cheaters_list = cheaters.parse_cheaters_file(content)
+        logger.info('В файле найдено кидал: ' + str(len(cheaters_list)))
+        try:
+            await self._resolve_cheaters_pages(cheaters_list, peer_id)
+        except VKAPIError[6]:
+            logger.warning('Слишком много запросов к API при импорте')
+            return dialogs.too_many_requests
         return cheaters_list
 
-    async def _update_database_from_list(self, cheaters_list: list):
+    async def _resolve_cheaters_pages(self, cheaters_list: List[dict], peer_id: int = None):
         """
-        Принимает на вход список кидал, обновляет базу и возвращает ответ строкой.
-        :return: Ответ для пользователя
+        Метод находит vk_id и screen_name для кидал из файла и дописывает их в те же словари,
+        порядок списка не меняется. Страницы ищутся через resolve_pages: сначала в кеше БД, потом через API.
+        Страница, которую не нашли ни среди юзеров, ни среди групп, остается как в файле.
+
+        :param cheaters_list: Кидалы из cheaters.parse_cheaters_file.
+        :param peer_id: Кому сообщать о ходе проверки.
         """
+        # vk_id из файла уже вида id123/club123, как ключи кеша.
+        pages = await self.resolve_pages([cheater['vk_id'] or cheater['screen_name'].lower()
+                                          for cheater in cheaters_list], peer_id)
         for cheater in cheaters_list:
-            print('Разбираем запись ', cheater, sep='\n')
-            if cheater['vk_id']:
-                db_record = self.db.get_dict_from_table('vk_ids',
-                                                        ['vk_id', 'fifty'],
-                                                        {'vk_id': cheater['vk_id']})
-                if db_record:
-                    print('Такой vk_id есть!')
-                    if db_record[0]['fifty'] != cheater['fifty']:
-                        print('Поменялся fifty на', cheater['fifty'])
-                        self.db.update_fifty(cheater['vk_id'], cheater['fifty'])
-                else:
-                    print('Добавляю кидалу')
-                    self.db.add_vk_id(cheater['vk_id'], cheater['fifty'])
-
-            if cheater['screen_name']:
-                if self.db.check_the_existence('screen_names',
-                                               {'screen_name': cheater['screen_name'],
-                                                'vk_id': cheater['vk_id']
-                                                }
-                                               ):
-                    print('Такой screen_name-id есть!')
-                else:
-                    print('Добавляем новый screen_name-id')
-                    self.db.add_screen_name(cheater['screen_name'], cheater['vk_id'])
-
-            if cheater['telephone']:
-                if cheater['vk_id']:
-                    id_tel = cheater['vk_id']
-                elif cheater['screen_name']:
-                    id_tel = cheater['screen_name']
-                else:
-                    id_tel = None
-                for tel in cheater['telephone']:
-                    if self.db.check_the_existence('telephones', {'telephone': tel, 'vk_id': id_tel}):
-                        print('Связка телефон-id уже есть')
-                    else:
-                        print('Добавляем новый tel-id')
-                        self.db.add_telephones([tel], cheater['vk_id'])
-
-            if cheater['card']:
-                if cheater['vk_id']:
-                    id_card = cheater['vk_id']
-                elif cheater['screen_name']:
-                    id_card = cheater['screen_name']
-                else:
-                    id_card = None
-                for card in cheater['card']:
-                    if self.db.check_the_existence('cards', {'card': card, 'vk_id': id_card}):
-                        print('Связка card-id уже есть')
-                    else:
-                        print('Добавляем новый card-id')
-                        self.db.add_cards([card], cheater['vk_id'])
+            page = pages[cheater['vk_id'] or cheater['screen_name'].lower()]
+            if not page.page_id:
+                if not cheater['vk_id']:
+                    logger.warning('Не удалось найти страницу ' + cheater['screen_name'] + ', возможно, она удалена')
+                continue
+            if not cheater['vk_id']:
+                cheater['vk_id'] = page.vk_id
+            # VK_API возвращает screen_name=vk_id, если имени нет.
+            if page.screen_name and page.screen_name != cheater['vk_id']:
+                cheater['screen_name'] = page.screen_name
+
+    async def resolve_pages(self, names: List[str], peer_id: int = None) -> Dict[str, ResolvedPage]:
+        """
+        Метод находит страницы по id и screen_name.
+        Сначала страницы ищутся в кеше БД (resolved_pages), остальные - через API: id и screen_name через users.get,
+        ненайденные имена и группы - через groups.get_by_id. Каждый запрос берет столько страниц,
+        сколько разрешает API. Ответы API (и то, что страница не нашлась) записываются в кеш.
+
+        :param names: id123, club123 или screen_name в нижнем регистре.
+        :param peer_id: Кому сообщать о ходе проверки.
+        :return: {name: страница}, для ненайденных - ResolvedPage() с page_id = 0.
+        """
+        names = list(dict.fromkeys(names))
+        result = await self._get_cached_pages(names)
+        user_ids = {}  # {что спросить у API: name}, dict - чтобы убрать повторы и сохранить порядок
+        group_ids = {}
+        for name in names:
+            if name in result:
+                continue
+            if name.startswith(cheaters.PREFIX['vk_id']) and name[len(cheaters.PREFIX['vk_id']):].isdigit():
+                user_ids[name[len(cheaters.PREFIX['vk_id']):]] = name
+            elif name.startswith(cheaters.PREFIX['group_id']) and name[len(cheaters.PREFIX['group_id']):].isdigit():
+                group_ids[name[len(cheaters.PREFIX['group_id']):]] = name
+            else:
+                user_ids[name] = name
+        if not user_ids and not group_ids:
+            return result
+
+        found = {}
+        users = await self._get_pages_batched(self._users_get, list(user_ids), USERS_GET_MAX_IDS, peer_id)
+        unmatched = self._add_found_pages(found, user_ids, [ResolvedPage.from_user(user) for user in users])
+        # Имена, которые не нашлись среди юзеров, могут оказаться группами.
+        group_ids.update((query, name) for query, name in user_ids.items()
+                         if not query.isdigit() and name not in found)
+        groups = await self._get_pages_batched(self._groups_get, list(group_ids), GROUPS_GET_MAX_IDS, peer_id)
+        unmatched += self._add_found_pages(found, group_ids, [ResolvedPage.from_group(group) for group in groups])
+        if unmatched:
+            # API вернул страницы под новыми именами: старые имена из пачки не сопоставить с ответом,
+            # поэтому ненайденные имена спрашиваем по одному, прежде чем считать их несуществующими.
+            for query, name in group_ids.items():
+                if query.isdigit() or name in found:
+                    continue
+                for method, from_page in ((self._users_get, ResolvedPage.from_user),
+                                          (self._groups_get, ResolvedPage.from_group)):
+                    pages = await self._get_pages_batch(method, [query])
+                    self._add_found_pages(found, {query: name}, [from_page(page) for page in pages])
+                    if name in found:
+                        break
+        # Что не нашлось - тоже запоминаем, чтобы не спрашивать API снова до RESOLVE_NEGATIVE_TTL.
+        found.update((name, ResolvedPage()) for name in names if name not in result and name not in found)
+        await self._cache_pages(found)
+        result.update((name, found[name]) for name in names if name not in result)
+        return result
 
-        return 'Я закончил обновлять БД!'
+    @staticmethod
+    def _add_found_pages(found: Dict[str, ResolvedPage], queries: Dict[str, str],
+                         pages: List[ResolvedPage]) -> List[ResolvedPage]:
+        """
+        Метод раскладывает ответ API по ключам кеша (id и screen_name страниц).
+
+        :param found: Куда складывать: {name: страница}.
+        :param queries: Что спрашивали у API: {запрос: name}.
+        :param pages: Ответ API.
+        :return: Страницы, которые не подошли ни к одному запросу (например, имя старое, а API вернул новое).
+        """
+        names = set(queries.values())
+        unmatched = []
+        for page in pages:
+            keys = page_keys(page)
+            found.update((key, page) for key in keys if key not in found)
+            if names.isdisjoint(keys):
+                unmatched.append(page)
+        if len(queries) == 1 and len(pages) == 1:
+            # Спрашивали одну страницу - ответ про нее, даже если имя старое и API вернул уже новое.
+            found.setdefault(next(iter(queries.values())), pages[0])
+            return []
+        return unmatched
+
+    async def _get_cached_pages(self, names: List[str]) -> Dict[str, ResolvedPage]:
+        """
+        Метод возвращает страницы из кеша БД, которые еще не устарели.
+        """
+        now = time.time()
+        result = {}
+        for name, (*page, fetched) in (await self.db.get_resolved_pages(names)).items():
+            page = ResolvedPage(*page)
+            if now - fetched <= (RESOLVE_CACHE_TTL if page.page_id else RESOLVE_NEGATIVE_TTL):
+                result[name] = page._replace(banned=bool(page.banned))
+        return result
+
+    async def _cache_pages(self, pages: Dict[str, ResolvedPage]):
+        """
+        Метод записывает ответы API в кеш БД.
+        """
+        now = time.time()
+        await self.db.save_resolved_pages([(name, *page, now) for name, page in pages.items()])
+
+    async def _users_get(self, ids: List[str]) -> list:
+        """
+        Запрос пачки юзеров для импорта.
+        """
+        return await self.api.users.get(user_ids=ids, fields=['screen_name'])
+
+    async def _groups_get(self, ids: List[str]) -> list:
+        """
+        Запрос пачки групп для импорта.
+        """
+        return await self.api.groups.get_by_id(group_ids=ids, fields=['screen_name'])
+
+    async def _get_pages_batched(self, method, ids: List[str], batch_size: int, peer_id: int = None) -> list:
+        """
+        Метод запрашивает страницы пачками по batch_size и сообщает админу о ходе проверки.
+
+        :param method: Корутина, принимающая список id (_users_get или _groups_get).
+        :param ids: Список id или screen_name.
+        :param batch_size: Максимум id в одном запросе.
+        :param peer_id: Кому сообщать о ходе проверки.
+        :return: Найденные страницы.
+        """
+        result = []
+        for start in range(0, len(ids), batch_size):
+            result += await self._get_pages_batch(method, ids[start:start + batch_size])
+            await self._report_import_progress(peer_id, dialogs.file_update_progress.format(
+                min(start + batch_size, len(ids)), len(ids)))
+        return result
+
+    async def _get_pages_batch(self, method, ids: List[str]) -> list:
+        """
+        Метод запрашивает одну пачку страниц через import_rate_limiter.
+        Если API отвергает пачку из-за неправильного id (ошибки 100, 113), пачка делится пополам,
+        пока плохой id не останется один - его пропускаем.
+
+        :param method: Корутина, принимающая список id.
+        :param ids: Список id или screen_name.
+        :return: Найденные страницы.
+        """
+        if not ids:
+            return []
+        await self.import_rate_limiter.acquire()
+        try:
+            return list(await method(ids) or [])
+        except (VKAPIError[100], VKAPIError[113]):
+            if len(ids) == 1:
+                logger.info('Страница ' + ids[0] + ' не найдена')
+                return []
+            middle = len(ids) // 2
+            return await self._get_pages_batch(method, ids[:middle]) + await self._get_pages_batch(method, ids[middle:])
+
+    async def _update_database_from_list(self, cheaters_list: list) -> dict:
+        """
+        Принимает на вход список кидал и обновляет базу одной транзакцией.
+        :return: Сколько строк добавлено, обновлено и пропущено (см. DBCheaters.import_cheaters).
+        """
+        result = await self.db.import_cheaters(cheaters_list)
+        logger.info('Импорт в БД: ' + str(result))
+        return result
 
     async def is_admin(self, peer_id: int) -> bool:
         """
@@ -265,13 +501,7 @@ class VKBot(Bot):
         :param peer_id:
         :return: True or False
         """
-        group_admins = await self.get_group_admins()
-        for count, value in enumerate(group_admins):
-            group_admins[count] = int(value)
-        if peer_id in group_admins:
-            return True
-        else:
-            return False
+        return peer_id in await self.get_group_admins()
 
     async def send_message_to_admins(self, message: str = 'Что-то', message_forward_id: int = None):
         """
@@ -283,12 +513,7 @@ class VKBot(Bot):
         """
         vk_admin_ids = await self.get_group_admins()
         message_text = message
-        await self.api.messages.send(
-            message=message_text,
-            user_ids=vk_admin_ids,
-            forward_messages=message_forward_id,
-            random_id=0,
-        )
+        await self.outbox.send(vk_admin_ids, message_text, forward_messages=message_forward_id)
 
     async def update_db_screen_name(self, vk_id: str, screen_name: str = None):
         """
@@ -308,61 +533,111 @@ class VKBot(Bot):
             if user_info:
                 screen_name = user_info[0].screen_name
 
-        self.db.update_db_screen_name(vk_id=vk_id, screen_name=screen_name)
+        await self.db.update_db_screen_name(vk_id=vk_id, screen_name=screen_name)
 
     async def get_from_api_id_screen_name_banned(self, id_name: str = None) -> Optional[Tuple[str, str, bool, str]]:
         """
         Метод возвращает id, screen_name, banned и name в виде кортежа.
         Для пользователя name: Имя+Фамилия.
         Для группы: имя.
+        Страница ищется через resolve_pages, то есть сначала в кеше БД.
 
         :param id_name: vk_id или screen_name
         :return: vk_id, screen_name, banned/deleted, имя-фамилия.
         """
-        result_vk_id = ''
-        result_screen_name = ''
-        result_banned = False
-        result_name = ''
-        users_info = await self.api.users.get(id_name, fields=['screen_name'])
-        if users_info:
-            if users_info[0].deactivated:
-                # Если пользователь забанен.
-                result_banned = True
-            result_vk_id = 'id' + str(users_info[0].id)
-            result_screen_name = users_info[0].screen_name
-            result_name = users_info[0].first_name + ' ' + users_info[0].last_name
-        else:
-            try:
-                group = await self.api.groups.get_by_id(group_id=id_name,
-                                                        fields=['screen_name']
-                                                        )
-                result_vk_id = 'club' + str(group[0].id)
-                result_screen_name = group[0].screen_name
-                result_banned = group[0].ban_info
-                result_name = group[0].name
-            except VKAPIError[100]:
-                pass
-        return result_vk_id, result_screen_name, result_banned, result_name
+        name = id_name.lower()
+        page = (await self.resolve_pages([name]))[name]
+        if not page.page_id:
+            return '', '', False, ''
+        prefix = cheaters.PREFIX['vk_id' if page.page_type == 'user' else 'group_id']
+        return prefix + str(page.page_id), page.screen_name, page.banned, page.title
+
+    async def get_user_profile(self, user_id: int) -> Optional[UserProfile]:
+        """
+        Метод возвращает профиль пользователя из кеша, а если его там нет - запрашивает users.get.
+        Одновременные запросы одного пользователя делают один запрос к API.
+
+        :param user_id: id пользователя.
+        :return: Профиль или None, если пользователь не найден.
+        """
+        return await self.profile_cache.get_or_load(user_id, lambda: self._load_user_profile(user_id))
+
+    async def _load_user_profile(self, user_id: int) -> Optional[UserProfile]:
+        """
+        Метод запрашивает профиль пользователя у API.
+        """
+        users_info = await self.api.users.get([user_id], fields=['screen_name'])
+        if not users_info:
+            return None
+        return UserProfile(users_info[0].first_name, users_info[0].screen_name, bool(users_info[0].deactivated))
 
     async def get_group_admins(self, group_id: str = None) -> List[int]:
         """
         Метод возвращает список администраторов группы.
-        Если имя группы не передано - берется своя группа (от имени котрой запущен бот).
+        Если имя группы не передано - берется своя группа (от имени котрой запущен бот),
+        ее админы берутся из кеша (см. refresh_group_admins).
 
         :param group_id: id или screen_name группы.
         :return: Список администраторов.
         """
         if group_id:
-            members = await self.api.groups.get_members(group_id=group_id, filter='managers')
-        else:
-            group_id = str((await self.group_info())[0].id)
-            members = await self.api.groups.get_members(group_id=group_id, filter='managers')
+            return await self._get_group_managers(group_id)
+        if self._group_admins_stale():
+            async with self._group_admins_lock:
+                # Пока ждали блокировку, список мог обновить другой запрос.
+                if self._group_admins_stale():
+                    await self.refresh_group_admins()
+        return list(self.group_admins)
+
+    async def _get_group_managers(self, group_id: str | int) -> List[int]:
+        """
+        Метод запрашивает у API руководителей группы.
+
+        :param group_id: id или screen_name группы.
+        :return: Список id.
+        """
+        members = await self.api.groups.get_members(group_id=group_id, filter='managers')
         result = []
         for member in members.items:
-            result.append(member.id)
+            result.append(int(member.id))
         return result
 
-    async def answer_to_peer(self, text: str, peer_id: int, new_state: BaseStateGroup = None):
+    def _group_admins_stale(self) -> bool:
+        """
+        Метод проверяет, что кеш админов пуст или устарел.
+        """
+        return self._group_admins_updated is None or \
+            time.monotonic() - self._group_admins_updated > self.admins_cache_ttl
+
+    async def refresh_group_admins(self):
+        """
+        Метод запрашивает админов своей группы и обновляет кеш self.group_admins на месте.
+        """
+        if not self.group_id:
+            self.group_id = (await self.group_info())[0].id
+        self.group_admins[:] = await self._get_group_managers(self.group_id)
+        self._group_admins_updated = time.monotonic()
+        logger.debug('Обновлен список админов: ' + str(self.group_admins))
+
+    def invalidate_group_admins(self):
+        """
+        Метод помечает кеш админов устаревшим: следующий запрос админов сходит в API.
+        """
+        self._group_admins_updated = None
+
+    async def _refresh_group_admins_periodically(self):
+        """
+        Фоновая задача: обновляет кеш админов раз в admins_cache_ttl, чтобы ответы не ждали API.
+        """
+        while True:
+            await asyncio.sleep(self.admins_cache_ttl)
+            try:
+                async with self._group_admins_lock:
+                    await self.refresh_group_admins()
+            except Exception:
+                logger.exception('Не удалось обновить список админов')
+
+    async def answer_to_peer(self, text: str, peer_id: int, new_state: BaseStateGroup = None, **payload):
         """
         Метод отвечает за ответ пользователю. На вход принимает id пользователя, новый статус и текст сообщения.
         Изменяет StateDispenser, генерирует клавиатуру и отправляет пользователю ответ.
@@ -370,59 +645,70 @@ class VKBot(Bot):
         :param text: Текст для ответа.
         :param new_state: Новый статус.
         :param peer_id: vk_id
+        :param payload: Что сохранить вместе с новым статусом (старый payload сбрасывается).
         """
         if new_state:
-            await self.state_dispenser.set(peer_id, new_state)
+            await self.state_dispenser.set(peer_id, new_state, **payload)
         else:
             if await self.state_dispenser.get(peer_id):
                 await self.state_dispenser.delete(peer_id)
         keyboard = vk_keyboards.get_keyboard(new_state, await self.is_admin(peer_id))
-        await self.api.messages.send(
-            peer_id=peer_id,
-            message=text,
-            keyboard=keyboard,
-            random_id=0,
-        )
+        await self.outbox.send(peer_id, text, keyboard=keyboard)
 
-    def backup_db(self, backup_name: str = None):
+    async def backup_db(self, backup_name: str = None) -> str:
         """
-        Метод делает бекап БД
+        Метод делает бекап БД в отдельном потоке (см. backup.backup_database), бот в это время работает дальше.
+        Копия с переданным именем не сжимается, копия с датой в имени - по настройкам backup_settings.
         :param backup_name: Имя резервной копии
+        :return: Имя файла копии.
         """
-        self.db.backup_db_file(backup_name)
+        compression = ''
+        if not backup_name:
+            compression = self.backup_settings.compression
+            backup_name = backup.backup_name(self.db_filename, self.backup_settings.directory, compression)
+        return await backup.backup_database_async(self.db_filename, backup_name, compression)
 
-    def export_db(self) -> str:
+    async def export_db(self, export_format: str = 'txt') -> str:
         """
-        Метод парсит БД и возвращает строки.
+        Метод выгружает всю БД во временный файл (см. export.export_to_file). По умолчанию - текст:
         vk_id/Screen_name
         telephones
         cards
         proof_links
 
-        :return : Текст с кидалами
+        :param export_format: Формат из export.EXPORT_FORMATS.
+        :return : Путь к файлу. Удалить его должен вызывающий.
         """
-        result = ''
-        fifty = False
-
-        cheaters_list = self.db.get_cheaters_full_list()
-
-        for cheater in cheaters_list:
-            if cheater.fifty and (not fifty):
-                result += '\nDalee idut poltinniky: realnye prodavcy - rabotayut, kak povezet.\nfifty\n'
-                fifty = True
+        return await self.db.run(lambda db: export.export_to_file(db.iter_cheaters(), export_format))
 
-            result += cheater.str_lines()
-            result += '\n'
+    async def upload_doc_file(self, path: str, title: str, peer_id: int) -> str:
+        """
+        Метод загружает файл с диска документом для сообщения.
+        В отличие от DocMessagesUploader.upload файл не читается в память целиком, а уходит в запрос потоком.
 
-        return result
+        :param path: Путь к файлу.
+        :param title: Имя документа.
+        :param peer_id: Кому будет отправлен документ.
+        :return: Строка вложения для messages.send.
+        """
+        uploader = DocMessagesUploader(self.api)
+        server = await uploader.get_server(peer_id=peer_id)
+        with open(path, 'rb') as file:
+            uploaded = await uploader.upload_files(server['upload_url'], {'file': file})
+        doc = (await self.api.request('docs.save', {'title': title, **uploaded}))['response']
+        doc_type = doc['type']
+        return uploader.generate_attachment_string(doc_type,
+                                                   doc[doc_type]['owner_id'],
+                                                   doc[doc_type]['id'],
+                                                   doc[doc_type].get('access_key'))
 
-    def get_cheater_from_db(self,
-                            id_name: Optional[str] = None,
-                            telephone: Optional[str] = None,
-                            card: Optional[str] = None,
-                            proof_link: Optional[str] = None,
-                            return_fields: Optional[Union[str, List[str]]] = None,
-                            ) -> Optional[Union[Cheater, List[Cheater]]]:
+    async def get_cheater_from_db(self,
+                                  id_name: Optional[str] = None,
+                                  telephone: Optional[str] = None,
+                                  card: Optional[str] = None,
+                                  proof_link: Optional[str] = None,
+                                  return_fields: Optional[Union[str, List[str]]] = None,
+                                  ) -> Optional[Union[Cheater, List[Cheater]]]:
         """
         Метод возвращает всю инфу про кидалу, которая есть в БД. На вход подаются параметры, по которым надо его найти.
         Сейчас используется только первый по порядку.\n
@@ -442,83 +728,36 @@ class VKBot(Bot):
             if id_name.startswith(('id', 'club', 'public', 'event')):
                 vk_id = id_name
             else:
-                sql_result = self.db.get_dict_from_table(table='screen_names',
-                                                         columns=['vk_id'],
-                                                         condition_dict={'screen_name': id_name,
-                                                                         'changed': 'False'})
+                sql_result = await self.db.get_dict_from_table(table='screen_names',
+                                                               columns=['vk_id'],
+                                                               condition_dict={'screen_name': id_name,
+                                                                               'changed': 'False'})
                 if sql_result:
                     vk_id = sql_result[0]['vk_id']
         else:
             if telephone:
-                sql_result = self.db.get_dict_from_table(table='telephones',
-                                                         columns=['vk_id'],
-                                                         condition_dict={'telephone': telephone})
+                sql_result = await self.db.get_dict_from_table(table='telephones',
+                                                               columns=['vk_id'],
+                                                               condition_dict={'telephone': telephone})
             elif card:
-                sql_result = self.db.get_dict_from_table(table='cards',
-                                                         columns=['vk_id'],
-                                                         condition_dict={'card': card})
+                sql_result = await self.db.get_dict_from_table(table='cards',
+                                                               columns=['vk_id'],
+                                                               condition_dict={'card': card})
             elif proof_link:
-                sql_result = self.db.get_dict_from_table(table='proof_links',
-                                                         columns=['vk_id'],
-                                                         condition_dict={'proof_link': proof_link})
+                sql_result = await self.db.get_dict_from_table(table='proof_links',
+                                                               columns=['vk_id'],
+                                                               condition_dict={'proof_link': proof_link})
             if sql_result:
                 vk_id = sql_result[0].get('vk_id')
 
         # Если нашелся или передан vk_id.
-        if vk_id:
-            cheater_info = Cheater()
-            # Обращаемся к БД за остальными параметрами.
-            sql_result = self.db.get_dict_from_table(table='vk_ids',
-                                                     columns=['vk_id', 'fifty'],
-                                                     condition_dict={'vk_id': vk_id})
-            if sql_result:
-                cheater_info.vk_id = sql_result[0]['vk_id']
-                cheater_info.fifty = bool(sql_result[0]['fifty'])
-
-            sql_result = self.db.get_dict_from_table(table='screen_names',
-                                                     columns=['screen_name'],
-                                                     condition_dict={'vk_id': vk_id, 'changed': 'False'})
-            if sql_result:
-                cheater_info.screen_name = sql_result[0]['screen_name']
-
-            sql_result = self.db.get_dict_from_table(table='telephones',
-                                                     columns=['telephone'],
-                                                     condition_dict={'vk_id': vk_id})
-            if sql_result:
-                items_list = []
-                for item in sql_result:
-                    items_list += item.values()
-                cheater_info.telephone = items_list
-
-            sql_result = self.db.get_dict_from_table(table='cards',
-                                                     columns=['card'],
-                                                     condition_dict={'vk_id': vk_id})
-            if sql_result:
-                items_list = []
-                for item in sql_result:
-                    items_list += item.values()
-                cheater_info.card = items_list
-
-            sql_result = self.db.get_dict_from_table(table='proof_links',
-                                                     columns=['proof_link'],
-                                                     condition_dict={'vk_id': vk_id})
-            if sql_result:
-                items_list = []
-                for item in sql_result:
-                    items_list += item.values()
-                cheater_info.proof_link = items_list
-            if not cheater_info:
-                result = None
-            else:
-                result = cheater_info
-        else:
-            result = None
+        result = await self.get_cheater_by_id(vk_id)
         return result
 
-    def get_cheater_from_db2(self,
-                             param: str,
-                             value: str | bool,
-                             ) -> List[Cheater]:
+    async def get_cheater_from_db2(self,
+                                   param: str,
+                                   value: str | bool,
+                                   ) -> List[Cheater]:
         """
         Метод возвращает всю инфу про кидалу, которая есть в БД. На вход подаются параметры, по которым надо его найти.
         В результате вернется список Cheater()'ов, либо пустой список.
@@ -527,6 +766,13 @@ class VKBot(Bot):
         :param value: значение,
         :return: список объектов Cheater или None, если ничего не нашел.
         """
+        if param != 'fifty' and not value:
+            # По пустому значению ничего не ищем: иначе найдутся все кидалы, у которых его нет.
+            return []
+        if self.db.index is not None and param != 'fifty':
+            if param in ('vk_id', 'group_id'):
+                return self.db.index.find('vk_id', cheaters.PREFIX[param] + value)
+            return self.db.index.find(param, value)
         # Первое: надо определиться, по каким id нам искать.
         vk_id_list = []
         sql_result = None
@@ -538,26 +784,22 @@ class VKBot(Bot):
                     prefix = 'club'
                 vk_id_list = [prefix + value]
             case 'screen_name':
-                sql_result = self.db.get_cheater_id_list_by_param(screen_name=value)
+                sql_result = await self.db.get_cheater_id_list_by_param(screen_name=value)
             case 'fifty':
-                sql_result = self.db.get_cheater_id_list_by_param(fifty=value)
+                sql_result = await self.db.get_cheater_id_list_by_param(fifty=value)
             case 'card':
-                sql_result = self.db.get_cheater_id_list_by_param(card=value)
+                sql_result = await self.db.get_cheater_id_list_by_param(card=value)
             case 'telephone':
-                sql_result = self.db.get_cheater_id_list_by_param(telephone=value)
+                sql_result = await self.db.get_cheater_id_list_by_param(telephone=value)
             case 'proof_link':
-                sql_result = self.db.get_cheater_id_list_by_param(proof_link=value)
+                sql_result = await self.db.get_cheater_id_list_by_param(proof_link=value)
         if sql_result:
             for item in sql_result:
                 vk_id_list.append(item)
-        result = []
-        for vk_id in vk_id_list:
-            db_found = self.get_cheater_by_id(vk_id)
-            if db_found:
-                result.append(db_found)
+        result = await self.db.get_cheaters_by_ids(vk_id_list)
         return result
 
-    def get_cheater_by_id(self, vk_id: str) -> Optional[Cheater]:
+    async def get_cheater_by_id(self, vk_id: str) -> Optional[Cheater]:
         """
         Метод вернет объект Cheater с данными из БД по vk_id.
         :param vk_id: user_id или group_id.
@@ -565,56 +807,12 @@ class VKBot(Bot):
         """
         if not vk_id:
             return None
-        cheater_info = Cheater()
-        # TODO Переделать без упоминания про таблицы
-        # VK_IDS
-        sql_result = self.db.get_dict_from_table(table='vk_ids',
-                                                 columns=['vk_id', 'fifty'],
-                                                 condition_dict={'vk_id': vk_id})
-        if sql_result:
-            cheater_info.vk_id = sql_result[0]['vk_id']
-            cheater_info.fifty = bool(sql_result[0]['fifty'])
-        # SCREEN_NAMES
-        sql_result = self.db.get_dict_from_table(table='screen_names',
-                                                 columns=['screen_name'],
-                                                 condition_dict={'vk_id': vk_id, 'changed': False})
-        if sql_result:
-            cheater_info.screen_name = sql_result[0]['screen_name']
-        # TELEPHONES
-        sql_result = self.db.get_dict_from_table(table='telephones',
-                                                 columns=['telephone'],
-                                                 condition_dict={'vk_id': vk_id})
-        if sql_result:
-            items_list = []
-            for item in sql_result:
-                items_list += item.values()
-            cheater_info.telephone = items_list
-        # CARDS
-        sql_result = self.db.get_dict_from_table(table='cards',
-                                                 columns=['card'],
-                                                 condition_dict={'vk_id': vk_id})
-        if sql_result:
-            items_list = []
-            for item in sql_result:
-                items_list += item.values()
-            cheater_info.card = items_list
-        # PROOF_LINKS
-        sql_result = self.db.get_dict_from_table(table='proof_links',
-                                                 columns=['proof_link'],
-                                                 condition_dict={'vk_id': vk_id})
-        if sql_result:
-            items_list = []
-            for item in sql_result:
-                items_list += item.values()
-            cheater_info.proof_link = items_list
-
-        if not cheater_info:
-            result = None
-        else:
-            result = cheater_info
-        return result
+        found = await self.db.get_cheaters_by_ids([vk_id])
+        if not found:
+            return None
+        return found[0]
 
-    def add_cheater(self, cheater: Cheater, cheater_db: Cheater = None) -> Cheater:
+    async def add_cheater(self, cheater: Cheater, cheater_db: Cheater = None) -> Cheater:
         """
         Метод добавляет (обновляет) данные в БД.
         Добавляется разница между cheater и cheater_db.
@@ -639,19 +837,19 @@ class VKBot(Bot):
             cheater_update.proof_link = list(set(cheater.proof_link) - set(cheater_db.proof_link))
 
         if cheater_update.vk_id:
-            self.db.add_vk_id(cheater_update.vk_id, cheater.fifty)
+            await self.db.add_vk_id(cheater_update.vk_id, cheater.fifty)
         if cheater_update.screen_name:
-            self.db.add_screen_name(cheater_update.screen_name, cheater.vk_id)
+            await self.db.add_screen_name(cheater_update.screen_name, cheater.vk_id)
         if cheater_update.telephone:
-            self.db.add_telephones(cheater_update.telephone, cheater.vk_id)
+            await self.db.add_telephones(cheater_update.telephone, cheater.vk_id)
         if cheater_update.card:
-            self.db.add_cards(cheater_update.card, cheater.vk_id)
+            await self.db.add_cards(cheater_update.card, cheater.vk_id)
         if cheater_update.proof_link:
-            self.db.add_proof_links(cheater_update.proof_link, cheater.vk_id)
+            await self.db.add_proof_links(cheater_update.proof_link, cheater.vk_id)
 
         return cheater_update
 
-    def delete_cheater(self, vk_id: str):
+    async def delete_cheater(self, vk_id: str):
         """
         Метод удаляет из БД запись о кидале.
         Возвращает True, если удалился и False, если не нашел запись.
@@ -659,9 +857,9 @@ class VKBot(Bot):
         :param vk_id: идентификатор страницы.
         :return: успех.
         """
-        self.db.delete_cheater(vk_id=vk_id)
+        await self.db.delete_cheater(vk_id=vk_id)
 
-    def delete_cheater_item(self, param: str, value: str, vk_id: str):
+    async def delete_cheater_item(self, param: str, value: str, vk_id: str):
         """
         Метод удаляет из БД все упоминания параметра param для определенного vk_id.
 
@@ -669,13 +867,13 @@ class VKBot(Bot):
         :param value: значение параметра,
         :param vk_id: у кого удалить.
         """
-        self.db.delete_cheater_item(param, value, vk_id)
+        await self.db.delete_cheater_item(param, value, vk_id)
 
-    def public_to_club(self):
+    async def public_to_club(self):
         """
         Метод переделывает все записи public% в club%.
         """
-        self.db.publics_to_clubs()
+        await self.db.publics_to_clubs()
 
 
 if __name__ == '__main__':